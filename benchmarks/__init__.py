@@ -0,0 +1,55 @@
+import os
+import sys
+import json
+import time
+import pathlib
+import platform
+import datetime
+import subprocess
+
+BENCHMARK_DIR = pathlib.Path(os.path.dirname(os.path.realpath(__file__)))
+CONTROL_DIR = BENCHMARK_DIR.parent / 'control'
+
+if str(CONTROL_DIR) not in sys.path:
+    sys.path.insert(0, str(CONTROL_DIR))
+
+
+def time_call(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def summarize_durations(durations):
+    durations = sorted(durations)
+    return {
+        'min': durations[0],
+        'median': durations[len(durations) // 2],
+        'max': durations[-1],
+        'samples': durations
+    }
+
+
+def read_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       cwd=BENCHMARK_DIR,
+                                       stderr=subprocess.DEVNULL,
+                                       text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, benchmark, parameters, results):
+    document = {
+        'benchmark': benchmark,
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'revision': read_revision(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'system': platform.platform(),
+        'parameters': parameters,
+        'results': results
+    }
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2)
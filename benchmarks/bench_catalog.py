@@ -0,0 +1,91 @@
+import os
+import json
+import random
+import argparse
+import tempfile
+import pathlib
+import collections
+from benchmarks import time_call
+from benchmarks.library import random_capture_time
+from catalog import MetadataCatalog
+from record_log import RecordLogCatalog
+
+FakeStat = collections.namedtuple('FakeStat',
+                                  ['st_size', 'st_mtime_ns', 'st_ino'])
+
+
+def generate_stats(n_files, n_folders, first_index=0):
+    return {
+        f'/mnt/hdd1/user/files/Photos/Album {i % n_folders:04d}/IMG_{i:07d}.jpg':
+        FakeStat(1000 + i, 10**18 + i, i)
+        for i in range(first_index, first_index + n_files)
+    }
+
+
+def generate_entries(stats, seed=0):
+    rng = random.Random(seed)
+    return [(filename, stat_result,
+             random_capture_time(rng).strftime('%Y-%m-%d %H:%M:%S'))
+            for filename, stat_result in stats.items()]
+
+
+def write_json(path, entries):
+    with open(path, 'w') as f:
+        json.dump({filename: time for filename, _, time in entries}, f)
+
+
+def read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare the formats for cached file times')
+    parser.add_argument('--files', type=int, default=100000)
+    parser.add_argument('--folders', type=int, default=1000)
+    parser.add_argument('--new-files', type=int, default=100)
+    args = parser.parse_args()
+
+    stats = generate_stats(args.files, args.folders)
+    entries = generate_entries(stats)
+    new_stats = generate_stats(args.new_files,
+                               args.folders,
+                               first_index=args.files)
+    new_entries = generate_entries(new_stats, seed=1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        directory = pathlib.Path(directory)
+
+        json_path = directory / 'filedata.json'
+        write_json(json_path, entries)
+        duration, _ = time_call(read_json, json_path)
+        print(f'{"json load":>20}: {1e3*duration:9.1f} ms')
+        duration, _ = time_call(write_json, json_path, entries + new_entries)
+        print(f'{"json add":>20}: {1e3*duration:9.1f} ms')
+        print(f'{"json size":>20}: {os.path.getsize(json_path)/2**20:9.1f} MiB')
+
+        for name, create_catalog, path in (
+            ('sqlite', MetadataCatalog, directory / 'filedata.sqlite'),
+            ('log', RecordLogCatalog, directory / 'filedata.log')):
+            catalog = create_catalog(path)
+            catalog.update(entries)
+            catalog.close()
+
+            duration, catalog = time_call(create_catalog, path)
+            print(f'{name + " open":>20}: {1e3*duration:9.1f} ms')
+            duration, (times, _) = time_call(catalog.lookup, stats)
+            print(f'{name + " lookup":>20}: {1e3*duration:9.1f} ms')
+            duration, _ = time_call(catalog.update, new_entries)
+            print(f'{name + " add":>20}: {1e3*duration:9.1f} ms')
+            duration, _ = time_call(catalog.lookup, new_stats)
+            print(f'{name + " lookup new":>20}: {1e3*duration:9.1f} ms')
+            catalog.close()
+            print(f'{name + " size":>20}: {os.path.getsize(path)/2**20:9.1f} MiB')
+
+            if len(times) != len(stats):
+                print(f'{name} catalog lost entries')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+import sys
+import time
+import argparse
+import tempfile
+import pathlib
+import threading
+import multiprocessing
+from benchmarks import time_call
+from benchmarks.library import generate_nextcloud_library
+import digital_photo_frame as dpf
+from catalog import MetadataCatalog
+from catalog_service import CatalogService
+
+CONFIG_NAME = 'frame_config.txt'
+
+
+def create_frame_directory(directory, i, folders, times):
+    frame_directory = directory / f'frame_{i}'
+    frame_directory.mkdir()
+    (frame_directory / CONFIG_NAME).write_text(
+        f'folders: {", ".join(folders)}\ntime: {times}\ndelay: 10\n')
+    return frame_directory
+
+
+def run_frame(frame_directory, library_path, socket_path, n_queries):
+    # Runs in its own process, like a frame on a separate device would
+    dpf.SCRIPT_DIR = frame_directory
+    settings = dpf.SettingsFile(
+        frame_directory / CONFIG_NAME,
+        dpf.NextcloudFileLocator(base_path=library_path))
+    start_time = time.perf_counter()
+    file_manager = dpf.FileManager(settings,
+                                   catalog_service_path=socket_path)
+    start_duration = time.perf_counter() - start_time
+    query_durations = []
+    for _ in range(n_queries):
+        duration, _ = time_call(file_manager._update_filtered_filenames)
+        query_durations.append(duration)
+    return start_duration, query_durations, (frame_directory /
+                                             '.filelist.txt').read_text()
+
+
+def run_standalone(frame_directory, library_path):
+    dpf.SCRIPT_DIR = frame_directory
+    settings = dpf.SettingsFile(
+        frame_directory / CONFIG_NAME,
+        dpf.NextcloudFileLocator(base_path=library_path))
+    duration, _ = time_call(dpf.FileManager, settings)
+    return duration, (frame_directory / '.filelist.txt').read_text()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Serve several frame processes from one catalog service')
+    parser.add_argument('--files', type=int, default=20000)
+    parser.add_argument('--albums', type=int, default=200)
+    parser.add_argument('--clients', type=int, default=3)
+    parser.add_argument('--queries', type=int, default=10)
+    parser.add_argument('--times',
+                        nargs='+',
+                        default=['2005 - 2010', '12.2015', '2018 - 2020'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        directory = pathlib.Path(directory)
+        library_path = directory / 'library'
+        folders = generate_nextcloud_library(library_path,
+                                             args.files,
+                                             n_albums=args.albums)
+        frame_directories = [
+            create_frame_directory(directory, i, folders,
+                                   args.times[i % len(args.times)])
+            for i in range(args.clients)
+        ]
+
+        standalone_durations = []
+        standalone_lists = []
+        for frame_directory in frame_directories:
+            duration, file_list = run_standalone(frame_directory,
+                                                 library_path)
+            standalone_durations.append(duration)
+            standalone_lists.append(file_list)
+            for path in frame_directory.glob('.file*'):
+                path.unlink()
+        print(f'{"standalone starts":>20}: {sum(standalone_durations):8.3f} s '
+              f'for {args.clients} frames')
+
+        socket_path = directory / 'catalog.sock'
+        service = CatalogService(MetadataCatalog(directory /
+                                                 'service.sqlite'))
+        server = service.serve(socket_path)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        with multiprocessing.Pool(args.clients) as pool:
+            for attempt in ('cold', 'warm'):
+                start_time = time.perf_counter()
+                results = pool.starmap(
+                    run_frame,
+                    [(frame_directory, library_path, socket_path,
+                      args.queries) for frame_directory in frame_directories])
+                duration = time.perf_counter() - start_time
+                print(f'{"service " + attempt:>20}: {duration:8.3f} s '
+                      f'for {args.clients} concurrent frames')
+
+        query_durations = sorted(duration for _, durations, _ in results
+                                 for duration in durations)
+        print(f'{"query":>20}: {1e3*query_durations[len(query_durations)//2]:8.2f} ms '
+              f'median, {1e3*query_durations[-1]:.2f} ms max')
+        server.shutdown()
+        server.server_close()
+
+        if [file_list for _, _, file_list in results] != standalone_lists:
+            print('Service results differ from standalone results')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+import sys
+import argparse
+import tempfile
+import pathlib
+from benchmarks import time_call, summarize_durations, write_results
+from benchmarks.bench_file_manager import write_config, create_file_manager
+from benchmarks.library import generate_nextcloud_library
+import digital_photo_frame as dpf
+from date_histogram import count_matches
+from time_filter import TimeIndex
+
+
+def count_by_scanning(file_manager, times):
+    # What a preview cost before, short of restarting the frame
+    file_manager._read_filenames()
+    file_times = file_manager._obtain_file_times(file_manager._filenames)
+    return len(TimeIndex(file_times).select(times.compile()))
+
+
+def measure(directory, library_path, folders, times_string, repeat):
+    durations = {
+        name: []
+        for name in ('preview_scan', 'preview_histogram', 'start_full_scan',
+                     'start_skipping')
+    }
+    write_config(directory, folders, times_string)
+    file_manager = create_file_manager(directory, library_path, False,
+                                       'sqlite')
+    settings_folders = list(map(str, file_manager.settings.folders))
+    times = file_manager.settings.times
+    catalog = file_manager._catalog
+    n_included = len(file_manager._filtered_filenames)
+
+    for _ in range(repeat):
+        duration, n_scanned = time_call(count_by_scanning, file_manager,
+                                        times)
+        durations['preview_scan'].append(duration)
+        duration, matches = time_call(count_matches, catalog,
+                                      settings_folders, times)
+        durations['preview_histogram'].append(duration)
+        n_counted = sum(included for included, _ in matches.values())
+        if not n_scanned == n_counted == n_included:
+            print(
+                f'Counts differ: {n_scanned} scanned, {n_counted} counted, {n_included} included'
+            )
+
+        with catalog._connection:
+            catalog._connection.execute('DELETE FROM scanned_directories')
+        duration, _ = time_call(create_file_manager, directory, library_path,
+                                False, 'sqlite')
+        durations['start_full_scan'].append(duration)
+        duration, skipping_file_manager = time_call(create_file_manager,
+                                                    directory, library_path,
+                                                    False, 'sqlite')
+        durations['start_skipping'].append(duration)
+        if len(skipping_file_manager._filtered_filenames) != n_included:
+            print('Skipping folders changed the file list')
+            sys.exit(1)
+
+    return {
+        name: summarize_durations(samples)
+        for name, samples in durations.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=
+        'Compare time filter previews from the date histogram with scanning')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000])
+    parser.add_argument('--albums', type=int, default=400)
+    parser.add_argument('--times', default='2005 - 2006, 12.2015')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output',
+                        help='File to write the results to as JSON')
+    args = parser.parse_args()
+
+    results = {}
+    for n_files in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            directory = pathlib.Path(directory)
+            library_path = directory / 'library'
+            script_dir = directory / 'control'
+            script_dir.mkdir()
+            dpf.SCRIPT_DIR = script_dir
+
+            folders = generate_nextcloud_library(library_path,
+                                                 n_files,
+                                                 n_albums=args.albums)
+            size_results = measure(script_dir, library_path, folders,
+                                   args.times, args.repeat)
+
+        print(f'{n_files} files in {len(folders)} folders:')
+        for name, summary in size_results.items():
+            print(f'{name:>20}: {1e3*summary["min"]:10.2f} ms '
+                  f'(median {1e3*summary["median"]:.2f} ms)')
+        results[str(n_files)] = size_results
+
+    if args.output is not None:
+        write_results(args.output, 'date_histogram', vars(args), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+import os
+import argparse
+import tempfile
+import pathlib
+from benchmarks import time_call, summarize_durations, write_results
+from benchmarks.library import generate_nextcloud_library
+import digital_photo_frame as dpf
+
+CONFIG_NAME = 'frame_config.txt'
+
+
+def write_config(directory, folders, times, delay=10):
+    (directory / CONFIG_NAME).write_text(
+        f'folders: {", ".join(folders)}\ntime: {times}\ndelay: {delay}\n')
+
+
+def create_file_manager(directory, library_path, columnar, catalog_format):
+    settings = dpf.SettingsFile(
+        directory / CONFIG_NAME,
+        dpf.NextcloudFileLocator(base_path=library_path))
+    return dpf.FileManager(settings,
+                           columnar=columnar,
+                           catalog_format=catalog_format)
+
+
+def clear_catalog(directory):
+    for name in os.listdir(directory):
+        if name.startswith('.filedata.'):
+            os.remove(directory / name)
+
+
+def measure(directory, library_path, folders, times, other_times, repeat,
+            columnar, catalog_format):
+    durations = {
+        name: []
+        for name in ('cold_start', 'warm_start', 'reread_folders',
+                     'reread_times', 'build_time_index',
+                     'update_filtered_filenames', 'update_file_list')
+    }
+    half_folders = folders[:max(len(folders) // 2, 1)]
+
+    for _ in range(repeat):
+        write_config(directory, folders, times)
+        clear_catalog(directory)
+        duration, _ = time_call(create_file_manager, directory, library_path,
+                                columnar, catalog_format)
+        durations['cold_start'].append(duration)
+        duration, file_manager = time_call(create_file_manager, directory,
+                                           library_path, columnar,
+                                           catalog_format)
+        durations['warm_start'].append(duration)
+
+        write_config(directory, half_folders, times)
+        duration, _ = time_call(file_manager.reread_settings)
+        durations['reread_folders'].append(duration)
+        write_config(directory, folders, times)
+        file_manager.reread_settings()
+
+        write_config(directory, folders, other_times)
+        duration, _ = time_call(file_manager.reread_settings)
+        durations['reread_times'].append(duration)
+        write_config(directory, folders, times)
+        file_manager.reread_settings()
+
+        file_manager._time_index = None
+        duration, _ = time_call(file_manager._update_filtered_filenames)
+        durations['build_time_index'].append(duration)
+        duration, _ = time_call(file_manager._update_filtered_filenames)
+        durations['update_filtered_filenames'].append(duration)
+        duration, _ = time_call(file_manager.update_file_list)
+        durations['update_file_list'].append(duration)
+
+    return {
+        name: summarize_durations(samples)
+        for name, samples in durations.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Time FileManager operations on synthetic photo libraries')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--users', type=int, default=2)
+    parser.add_argument('--albums', type=int, default=200)
+    parser.add_argument('--depth', type=int, default=2)
+    parser.add_argument('--distribution',
+                        choices=['uniform', 'recent', 'clustered'],
+                        default='clustered')
+    parser.add_argument('--times', default='2005 - 03.2012, 12.2015')
+    parser.add_argument('--other-times', default='2018 - 2020')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--columnar', action='store_true')
+    parser.add_argument('--catalog-format',
+                        choices=sorted(dpf.CATALOG_FORMATS),
+                        default='sqlite')
+    parser.add_argument('--output',
+                        help='File to write the results to as JSON')
+    args = parser.parse_args()
+
+    results = {}
+    for n_files in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            directory = pathlib.Path(directory)
+            library_path = directory / 'library'
+            script_dir = directory / 'control'
+            script_dir.mkdir()
+            dpf.SCRIPT_DIR = script_dir
+
+            folders = generate_nextcloud_library(
+                library_path,
+                n_files,
+                n_users=args.users,
+                n_albums=args.albums,
+                depth=args.depth,
+                date_distribution=args.distribution)
+            size_results = measure(script_dir, library_path, folders,
+                                   args.times, args.other_times, args.repeat,
+                                   args.columnar, args.catalog_format)
+
+        print(f'{n_files} files in {len(folders)} folders:')
+        for name, summary in size_results.items():
+            print(f'{name:>26}: {1e3*summary["min"]:10.2f} ms '
+                  f'(median {1e3*summary["median"]:.2f} ms)')
+        results[str(n_files)] = size_results
+
+    if args.output is not None:
+        write_results(args.output, 'file_manager', vars(args), results)
+
+
+if __name__ == '__main__':
+    main()
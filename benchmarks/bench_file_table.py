@@ -0,0 +1,77 @@
+import sys
+import random
+import argparse
+import tracemalloc
+from benchmarks import time_call
+from benchmarks.library import random_capture_time
+from time_filter import TimeIndex
+from file_table import FileTable
+from digital_photo_frame import TimePeriods
+
+
+def generate_file_times(n_files, n_folders, seed=0):
+    rng = random.Random(seed)
+    return {
+        f'/mnt/hdd1/user_{i % 3}/files/Photos/Album {i % n_folders:04d}/IMG_{i:07d}.jpg':
+        random_capture_time(rng).strftime('%Y-%m-%d %H:%M:%S')
+        for i in range(n_files)
+    }
+
+
+def measure_memory(function, *args):
+    tracemalloc.start()
+    result = function(*args)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, result
+
+
+def build_dict_index(n_files, n_folders):
+    file_times = generate_file_times(n_files, n_folders)
+    return file_times, TimeIndex(file_times)
+
+
+def build_file_table(n_files, n_folders):
+    return FileTable(generate_file_times(n_files, n_folders))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare the columnar file table with dict-based file times')
+    parser.add_argument('--files', type=int, default=500000)
+    parser.add_argument('--folders', type=int, default=1000)
+    parser.add_argument('--times',
+                        nargs='+',
+                        default=['2005 - 03.2008', '12.2012', '2015'])
+    args = parser.parse_args()
+
+    time_periods = TimePeriods(*args.times)
+    compiled_filter = time_periods.compile()
+
+    size, (file_times, index) = measure_memory(build_dict_index, args.files,
+                                               args.folders)
+    print(f'{"dict memory":>18}: {size/2**20:9.1f} MiB')
+    duration, dict_filenames = time_call(index.select, compiled_filter)
+    print(f'{"dict filter":>18}: {1e3*duration:9.2f} ms')
+    duration, _ = time_call(
+        lambda: sorted(file_times, key=file_times.__getitem__))
+    print(f'{"dict sort":>18}: {1e3*duration:9.2f} ms')
+    del file_times, index
+
+    size, table = measure_memory(build_file_table, args.files, args.folders)
+    print(f'{"table memory":>18}: {size/2**20:9.1f} MiB '
+          f'({table.nbytes/2**20:.1f} MiB in columns)')
+    duration, indices = time_call(table.select_indices, compiled_filter)
+    print(f'{"table filter":>18}: {1e3*duration:9.2f} ms')
+    duration, table_filenames = time_call(table.filenames, indices)
+    print(f'{"table paths":>18}: {1e3*duration:9.2f} ms')
+    duration, _ = time_call(table.chronological_order)
+    print(f'{"table sort":>18}: {1e3*duration:9.2f} ms')
+
+    if table_filenames != dict_filenames:
+        print('Table selection differs from dict-based selection')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
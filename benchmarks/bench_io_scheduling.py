@@ -0,0 +1,134 @@
+import sys
+import os
+import time
+import argparse
+import tempfile
+import pathlib
+import threading
+from benchmarks import time_call
+from benchmarks.library import generate_flat_library, generate_photos
+import metadata
+from metadata import MetadataExtractor
+from io_scheduling import DeviceScheduler, PauseGate
+
+
+class SpindleModel:
+    # Serialises the reads on the devices named slow and adds a seek time,
+    # the way a single spinning disk behaves
+    def __init__(self, slow_devices, seek_time):
+        self._slow_devices = set(slow_devices)
+        self._seek_time = seek_time
+        self._locks = {device: threading.Lock() for device in slow_devices}
+
+    def read_capture_time(self, filename):
+        device = os.stat(os.path.dirname(filename)).st_dev
+        if device not in self._slow_devices:
+            return read_capture_time(filename)
+        with self._locks[device]:
+            time.sleep(self._seek_time)
+            return read_capture_time(filename)
+
+
+read_capture_time = metadata.read_capture_time
+
+
+def extract_sequentially(filenames):
+    return list(map(metadata.read_capture_time, filenames))
+
+
+def measure_decode_latency(photos, background_filenames, use_gate):
+    from render_cache import load_screen_image
+
+    gate = PauseGate()
+    scheduler = DeviceScheduler(workers_per_device=4,
+                                idle_priority=True,
+                                chunksize=16,
+                                pause_gate=gate)
+    background = threading.Thread(
+        target=lambda: scheduler.map(metadata.read_capture_time,
+                                     background_filenames))
+    background.start()
+    decode_times = []
+    for photo in photos:
+        start_time = time.perf_counter()
+        if use_gate:
+            with gate.paused():
+                load_screen_image(photo, (1920, 1080))
+        else:
+            load_screen_image(photo, (1920, 1080))
+        decode_times.append(time.perf_counter() - start_time)
+    background.join()
+    scheduler.close()
+    return decode_times
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=
+        'Compare per-device extraction pools with a single pass and measure slide decoding under background extraction'
+    )
+    parser.add_argument('--files', type=int, default=2000)
+    parser.add_argument('--seek-time', type=float, default=2e-3)
+    parser.add_argument('--fast-directory',
+                        default='/dev/shm',
+                        help='folder on a second device')
+    parser.add_argument('--photos', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as slow_directory, tempfile.TemporaryDirectory(
+            dir=args.fast_directory) as fast_directory:
+        slow_filenames = generate_flat_library(pathlib.Path(slow_directory),
+                                               args.files // 2)
+        fast_filenames = generate_flat_library(pathlib.Path(fast_directory),
+                                               args.files // 2)
+        filenames = [
+            filename for pair in zip(slow_filenames, fast_filenames)
+            for filename in pair
+        ]
+        slow_device = os.stat(slow_directory).st_dev
+        if slow_device == os.stat(fast_directory).st_dev:
+            print('Both folders are on the same device')
+        model = SpindleModel([slow_device], args.seek_time)
+        metadata.read_capture_time = model.read_capture_time
+        print(
+            f'{len(filenames)} files, half of them behind a {1e3*args.seek_time:g} ms seek'
+        )
+
+        duration, expected = time_call(extract_sequentially, filenames)
+        print(f'{"sequential":>20}: {duration:7.3f} s')
+
+        duration, shared = time_call(
+            MetadataExtractor(max_workers=4).extract_times, filenames)
+        print(f'{"shared pool":>20}: {duration:7.3f} s')
+
+        scheduler = DeviceScheduler(workers_per_device=1)
+        duration, per_device = time_call(
+            MetadataExtractor(scheduler=scheduler).extract_times, filenames)
+        print(f'{"per-device pools":>20}: {duration:7.3f} s')
+        scheduler.close()
+        metadata.read_capture_time = read_capture_time
+
+        if shared != expected or per_device != expected:
+            print('Extracted times differ')
+            sys.exit(1)
+
+        try:
+            import PIL
+        except ImportError:
+            return
+        photo_directory = pathlib.Path(slow_directory) / 'photos'
+        photo_directory.mkdir()
+        photos = generate_photos(photo_directory, args.photos,
+                                 [(4000, 3000)])
+        background_filenames = filenames * 10
+        for use_gate in (False, True):
+            decode_times = sorted(
+                measure_decode_latency(photos, background_filenames,
+                                       use_gate))
+            print(
+                f'{"decode, gate " + ("on" if use_gate else "off"):>20}: mean {1e3*sum(decode_times)/len(decode_times):6.1f} ms, max {1e3*decode_times[-1]:6.1f} ms'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import sys
+import shutil
+import argparse
+import tempfile
+import subprocess
+from benchmarks import CONTROL_DIR, time_call
+from benchmarks.library import generate_flat_library
+from metadata import MetadataExtractor
+
+
+def run_shell_script(filenames):
+    output = subprocess.check_output(
+        [CONTROL_DIR / 'find_image_times.sh', *filenames], text=True)
+    return output.split('\n')[:-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare in-process EXIF time extraction with find_image_times.sh')
+    parser.add_argument('--files', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--skip-script', action='store_true')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        filenames = generate_flat_library(directory, args.files)
+        print(f'Generated {len(filenames)} images in {directory}')
+
+        results = {}
+        for name, extractor in (
+            ('serial', MetadataExtractor(max_workers=1)),
+            ('threads', MetadataExtractor(max_workers=args.workers)),
+            ('processes',
+             MetadataExtractor(max_workers=args.workers, use_processes=True)),
+        ):
+            duration, times = time_call(extractor.extract_times, filenames)
+            results[name] = times
+            print(f'{name:>10}: {duration:8.3f} s '
+                  f'({1e6*duration/len(filenames):8.1f} us/file)')
+
+        if args.skip_script or shutil.which('exiftool') is None:
+            print('    script: skipped (exiftool not available)')
+        else:
+            duration, times = time_call(run_shell_script, filenames)
+            print(f'{"script":>10}: {duration:8.3f} s '
+                  f'({1e6*duration/len(filenames):8.1f} us/file)')
+            mismatches = sum(a != b for a, b in zip(times, results['serial']))
+            print(f'{mismatches} of {len(filenames)} times differ from script')
+            if mismatches:
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import sys
+import argparse
+import tempfile
+import pathlib
+import sqlite3
+from benchmarks import time_call, write_results
+from benchmarks.library import generate_nextcloud_library, load_nextcloud_filecache
+import digital_photo_frame as dpf
+from scanner import ImageScanner
+from nextcloud import NextcloudFileSource, SQLiteDatabase
+
+
+def touch_folder(database_path, folder):
+    # Gives the folder a new etag, as Nextcloud does when a file in it changes
+    connection = sqlite3.connect(database_path)
+    with connection:
+        connection.execute(
+            "UPDATE oc_filecache SET etag = etag || 'x' WHERE path = ?",
+            ('/'.join(['files', *folder.split('/')[1:]]), ))
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=
+        'Compare listing images from the Nextcloud file cache with scanning the disk'
+    )
+    parser.add_argument('--files', type=int, default=50000)
+    parser.add_argument('--users', type=int, default=2)
+    parser.add_argument('--albums', type=int, default=500)
+    parser.add_argument('--depth', type=int, default=2)
+    parser.add_argument('--output', help='Write the results as JSON')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        library_path = pathlib.Path(directory) / 'library'
+        database_path = pathlib.Path(directory) / 'nextcloud.sqlite'
+        folders = generate_nextcloud_library(library_path,
+                                             args.files,
+                                             n_users=args.users,
+                                             n_albums=args.albums,
+                                             depth=args.depth)
+        duration, _ = time_call(load_nextcloud_filecache, database_path,
+                                library_path)
+        print(
+            f'Generated {args.files} files in {len(folders)} folders, file cache loaded in {duration:.2f} s'
+        )
+
+        locator = dpf.NextcloudFileLocator(base_path=library_path)
+        paths = [
+            str(locator.generate_valid_path(pathlib.Path(folder)))
+            for folder in folders
+        ]
+        results = {}
+
+        duration, disk_filenames = time_call(
+            lambda: list(ImageScanner().scan(paths)))
+        results['disk'] = duration
+
+        file_source = NextcloudFileSource(SQLiteDatabase(database_path),
+                                          base_path=library_path)
+        duration, catalog_filenames = time_call(
+            lambda: list(file_source.scan(paths)))
+        results['file_cache'] = duration
+        duration, _ = time_call(lambda: list(file_source.scan(paths)))
+        results['file_cache_unchanged'] = duration
+        duration, _ = time_call(file_source.folder_versions, paths)
+        results['version_poll'] = duration
+
+        touch_folder(database_path, folders[0])
+        file_source = NextcloudFileSource(SQLiteDatabase(database_path),
+                                          base_path=library_path)
+        list(file_source.scan(paths))
+        touch_folder(database_path, folders[0])
+        duration, changed_filenames = time_call(
+            lambda: list(file_source.scan(paths)))
+        results['file_cache_one_changed'] = duration
+
+        user_paths = sorted(
+            set(str(pathlib.Path(path).parents[args.depth - 1])
+                for path in paths))
+        duration, disk_recursive_filenames = time_call(
+            lambda: list(ImageScanner(recursive=True).scan(user_paths)))
+        results['disk_recursive'] = duration
+        duration, catalog_recursive_filenames = time_call(lambda: list(
+            NextcloudFileSource(SQLiteDatabase(database_path),
+                                base_path=library_path,
+                                recursive=True).scan(user_paths)))
+        results['file_cache_recursive'] = duration
+
+        for name, duration in results.items():
+            print(f'{name:>24}: {1e3*duration:9.1f} ms')
+
+        if args.output is not None:
+            write_results(args.output, 'nextcloud', vars(args), results)
+
+        if sorted(catalog_filenames) != sorted(disk_filenames) or sorted(
+                changed_filenames) != sorted(disk_filenames):
+            print('File cache listing differs from the disk scan')
+            sys.exit(1)
+        if sorted(catalog_recursive_filenames) != sorted(
+                disk_recursive_filenames):
+            print('Recursive file cache listing differs from the disk scan')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import sys
+import os
+import time
+import argparse
+import tempfile
+import pathlib
+from benchmarks import time_call, summarize_durations, write_results
+from benchmarks.bench_file_manager import write_config, clear_catalog
+from benchmarks.library import generate_nextcloud_library
+import digital_photo_frame as dpf
+
+
+def create_file_manager(directory, library_path, stream_batch_size):
+    settings = dpf.SettingsFile(
+        directory / 'frame_config.txt',
+        dpf.NextcloudFileLocator(base_path=library_path))
+    return dpf.FileManager(settings, stream_batch_size=stream_batch_size)
+
+
+def stream(directory, library_path, stream_batch_size):
+    start_time = time.perf_counter()
+    first_batch_times = []
+    file_manager = create_file_manager(directory, library_path,
+                                       stream_batch_size)
+    file_manager.refresh_if_stale(
+        lambda: first_batch_times.append(time.perf_counter() - start_time))
+    return first_batch_times[0], file_manager
+
+
+def measure(directory, library_path, repeat, stream_batch_size):
+    durations = {
+        name: []
+        for name in ('batch_list', 'stream_first_batch', 'stream_list')
+    }
+    for _ in range(repeat):
+        clear_catalog(directory)
+        duration, file_manager = time_call(create_file_manager, directory,
+                                           library_path, None)
+        durations['batch_list'].append(duration)
+        batch_filenames = list(file_manager._filtered_filenames)
+        os.remove(file_manager.file_list_path)
+
+        clear_catalog(directory)
+        duration, (first_batch_duration,
+                   file_manager) = time_call(stream, directory, library_path,
+                                             stream_batch_size)
+        durations['stream_first_batch'].append(first_batch_duration)
+        durations['stream_list'].append(duration)
+
+        streamed_filenames = list(file_manager._filtered_filenames)
+        file_manager._update_filtered_filenames()
+        if not streamed_filenames == file_manager._filtered_filenames == batch_filenames:
+            print('The streamed list differs from the batch list')
+            sys.exit(1)
+        with open(file_manager.file_list_path) as f:
+            if f.read().splitlines() != batch_filenames:
+                print('The written list differs from the batch list')
+                sys.exit(1)
+
+    return {
+        name: summarize_durations(samples)
+        for name, samples in durations.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=
+        'Compare the time until the first photos can be shown with and without streaming'
+    )
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000])
+    parser.add_argument('--albums', type=int, default=200)
+    parser.add_argument('--times', default='2005 - 03.2012, 12.2015')
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output',
+                        help='File to write the results to as JSON')
+    args = parser.parse_args()
+
+    results = {}
+    for n_files in args.sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            directory = pathlib.Path(directory)
+            library_path = directory / 'library'
+            script_dir = directory / 'control'
+            script_dir.mkdir()
+            dpf.SCRIPT_DIR = script_dir
+
+            folders = generate_nextcloud_library(library_path,
+                                                 n_files,
+                                                 n_albums=args.albums,
+                                                 date_distribution='uniform')
+            write_config(script_dir, folders, args.times)
+            size_results = measure(script_dir, library_path, args.repeat,
+                                   args.batch_size)
+
+        print(f'{n_files} files in {len(folders)} folders, cold catalog:')
+        for name, summary in size_results.items():
+            print(f'{name:>20}: {1e3*summary["min"]:10.2f} ms '
+                  f'(median {1e3*summary["median"]:.2f} ms)')
+        results[str(n_files)] = size_results
+
+    if args.output is not None:
+        write_results(args.output, 'pipeline', vars(args), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+import io
+import os
+import argparse
+import datetime
+import tempfile
+import pathlib
+from benchmarks import time_call, summarize_durations, write_results
+from benchmarks.library import build_raw, build_heif
+import metadata
+from preview_cache import PreviewCache
+from render_cache import load_screen_image
+
+
+def build_preview(size):
+    from PIL import Image
+
+    image = Image.linear_gradient('L').resize(size).convert('RGB')
+    noise = Image.effect_noise(size, 32).convert('RGB')
+    output = io.BytesIO()
+    Image.blend(image, noise, 0.3).save(output, 'JPEG', quality=92)
+    return output.getvalue()
+
+
+def generate_files(directory, n_files, sensor_size, preview_size):
+    preview = build_preview(preview_size)
+    capture_time = datetime.datetime(2019, 5, 4, 12, 0, 0)
+    raw_filenames = []
+    heif_filenames = []
+    for i in range(n_files):
+        raw_filename = directory / f'IMG_{i:04d}.nef'
+        raw_filename.write_bytes(
+            build_raw(capture_time, preview, sensor_size, orientation=6,
+                      seed=i))
+        raw_filenames.append(str(raw_filename))
+        heif_filename = directory / f'IMG_{i:04d}.heic'
+        heif_filename.write_bytes(build_heif(capture_time, preview))
+        heif_filenames.append(str(heif_filename))
+    return raw_filenames, heif_filenames
+
+
+def measure_each(function, filenames):
+    return summarize_durations(
+        [time_call(function, filename)[0] for filename in filenames])
+
+
+def measure(directory, filenames, screen_size):
+    # The sensor data here is uncompressed RGB, which Pillow reads about as
+    # fast as the file can be copied, so the full decode is a lower bound.
+    # Actual CR2, NEF and ARW sensor data needs demosaicing, which neither
+    # Pillow nor feh can do.
+    results = {}
+    results['time_only'] = measure_each(metadata.read_capture_time,
+                                        filenames)
+    results['full_decode'] = measure_each(
+        lambda filename: load_screen_image(filename, screen_size), filenames)
+
+    # Separate passes: the capture time first, then the preview
+    separate_cache = PreviewCache(directory / 'separate')
+
+    def read_separately(filename):
+        metadata.read_capture_time(filename)
+        return separate_cache.process(filename)
+
+    results['separate_passes'] = measure_each(read_separately, filenames)
+
+    cache = PreviewCache(directory / 'single')
+    results['single_pass'] = measure_each(cache.read_capture_time, filenames)
+    preview_filenames, missing_filenames = cache.map_paths(filenames)
+    if missing_filenames:
+        print(f'{len(missing_filenames)} previews missing')
+    results['preview_decode'] = measure_each(
+        lambda filename: load_screen_image(filename, screen_size),
+        preview_filenames)
+    results['preview_bytes'] = cache.total_bytes // len(filenames)
+    results['file_bytes'] = os.path.getsize(filenames[0])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=
+        'Compare showing RAW and HEIF files through their embedded previews with decoding them in full'
+    )
+    parser.add_argument('--files', type=int, default=10)
+    parser.add_argument('--sensor-size',
+                        type=int,
+                        nargs=2,
+                        default=[4000, 3000])
+    parser.add_argument('--preview-size',
+                        type=int,
+                        nargs=2,
+                        default=[4000, 3000])
+    parser.add_argument('--screen-size',
+                        type=int,
+                        nargs=2,
+                        default=[1920, 1080])
+    parser.add_argument('--output',
+                        help='File to write the results to as JSON')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        directory = pathlib.Path(directory)
+        raw_filenames, heif_filenames = generate_files(
+            directory, args.files, tuple(args.sensor_size),
+            tuple(args.preview_size))
+        results = {'raw': measure(directory / 'raw', raw_filenames,
+                                  tuple(args.screen_size))}
+        # The HEVC image of a HEIF file cannot be decoded here, so only the
+        # preview side is measured
+        cache = PreviewCache(directory / 'heif')
+        results['heif'] = {
+            'single_pass':
+            measure_each(cache.read_capture_time, heif_filenames),
+            'previews': args.files - len(cache.map_paths(heif_filenames)[1])
+        }
+
+    print(f'{args.files} RAW files of {args.sensor_size[0]}x{args.sensor_size[1]} '
+          f'with {args.preview_size[0]}x{args.preview_size[1]} previews:')
+    for name, result in results['raw'].items():
+        if isinstance(result, dict):
+            print(f'{name:>16}: {1e3*result["median"]:9.2f} ms')
+    print(f'{"file size":>16}: {results["raw"]["file_bytes"] >> 10} KiB')
+    print(f'{"preview size":>16}: {results["raw"]["preview_bytes"] >> 10} KiB')
+    print(f'HEIF files: {results["heif"]["previews"]} of {args.files} '
+          f'previews extracted, '
+          f'{1e3*results["heif"]["single_pass"]["median"]:.2f} ms each')
+
+    if args.output is not None:
+        write_results(args.output, 'previews', vars(args), results)
+
+
+if __name__ == '__main__':
+    main()
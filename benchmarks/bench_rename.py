@@ -0,0 +1,96 @@
+import sys
+import os
+import argparse
+import tempfile
+import pathlib
+from benchmarks import time_call, write_results
+from benchmarks.library import generate_flat_library
+import digital_photo_frame as dpf
+from metadata import MetadataExtractor
+
+CONFIG_NAME = 'frame_config.txt'
+
+
+class CountingExtractor(MetadataExtractor):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.n_extracted = 0
+
+    def extract_times(self, filenames):
+        filenames = list(filenames)
+        self.n_extracted += len(filenames)
+        return super().extract_times(filenames)
+
+
+def write_config(directory, folder):
+    (directory / CONFIG_NAME).write_text(
+        f'folders: {folder}\ntime: 2000 - 2021\ndelay: 10\n')
+
+
+def create_file_manager(directory, catalog_format, extractor):
+    settings = dpf.SettingsFile(directory / CONFIG_NAME,
+                                dpf.StandardFileLocator())
+    return dpf.FileManager(settings,
+                           metadata_extractor=extractor,
+                           catalog_format=catalog_format)
+
+
+def measure(directory, n_files, catalog_format):
+    script_dir = directory / 'control'
+    script_dir.mkdir()
+    dpf.SCRIPT_DIR = script_dir
+    album = directory / 'Album'
+    renamed_album = directory / 'Album (renamed)'
+    # Every photo has a capture time, since photos without one are identical
+    # files here and would share their content fingerprint
+    generate_flat_library(album, n_files, exif_fraction=1.0)
+
+    extractor = CountingExtractor()
+    write_config(script_dir, album)
+    duration, file_manager = time_call(create_file_manager, script_dir,
+                                       catalog_format, extractor)
+    results = {'initial': {'seconds': duration,
+                           'extracted': extractor.n_extracted}}
+    file_times = dict(file_manager._file_times)
+
+    extractor.n_extracted = 0
+    os.rename(album, renamed_album)
+    write_config(script_dir, renamed_album)
+    duration, _ = time_call(file_manager.reread_settings)
+    results['rename'] = {'seconds': duration,
+                         'extracted': extractor.n_extracted}
+
+    renamed_times = {
+        os.path.join(album, os.path.basename(filename)): time_string
+        for filename, time_string in file_manager._file_times.items()
+    }
+    if renamed_times != file_times:
+        print('Times changed after the rename')
+        sys.exit(1)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure the extraction work after renaming an album')
+    parser.add_argument('--files', type=int, default=10000)
+    parser.add_argument('--output',
+                        help='File to write the results to as JSON')
+    args = parser.parse_args()
+
+    results = {}
+    for catalog_format in sorted(dpf.CATALOG_FORMATS):
+        with tempfile.TemporaryDirectory() as directory:
+            results[catalog_format] = measure(pathlib.Path(directory),
+                                              args.files, catalog_format)
+        print(f'{catalog_format} catalog, {args.files} files:')
+        for name, result in results[catalog_format].items():
+            print(f'{name:>12}: {1e3*result["seconds"]:9.1f} ms, '
+                  f'{result["extracted"]} extracted')
+
+    if args.output is not None:
+        write_results(args.output, 'rename', vars(args), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+import time
+import argparse
+import tempfile
+import pathlib
+from benchmarks import time_call
+from benchmarks.library import generate_photos
+from PIL import Image, ImageOps
+from render_cache import RenderCache
+
+
+def show_slide(filename, screen_size):
+    # Mimics what the viewer does for every slide: decode the full image,
+    # apply the orientation and scale it to fit the screen
+    with Image.open(filename) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(screen_size)
+        return image.size
+
+
+def time_slides(filenames, screen_size):
+    start_time = time.perf_counter()
+    for filename in filenames:
+        show_slide(filename, screen_size)
+    return (time.perf_counter() - start_time) / len(filenames)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare per-slide decode time with and without the render cache')
+    parser.add_argument('--files', type=int, default=10)
+    parser.add_argument('--width', type=int, default=6000)
+    parser.add_argument('--height', type=int, default=4000)
+    parser.add_argument('--screen', type=int, nargs=2, default=[1920, 1080])
+    args = parser.parse_args()
+    screen_size = tuple(args.screen)
+
+    with tempfile.TemporaryDirectory() as directory:
+        directory = pathlib.Path(directory)
+        (directory / 'photos').mkdir()
+        filenames = generate_photos(directory / 'photos', args.files,
+                                    [(args.width, args.height)])
+
+        duration = time_slides(filenames, screen_size)
+        print(f'{"original slide":>18}: {1e3*duration:9.1f} ms')
+
+        cache = RenderCache(directory / 'cache', screen_size=screen_size)
+        duration, _ = time_call(
+            lambda: [cache.render(filename) for filename in filenames])
+        print(f'{"render":>18}: {1e3*duration/len(filenames):9.1f} ms')
+
+        cached_filenames, missing_filenames = cache.map_paths(filenames)
+        duration = time_slides(cached_filenames, screen_size)
+        print(f'{"cached slide":>18}: {1e3*duration:9.1f} ms')
+        print(f'{"hit rate":>18}: {100*cache.hit_rate:9.1f} %')
+        cache.close()
+
+        if missing_filenames:
+            print(f'{len(missing_filenames)} files were not rendered')
+
+
+if __name__ == '__main__':
+    main()
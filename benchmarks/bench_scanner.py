@@ -0,0 +1,55 @@
+import sys
+import argparse
+import tempfile
+import subprocess
+from benchmarks import CONTROL_DIR, time_call
+from benchmarks.library import generate_tree
+from scanner import ImageScanner
+
+
+def run_shell_script(folders):
+    output = subprocess.check_output(
+        [CONTROL_DIR / 'find_image_files.sh', *folders], text=True)
+    return output.split('\n')[:-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare the scandir image scanner with find_image_files.sh')
+    parser.add_argument('--files', type=int, default=100000)
+    parser.add_argument('--folders', type=int, default=100)
+    parser.add_argument('--depth', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        folders = generate_tree(directory,
+                                args.files,
+                                n_folders=args.folders,
+                                depth=args.depth)
+        print(f'Generated {args.files} files in {args.folders} folders')
+
+        duration, script_paths = time_call(run_shell_script, folders)
+        print(f'{"script":>16}: {duration:8.3f} s ({len(script_paths)} images)')
+
+        scanner = ImageScanner()
+        duration, scanner_paths = time_call(lambda: list(scanner.scan(folders)))
+        print(
+            f'{"scanner (cold)":>16}: {duration:8.3f} s ({len(scanner_paths)} images)'
+        )
+        duration, _ = time_call(lambda: list(scanner.scan(folders)))
+        print(f'{"scanner (warm)":>16}: {duration:8.3f} s')
+
+        recursive_scanner = ImageScanner(recursive=True)
+        duration, recursive_paths = time_call(
+            lambda: list(recursive_scanner.scan(folders)))
+        print(
+            f'{"recursive":>16}: {duration:8.3f} s ({len(recursive_paths)} images)'
+        )
+
+        if scanner_paths != script_paths:
+            print('Scanner output differs from script output')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import time
+import argparse
+import tempfile
+import pathlib
+from benchmarks.library import generate_photos
+import digital_photo_frame as dpf
+from slideshow import SlideshowViewer, NullScreen
+from render_cache import load_screen_image
+
+
+def create_file_manager(directory, photo_directory, delay):
+    dpf.SCRIPT_DIR = directory
+    config_path = directory / 'frame_config.txt'
+    config_path.write_text(
+        f'folders: {photo_directory}\ntime: any\ndelay: {delay}\n')
+    return dpf.FileManager(dpf.SettingsFile(config_path,
+                                            dpf.StandardFileLocator()),
+                           cache_data=False)
+
+
+def time_preload(filenames, screen_size):
+    # What the preload option amounts to: every image is decoded before the
+    # first slide can be shown
+    start_time = time.perf_counter()
+    for filename in filenames:
+        load_screen_image(filename, screen_size)
+    return time.perf_counter() - start_time
+
+
+def run_slideshow(file_manager, n_slides, buffer_size):
+    viewer = SlideshowViewer(file_manager,
+                             NullScreen(),
+                             buffer_size=buffer_size)
+    start_time = time.perf_counter()
+    viewer.start()
+    while len(viewer.stall_times) < n_slides and viewer.poll() is None:
+        time.sleep(0.01)
+    duration = time.perf_counter() - start_time
+    viewer.stop()
+    return duration, viewer.decode_times, viewer.stall_times
+
+
+def print_times(name, times):
+    times = sorted(times)
+    print(f'{name:>18}: mean {1e3*sum(times)/len(times):7.1f} ms, '
+          f'max {1e3*times[-1]:7.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure decode latency of the built-in slideshow engine')
+    parser.add_argument('--files', type=int, default=20)
+    parser.add_argument('--delay', type=float, default=0.5)
+    parser.add_argument('--buffer-size', type=int, nargs='+', default=[1, 4])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        directory = pathlib.Path(directory)
+        photo_directory = directory / 'photos'
+        photo_directory.mkdir()
+        # Mostly phone-sized photos with some large camera images in between
+        filenames = generate_photos(photo_directory, args.files,
+                                    [(3000, 2000)] * 3 + [(6000, 4000)])
+        file_manager = create_file_manager(directory, photo_directory,
+                                           args.delay)
+
+        duration = time_preload(filenames, NullScreen().size)
+        print(f'{"preload":>18}: {duration:9.2f} s before the first slide')
+
+        for buffer_size in args.buffer_size:
+            print(f'Buffer size {buffer_size}:')
+            duration, decode_times, stall_times = run_slideshow(
+                file_manager, args.files, buffer_size)
+            print(f'{"first slide":>18}: {stall_times[0]:9.2f} s')
+            print_times('decode', decode_times)
+            print_times('slide stall', stall_times[1:])
+            print(
+                f'{"stalled slides":>18}: {sum(1 for t in stall_times[1:] if t > 1e-3):9d}'
+            )
+
+
+if __name__ == '__main__':
+    main()
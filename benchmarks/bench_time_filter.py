@@ -0,0 +1,53 @@
+import sys
+import random
+import argparse
+import datetime
+from benchmarks import time_call
+from benchmarks.library import random_capture_time
+from time_filter import TimeIndex
+from digital_photo_frame import TimePeriods
+
+
+def filter_legacy(file_times, time_periods):
+    return [
+        filename for filename, time_string in file_times.items() if any(
+            time.includes(datetime.datetime.fromisoformat(time_string))
+            for time in time_periods.times)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare the time index with per-file time filtering')
+    parser.add_argument('--files', type=int, default=100000)
+    parser.add_argument('--times',
+                        nargs='+',
+                        default=['2005 - 03.2008', '12.2012', '2015'])
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    file_times = {
+        f'/photos/IMG_{i:07d}.jpg':
+        random_capture_time(rng).strftime('%Y-%m-%d %H:%M:%S')
+        for i in range(args.files)
+    }
+    time_periods = TimePeriods(*args.times)
+
+    duration, legacy_filenames = time_call(filter_legacy, file_times,
+                                           time_periods)
+    print(f'{"per-file":>14}: {1e3*duration:9.2f} ms')
+
+    duration, index = time_call(TimeIndex, file_times)
+    print(f'{"index build":>14}: {1e3*duration:9.2f} ms')
+
+    duration, filenames = time_call(index.select, time_periods.compile())
+    print(f'{"index select":>14}: {1e3*duration:9.2f} ms '
+          f'({len(filenames)} of {len(file_times)} files)')
+
+    if filenames != legacy_filenames:
+        print('Index selection differs from per-file filtering')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+-- Subset of the Nextcloud file cache schema read by control/nextcloud.py,
+-- with the same table, column and index names. Loads in SQLite and MariaDB.
+
+CREATE TABLE oc_storages (
+    numeric_id BIGINT NOT NULL PRIMARY KEY,
+    id VARCHAR(64) NOT NULL,
+    available INTEGER NOT NULL DEFAULT 1,
+    last_checked INTEGER
+);
+
+CREATE UNIQUE INDEX storages_id_index ON oc_storages (id);
+
+CREATE TABLE oc_mimetypes (
+    id BIGINT NOT NULL PRIMARY KEY,
+    mimetype VARCHAR(255) NOT NULL
+);
+
+CREATE UNIQUE INDEX mimetype_id_index ON oc_mimetypes (mimetype);
+
+CREATE TABLE oc_filecache (
+    fileid BIGINT NOT NULL PRIMARY KEY,
+    storage BIGINT NOT NULL,
+    path VARCHAR(4000),
+    path_hash VARCHAR(32) NOT NULL,
+    parent BIGINT NOT NULL,
+    name VARCHAR(250),
+    mimetype BIGINT NOT NULL,
+    mimepart BIGINT NOT NULL,
+    size BIGINT NOT NULL DEFAULT 0,
+    mtime BIGINT NOT NULL DEFAULT 0,
+    storage_mtime BIGINT NOT NULL DEFAULT 0,
+    encrypted INTEGER NOT NULL DEFAULT 0,
+    etag VARCHAR(40),
+    permissions INTEGER DEFAULT 0
+);
+
+CREATE UNIQUE INDEX fs_storage_path_hash ON oc_filecache (storage, path_hash);
+CREATE INDEX fs_parent_name_hash ON oc_filecache (parent, name);
+CREATE INDEX fs_storage_mimepart ON oc_filecache (storage, mimepart);
+CREATE INDEX fs_mtime ON oc_filecache (mtime);
@@ -0,0 +1,340 @@
+import os
+import struct
+import random
+import datetime
+
+JPEG_QUANTIZATION_TABLE = b'\xff\xdb\x00\x43\x00' + b'\x01' * 64
+JPEG_DC_HUFFMAN_TABLE = b'\xff\xc4\x00\x14\x00' + b'\x01' + b'\x00' * 15 + b'\x00'
+JPEG_AC_HUFFMAN_TABLE = b'\xff\xc4\x00\x14\x10' + b'\x01' + b'\x00' * 15 + b'\x00'
+
+
+def build_exif_segment(capture_time):
+    time_bytes = capture_time.strftime('%Y:%m:%d %H:%M:%S').encode() + b'\x00'
+    ifd0_offset = 8
+    exif_ifd_offset = ifd0_offset + 2 + 12 + 4
+    time_offset = exif_ifd_offset + 2 + 12 + 4
+    tiff = b'II*\x00' + struct.pack('<I', ifd0_offset)
+    tiff += struct.pack('<H', 1) + struct.pack('<HHII', 0x8769, 4, 1,
+                                               exif_ifd_offset) + b'\x00' * 4
+    tiff += struct.pack('<H', 1) + struct.pack(
+        '<HHII', 0x9003, 2, len(time_bytes), time_offset) + b'\x00' * 4
+    tiff += time_bytes
+    payload = b'Exif\x00\x00' + tiff
+    return b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload
+
+
+def build_jpeg(capture_time=None, width=16, height=16, padding=0):
+    # Uniform gray baseline JPEG where every block is encoded as a zero DC
+    # difference followed by end-of-block, both with one-bit Huffman codes
+    n_blocks = ((width + 7) // 8) * ((height + 7) // 8)
+    n_bits = 2 * n_blocks
+    scan_data = b'\x00' * (n_bits // 8)
+    if n_bits % 8:
+        scan_data += bytes([(1 << (8 - n_bits % 8)) - 1])
+
+    data = b'\xff\xd8'
+    if capture_time is not None:
+        data += build_exif_segment(capture_time)
+    while padding > 0:
+        chunk = min(padding, 65533)
+        data += b'\xff\xfe' + struct.pack('>H', chunk + 2) + b'\x00' * chunk
+        padding -= chunk
+    data += JPEG_QUANTIZATION_TABLE
+    data += b'\xff\xc0\x00\x0b\x08' + struct.pack('>HH', height,
+                                                  width) + b'\x01\x01\x11\x00'
+    data += JPEG_DC_HUFFMAN_TABLE + JPEG_AC_HUFFMAN_TABLE
+    data += b'\xff\xda\x00\x08\x01\x01\x00\x00\x3f\x00'
+    data += scan_data + b'\xff\xd9'
+    return data
+
+
+def random_capture_time(rng, start_year=2000, end_year=2021):
+    start = datetime.datetime(start_year, 1, 1)
+    end = datetime.datetime(end_year + 1, 1, 1)
+    return start + datetime.timedelta(
+        seconds=rng.randrange(int((end - start).total_seconds())))
+
+
+def generate_flat_library(directory,
+                          n_files,
+                          exif_fraction=0.9,
+                          non_image_fraction=0.0,
+                          seed=0):
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(n_files):
+        if rng.random() < non_image_fraction:
+            path = os.path.join(directory, f'notes_{i:06d}.txt')
+            with open(path, 'w') as f:
+                f.write('Not an image.\n')
+            continue
+        capture_time = random_capture_time(rng)
+        path = os.path.join(directory, f'IMG_{i:06d}.jpg')
+        with open(path, 'wb') as f:
+            f.write(
+                build_jpeg(capture_time if rng.random() < exif_fraction else None))
+        mtime = capture_time.timestamp()
+        os.utime(path, (mtime, mtime))
+        paths.append(path)
+    return paths
+
+
+def generate_tree(directory,
+                  n_files,
+                  n_folders=100,
+                  depth=1,
+                  non_image_fraction=0.2,
+                  seed=0):
+    rng = random.Random(seed)
+    folders = []
+    for i in range(n_folders):
+        parts = [f'album_{i:04d}'] + [f'sub_{level}' for level in range(1, depth)]
+        folders.append(os.path.join(directory, *parts[:1 + i % depth]))
+    for folder in folders:
+        os.makedirs(folder, exist_ok=True)
+
+    image_data = build_jpeg()
+    for i in range(n_files):
+        folder = folders[i % n_folders]
+        if rng.random() < non_image_fraction:
+            with open(os.path.join(folder, f'notes_{i:07d}.txt'), 'w') as f:
+                f.write('Not an image.\n')
+        else:
+            with open(os.path.join(folder, f'IMG_{i:07d}.jpg'), 'wb') as f:
+                f.write(image_data)
+    return [
+        os.path.join(directory, f'album_{i:04d}') for i in range(n_folders)
+    ]
+
+
+def sample_capture_time(rng, distribution, start_year=2000, end_year=2021):
+    if distribution == 'recent':
+        # Density grows linearly towards the end of the range, like a
+        # library that gets more photos per year as phones took over
+        start = datetime.datetime(start_year, 1, 1)
+        end = datetime.datetime(end_year + 1, 1, 1)
+        return start + (end - start) * rng.random()**0.5
+    return random_capture_time(rng, start_year=start_year, end_year=end_year)
+
+
+def generate_nextcloud_library(base_path,
+                               n_files,
+                               n_users=2,
+                               n_albums=100,
+                               depth=2,
+                               date_distribution='clustered',
+                               start_year=2000,
+                               end_year=2021,
+                               seed=0):
+    # Lays out albums as <user>/files/Photos/<year>/<album>/... below the
+    # base path and returns the folders the way they appear in the settings
+    rng = random.Random(seed)
+    album_times = [
+        sample_capture_time(rng,
+                            'uniform' if date_distribution == 'clustered' else
+                            date_distribution,
+                            start_year=start_year,
+                            end_year=end_year) for _ in range(n_albums)
+    ]
+    folders = []
+    for i, album_time in enumerate(album_times):
+        levels = [f'{album_time.year}', f'album_{i:04d}'
+                  ] + [f'part_{level}' for level in range(1, depth - 1)]
+        folders.append('/'.join([f'user_{i % n_users}', 'Photos'] +
+                                levels[:max(depth, 1)]))
+    for folder in folders:
+        user, *rest = folder.split('/')
+        os.makedirs(os.path.join(base_path, user, 'files', *rest),
+                    exist_ok=True)
+
+    for i in range(n_files):
+        album = i % n_albums
+        if date_distribution == 'clustered':
+            capture_time = album_times[album] + datetime.timedelta(
+                seconds=rng.randrange(3 * 86400))
+        else:
+            capture_time = sample_capture_time(rng,
+                                               date_distribution,
+                                               start_year=start_year,
+                                               end_year=end_year)
+        user, *rest = folders[album].split('/')
+        path = os.path.join(base_path, user, 'files', *rest,
+                            f'IMG_{i:07d}.jpg')
+        with open(path, 'wb') as f:
+            f.write(build_jpeg(capture_time))
+        mtime = capture_time.timestamp()
+        os.utime(path, (mtime, mtime))
+    return list(dict.fromkeys(folders))
+
+
+def generate_photos(directory, n_files, sizes, seed=0):
+    from PIL import Image
+
+    rng = random.Random(seed)
+    filenames = []
+    for i in range(n_files):
+        size = rng.choice(sizes)
+        # A smooth gradient with some noise compresses like a real photo
+        # rather than like a flat image
+        image = Image.linear_gradient('L').resize(size).convert('RGB')
+        noise = Image.effect_noise(size, 32).convert('RGB')
+        image = Image.blend(image, noise, 0.3)
+        exif = image.getexif()
+        exif[0x0112] = rng.choice((1, 3, 6, 8))
+        filename = directory / f'IMG_{i:04d}.jpg'
+        image.save(filename, 'JPEG', quality=92, exif=exif)
+        filenames.append(str(filename))
+    return filenames
+
+
+def build_tiff_ifd(entries, offset, next_offset=0):
+    # Entries are (tag, type, count, value) with values that fit in place
+    data = struct.pack('<H', len(entries))
+    for tag, value_type, count, value in sorted(entries):
+        value_format = '<HH' if value_type == 3 and count == 1 else '<I'
+        value_data = struct.pack(value_format, *((value, 0) if value_format
+                                                 == '<HH' else (value, )))
+        data += struct.pack('<HHI', tag, value_type, count) + value_data
+    return data + struct.pack('<I', next_offset)
+
+
+def ifd_size(n_entries):
+    return 2 + 12 * n_entries + 4
+
+
+def build_raw(capture_time, preview, sensor_size, orientation=1, seed=0):
+    # TIFF-based RAW like a DNG or NEF: uncompressed RGB sensor data in
+    # IFD0, and the full-size JPEG preview in a SubIFD
+    width, height = sensor_size
+    time_bytes = capture_time.strftime('%Y:%m:%d %H:%M:%S').encode() + b'\x00'
+    ifd0_offset = 8
+    bits_offset = ifd0_offset + ifd_size(12)
+    sub_ifd_offset = bits_offset + 6
+    exif_ifd_offset = sub_ifd_offset + ifd_size(3)
+    time_offset = exif_ifd_offset + ifd_size(1)
+    preview_offset = time_offset + len(time_bytes)
+    sensor_offset = preview_offset + len(preview)
+    sensor_length = 3 * width * height
+
+    data = b'II*\x00' + struct.pack('<I', ifd0_offset)
+    data += build_tiff_ifd([(0x0100, 4, 1, width), (0x0101, 4, 1, height),
+                            (0x0102, 3, 3, bits_offset), (0x0103, 3, 1, 1),
+                            (0x0106, 3, 1, 2), (0x0111, 4, 1, sensor_offset),
+                            (0x0112, 3, 1, orientation), (0x0115, 3, 1, 3),
+                            (0x0116, 4, 1, height),
+                            (0x0117, 4, 1, sensor_length),
+                            (0x014a, 4, 1, sub_ifd_offset),
+                            (0x8769, 4, 1, exif_ifd_offset)], ifd0_offset)
+    data += struct.pack('<HHH', 8, 8, 8)
+    data += build_tiff_ifd([(0x0103, 3, 1, 6), (0x0201, 4, 1, preview_offset),
+                            (0x0202, 4, 1, len(preview))], sub_ifd_offset)
+    data += build_tiff_ifd([(0x9003, 2, len(time_bytes), time_offset)],
+                           exif_ifd_offset)
+    data += time_bytes + preview
+    return data + random.Random(seed).randbytes(sensor_length)
+
+
+def build_box(box_type, payload):
+    return struct.pack('>I', 8 + len(payload)) + box_type + payload
+
+
+def build_heif(capture_time, preview):
+    # HEIF with a JPEG item and an Exif item, with the HEVC coded image that
+    # a camera would also store left out
+    exif_tiff = build_exif_segment(capture_time)[10:]
+    exif_item = struct.pack('>I', 0) + exif_tiff
+    items = [(1, b'jpeg', preview), (2, b'Exif', exif_item)]
+
+    ftyp = build_box(b'ftyp', b'heic' + struct.pack('>I', 0) + b'mif1heic')
+    hdlr = build_box(b'hdlr',
+                     b'\x00' * 8 + b'pict' + b'\x00' * 12 + b'\x00')
+    iinf = build_box(
+        b'iinf',
+        b'\x00' * 4 + struct.pack('>H', len(items)) + b''.join(
+            build_box(b'infe',
+                      b'\x02\x00\x00\x00' + struct.pack('>HH', item_id, 0) +
+                      item_type + b'\x00') for item_id, item_type, _ in items))
+
+    def build_meta(data_offset):
+        iloc = b'\x00' * 4 + b'\x44\x00' + struct.pack('>H', len(items))
+        for item_id, _, item_data in items:
+            iloc += struct.pack('>HHHII', item_id, 0, 1, data_offset,
+                                len(item_data))
+            data_offset += len(item_data)
+        return build_box(b'meta',
+                         b'\x00' * 4 + hdlr + build_box(b'iloc', iloc) + iinf)
+
+    # The item offsets have a fixed width, so the size of the meta box does
+    # not depend on them
+    data_offset = len(ftyp) + len(build_meta(0)) + 8
+    mdat = build_box(b'mdat', b''.join(item_data for _, _, item_data in items))
+    return ftyp + build_meta(data_offset) + mdat
+
+
+NEXTCLOUD_SCHEMA_PATH = os.path.join(os.path.dirname(__file__), 'fixtures',
+                                     'nextcloud_filecache.sql')
+
+
+def load_nextcloud_filecache(database_path, base_path, seed=0):
+    # Fills a SQLite copy of the Nextcloud file cache tables with the
+    # <user>/files/... trees below the base path, as 'occ files:scan' would
+    import sqlite3
+    import hashlib
+    from scanner import read_image_type
+
+    rng = random.Random(seed)
+    connection = sqlite3.connect(database_path)
+    with open(NEXTCLOUD_SCHEMA_PATH) as f:
+        connection.executescript(f.read())
+
+    mimetypes = {}
+
+    def mimetype_id(mimetype):
+        if mimetype not in mimetypes:
+            mimetypes[mimetype] = len(mimetypes) + 1
+        return mimetypes[mimetype]
+
+    rows = []
+    for storage_id, user in enumerate(sorted(os.listdir(base_path)), start=1):
+        connection.execute(
+            'INSERT INTO oc_storages (numeric_id, id) VALUES (?, ?)',
+            (storage_id, f'home::{user}'))
+        user_path = os.path.join(base_path, user)
+        file_ids = {}
+        for directory, folder_names, file_names in os.walk(user_path):
+            folder_names.sort()
+            internal_path = os.path.relpath(directory, user_path).replace(
+                os.sep, '/')
+            internal_path = '' if internal_path == '.' else internal_path
+            entries = [(internal_path, directory, True)] + [
+                (f'{internal_path}/{name}'.lstrip('/'),
+                 os.path.join(directory, name), False)
+                for name in sorted(file_names)
+            ]
+            for path, full_path, is_folder in entries:
+                stat_result = os.stat(full_path)
+                if is_folder:
+                    mimetype = 'httpd/unix-directory'
+                else:
+                    mimetype = read_image_type(
+                        full_path) or 'application/octet-stream'
+                file_id = len(rows) + 1
+                file_ids[path] = file_id
+                rows.append(
+                    (file_id, storage_id, path,
+                     hashlib.md5(path.encode()).hexdigest(),
+                     file_ids.get(os.path.dirname(path), -1) if path else -1,
+                     os.path.basename(path), mimetype_id(mimetype),
+                     mimetype_id(mimetype.split('/')[0]), stat_result.st_size,
+                     int(stat_result.st_mtime), int(stat_result.st_mtime),
+                     '%013x' % rng.getrandbits(52)))
+    connection.executemany(
+        'INSERT INTO oc_mimetypes (id, mimetype) VALUES (?, ?)',
+        [(mimetype_id, mimetype)
+         for mimetype, mimetype_id in mimetypes.items()])
+    connection.executemany(
+        'INSERT INTO oc_filecache (fileid, storage, path, path_hash, parent, name, mimetype, mimepart, size, mtime, storage_mtime, etag) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        rows)
+    connection.commit()
+    connection.close()
@@ -0,0 +1,349 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from metadata import normalize_time_string
+
+FINGERPRINT_BYTES = 1 << 16
+# Stays well below the limit SQLite puts on the number of query parameters
+MAX_QUERY_PARAMETERS = 500
+
+
+def stat_files(filenames):
+    stats = {}
+    for filename in filenames:
+        try:
+            stats[filename] = os.stat(filename)
+        except OSError:
+            pass
+    return stats
+
+
+def fingerprint_file(filename, size):
+    # Cheap enough to compute for every new path, and unlikely to match for
+    # different photos since their headers and compressed data differ
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(filename, 'rb') as f:
+        digest.update(f.read(FINGERPRINT_BYTES))
+        if size > FINGERPRINT_BYTES:
+            f.seek(max(FINGERPRINT_BYTES, size - FINGERPRINT_BYTES))
+            digest.update(f.read(FINGERPRINT_BYTES))
+    return digest.hexdigest()
+
+
+def fingerprint_files(stats):
+    fingerprints = {}
+    for filename, stat_result in stats.items():
+        try:
+            fingerprints[filename] = fingerprint_file(filename,
+                                                      stat_result.st_size)
+        except OSError:
+            pass
+    return fingerprints
+
+
+def escape_like(text):
+    # '!' is used as the escape character since MySQL and SQLite disagree on
+    # how a backslash is written in the ESCAPE clause
+    return text.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+
+
+def placeholders(n):
+    return ', '.join('?' * n)
+
+
+def in_folders(directory, folders, recursive=False):
+    return any(directory == folder or recursive
+               and directory.startswith(os.path.join(folder, ''))
+               for folder in folders)
+
+
+def stat_matches(row, stat_result):
+    size, mtime_ns, inode = row
+    return size == stat_result.st_size and mtime_ns == stat_result.st_mtime_ns and inode == stat_result.st_ino
+
+
+class MetadataCatalog:
+    def __init__(self, path=':memory:'):
+        self._path = str(path)
+        self._created = self._path == ':memory:' or not os.path.exists(
+            self._path)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self._path,
+                                           check_same_thread=False)
+        if self._path != ':memory:':
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+        # Lets the entries replaced by INSERT OR REPLACE leave the day counts
+        # through the delete trigger
+        self._connection.execute('PRAGMA recursive_triggers=ON')
+        self._create_tables()
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def created(self):
+        return self._created
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute(
+                'SELECT COUNT(*) FROM files').fetchone()[0]
+
+    def lookup(self, stats, directory_rows=None):
+        # Batches of a scan share directories, so a scan passes the same
+        # directory_rows to every lookup to read each directory only once
+        directory_rows = {} if directory_rows is None else directory_rows
+        times = {}
+        stale_filenames = []
+        with self._lock:
+            for directory in set(map(os.path.dirname,
+                                     stats)).difference(directory_rows):
+                directory_rows[directory] = {
+                    path: ((size, mtime_ns, inode), time_string)
+                    for path, size, mtime_ns, inode, time_string in
+                    self._connection.execute(
+                        'SELECT path, size, mtime_ns, inode, time FROM files WHERE directory = ?',
+                        (directory, ))
+                }
+
+        for filename, stat_result in stats.items():
+            row = directory_rows[os.path.dirname(filename)].get(filename)
+            if row is not None and stat_matches(row[0], stat_result):
+                times[filename] = row[1]
+            else:
+                stale_filenames.append(filename)
+        return times, stale_filenames
+
+    def lookup_moved(self, stats, filenames):
+        # Files that are not cached under their path may have been moved or
+        # renamed, in which case an entry with the same content is reused
+        fingerprints = fingerprint_files(
+            {filename: stats[filename]
+             for filename in filenames})
+        known_times = {}
+        with self._lock:
+            for fingerprint_chunk in self._chunks(
+                    list(set(fingerprints.values()))):
+                known_times.update(
+                    self._connection.execute(
+                        f'SELECT fingerprint, time FROM files WHERE fingerprint IN ({placeholders(len(fingerprint_chunk))})',
+                        fingerprint_chunk))
+        times = {}
+        new_filenames = []
+        for filename in filenames:
+            time_string = known_times.get(fingerprints.get(filename))
+            if time_string is None:
+                new_filenames.append(filename)
+            else:
+                times[filename] = time_string
+        return times, new_filenames, fingerprints
+
+    def update(self, entries, fingerprints=None):
+        fingerprints = {} if fingerprints is None else fingerprints
+        rows = [(filename, os.path.dirname(filename), stat_result.st_size,
+                 stat_result.st_mtime_ns, stat_result.st_ino, time_string,
+                 fingerprints.get(filename))
+                for filename, stat_result, time_string in entries]
+        if not rows:
+            return
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO files (path, directory, size, mtime_ns, inode, time, fingerprint) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                rows)
+            self._remove_moved_from(
+                [row[-1] for row in rows if row[-1] is not None],
+                {row[0]
+                 for row in rows})
+
+    def remove(self, filenames):
+        with self._lock, self._connection:
+            self._connection.executemany('DELETE FROM files WHERE path = ?',
+                                         ((filename, )
+                                          for filename in filenames))
+
+    def collect_garbage(self,
+                        directories,
+                        existing_filenames,
+                        recursive=False,
+                        folders=None):
+        # Every file cached under a scanned directory, or below it when the
+        # scan was recursive, must have been found by the scan. Given the
+        # configured folders, the files outside all of them are dropped too.
+        existing_filenames = set(existing_filenames)
+        removed_filenames = []
+        with self._lock:
+            for directory in set(map(os.path.normpath, directories)):
+                if recursive:
+                    rows = self._connection.execute(
+                        "SELECT path FROM files WHERE directory = ? OR directory LIKE ? ESCAPE '!'",
+                        (directory,
+                         escape_like(os.path.join(directory, '')) + '%'))
+                else:
+                    rows = self._connection.execute(
+                        'SELECT path FROM files WHERE directory = ?',
+                        (directory, ))
+                removed_filenames.extend(path for path, in rows
+                                         if path not in existing_filenames)
+            if folders is not None:
+                folders = list(map(os.path.normpath, folders))
+                for directory, in self._connection.execute(
+                        'SELECT DISTINCT directory FROM files').fetchall():
+                    if not in_folders(directory, folders, recursive):
+                        removed_filenames.extend(
+                            path for path, in self._connection.execute(
+                                'SELECT path FROM files WHERE directory = ?',
+                                (directory, )))
+        if removed_filenames:
+            self.remove(removed_filenames)
+        return len(removed_filenames)
+
+    def day_counts(self, directory, recursive=False):
+        directory = os.path.normpath(str(directory))
+        with self._lock:
+            if not recursive:
+                return self._connection.execute(
+                    'SELECT day, count FROM day_counts WHERE directory = ?',
+                    (directory, )).fetchall()
+            return self._connection.execute(
+                '''SELECT day, SUM(count) FROM day_counts
+                WHERE directory = ? OR directory LIKE ? ESCAPE '!'
+                GROUP BY day''', (directory, escape_like(
+                    os.path.join(directory, '')) + '%')).fetchall()
+
+    def directories(self):
+        with self._lock:
+            return [
+                directory for directory, in self._connection.execute(
+                    'SELECT DISTINCT directory FROM day_counts ORDER BY directory')
+            ]
+
+    def filenames(self, directory):
+        with self._lock:
+            return [
+                path for path, in self._connection.execute(
+                    'SELECT path FROM files WHERE directory = ?', (str(
+                        directory), ))
+            ]
+
+    def scanned_mtimes(self, directories):
+        directories = list(map(str, directories))
+        mtimes = {}
+        with self._lock:
+            for directory_chunk in self._chunks(directories):
+                mtimes.update(
+                    self._connection.execute(
+                        f'SELECT directory, mtime_ns FROM scanned_directories WHERE directory IN ({placeholders(len(directory_chunk))})',
+                        directory_chunk))
+        return mtimes
+
+    def mark_scanned(self, directory_mtimes):
+        # Records that the entries of each directory were complete when it
+        # had the given modification time, so that its day counts can stand
+        # in for a scan until files are added, removed or renamed in it
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO scanned_directories (directory, mtime_ns) VALUES (?, ?)',
+                ((str(directory), mtime_ns)
+                 for directory, mtime_ns in directory_mtimes.items()))
+
+    def import_json(self, json_path):
+        try:
+            with open(json_path, 'r') as f:
+                file_times = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        entries = []
+        for filename, stat_result in stat_files(file_times).items():
+            time_string = normalize_time_string(file_times[filename])
+            if time_string is not None:
+                entries.append((filename, stat_result, time_string))
+        self.update(entries)
+        return len(entries)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _remove_moved_from(self, fingerprints, filenames):
+        # The old path of a moved file is usually outside the scanned
+        # folders, so garbage collection would never get to it
+        moved_from = []
+        for fingerprint_chunk in self._chunks(fingerprints):
+            moved_from.extend(
+                path for path, in self._connection.execute(
+                    f'SELECT path FROM files WHERE fingerprint IN ({placeholders(len(fingerprint_chunk))})',
+                    fingerprint_chunk)
+                if path not in filenames and not os.path.exists(path))
+        self._connection.executemany('DELETE FROM files WHERE path = ?',
+                                     ((path, ) for path in moved_from))
+
+    @staticmethod
+    def _chunks(values):
+        for start in range(0, len(values), MAX_QUERY_PARAMETERS):
+            yield values[start:start + MAX_QUERY_PARAMETERS]
+
+    def _create_tables(self):
+        with self._lock, self._connection:
+            self._connection.execute('''CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                directory TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                time TEXT NOT NULL,
+                fingerprint TEXT)''')
+            columns = [
+                row[1] for row in self._connection.execute(
+                    'PRAGMA table_info(files)')
+            ]
+            if 'fingerprint' not in columns:
+                # Entries from before fingerprints were stored get theirs
+                # when the file is next extracted
+                self._connection.execute(
+                    'ALTER TABLE files ADD COLUMN fingerprint TEXT')
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS files_directory ON files (directory)'
+            )
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS files_fingerprint ON files (fingerprint)'
+            )
+
+            has_day_counts = self._connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'day_counts'"
+            ).fetchone() is not None
+            self._connection.execute('''CREATE TABLE IF NOT EXISTS day_counts (
+                directory TEXT NOT NULL,
+                day TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (directory, day))''')
+            if not has_day_counts:
+                self._connection.execute('''INSERT INTO day_counts (directory, day, count)
+                    SELECT directory, substr(time, 1, 10), COUNT(*) FROM files
+                    GROUP BY directory, substr(time, 1, 10)''')
+            # The counts are kept up to date by SQLite itself, so no code
+            # path that adds or removes entries can forget about them. The
+            # conflict clause of INSERT OR REPLACE would also apply to the
+            # statements of the trigger, so they avoid conflicts instead.
+            self._connection.execute('''CREATE TRIGGER IF NOT EXISTS files_count_insert
+                AFTER INSERT ON files BEGIN
+                    INSERT INTO day_counts (directory, day, count)
+                    SELECT NEW.directory, substr(NEW.time, 1, 10), 0
+                    WHERE NOT EXISTS (SELECT 1 FROM day_counts
+                        WHERE directory = NEW.directory AND day = substr(NEW.time, 1, 10));
+                    UPDATE day_counts SET count = count + 1
+                    WHERE directory = NEW.directory AND day = substr(NEW.time, 1, 10);
+                END''')
+            self._connection.execute('''CREATE TRIGGER IF NOT EXISTS files_count_delete
+                AFTER DELETE ON files BEGIN
+                    UPDATE day_counts SET count = count - 1
+                    WHERE directory = OLD.directory AND day = substr(OLD.time, 1, 10);
+                    DELETE FROM day_counts
+                    WHERE directory = OLD.directory AND day = substr(OLD.time, 1, 10) AND count <= 0;
+                END''')
+            self._connection.execute('''CREATE TABLE IF NOT EXISTS scanned_directories (
+                directory TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL)''')
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import socket
+import argparse
+import threading
+import socketserver
+import collections
+import config
+from catalog import MetadataCatalog, stat_files
+from metadata import MetadataExtractor
+from scanner import ImageScanner
+from time_filter import TimeIndex
+from time_periods import parse_time_strings
+from log import setup_logging, log_info, log_error
+
+DEFAULT_SOCKET_PATH = config.SCRIPT_DIR / '.catalog.sock'
+DEFAULT_CACHE_PATH = config.SCRIPT_DIR / '.catalog_service.sqlite'
+
+FILENAME_ENCODING = 'utf-8'
+FILENAME_ERRORS = 'surrogateescape'
+
+FolderEntry = collections.namedtuple(
+    'FolderEntry', ['version', 'filenames', 'file_times', 'time_index'])
+
+
+class CatalogServiceError(Exception):
+    pass
+
+
+def encode_filenames(filenames):
+    # Paths are grouped by directory: an absolute path switches to a new
+    # directory and every other item is a file name within the current one
+    items = []
+    current_directory = None
+    for filename in filenames:
+        directory, basename = os.path.split(filename)
+        if directory != current_directory:
+            items.append(directory)
+            current_directory = directory
+        items.append(basename)
+    return '\0'.join(items).encode(FILENAME_ENCODING, FILENAME_ERRORS)
+
+
+def decode_filenames(payload):
+    if not payload:
+        return []
+    filenames = []
+    directory = None
+    for item in payload.decode(FILENAME_ENCODING,
+                               FILENAME_ERRORS).split('\0'):
+        if item.startswith('/'):
+            directory = item
+        else:
+            filenames.append(os.path.join(directory, item))
+    return filenames
+
+
+class CatalogService:
+    def __init__(self, catalog, metadata_extractor=None, scanner=None):
+        self._catalog = catalog
+        self._metadata_extractor = MetadataExtractor(
+        ) if metadata_extractor is None else metadata_extractor
+        self._scanner = ImageScanner() if scanner is None else scanner
+
+        self._lock = threading.Lock()
+        self._folders = {}
+        # A folder is built by one request at a time, while requests for
+        # other folders go on. Entries built across an invalidation are
+        # returned but not kept.
+        self._folder_locks = {}
+        self._generation = 0
+
+    def query(self, folders, time_strings):
+        times = parse_time_strings(time_strings)
+        compiled_filter = None if times.is_any() else times.compile()
+        filenames = []
+        n_files = 0
+        for folder in folders:
+            if not os.path.isabs(folder):
+                raise ValueError(f'Folder {folder} is not an absolute path')
+            entry = self._get_folder_entry(folder)
+            n_files += len(entry.filenames)
+            if compiled_filter is None:
+                filenames.extend(entry.filenames)
+            else:
+                filenames.extend(entry.time_index.select(compiled_filter))
+        return filenames, n_files
+
+    def invalidate(self, folders=None):
+        with self._lock:
+            self._generation += 1
+            if folders is None:
+                self._folders.clear()
+            else:
+                for folder in folders:
+                    self._folders.pop(folder, None)
+
+    def handle_request(self, request):
+        operation = request.get('operation')
+        if operation == 'ping':
+            return {'status': 'ok'}, b''
+        elif operation == 'invalidate':
+            self.invalidate(request.get('folders'))
+            return {'status': 'ok'}, b''
+        elif operation == 'query':
+            filenames, n_files = self.query(request['folders'],
+                                            request['times'])
+            payload = encode_filenames(filenames)
+            return {
+                'status': 'ok',
+                'count': len(filenames),
+                'total': n_files,
+                'size': len(payload)
+            }, payload
+        else:
+            raise ValueError(f'Unknown operation {operation}')
+
+    def serve(self, socket_path):
+        socket_path = str(socket_path)
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = CatalogServer(socket_path, self)
+        os.chmod(socket_path, 0o660)
+        return server
+
+    def _get_folder_entry(self, folder):
+        try:
+            version = os.stat(folder).st_mtime_ns
+        except OSError:
+            version = None
+        # Adding, removing or renaming a file updates the modification time
+        # of its folder, so the cached listing stays valid until then
+        with self._lock:
+            entry = self._folders.get(folder)
+            if entry is not None and entry.version == version:
+                return entry
+            folder_lock = self._folder_locks.setdefault(
+                folder, threading.Lock())
+        with folder_lock:
+            with self._lock:
+                entry = self._folders.get(folder)
+                generation = self._generation
+            if entry is not None and entry.version == version:
+                return entry
+            entry = self._build_folder_entry(folder, version)
+            with self._lock:
+                if self._generation == generation:
+                    self._folders[folder] = entry
+            return entry
+
+    def _build_folder_entry(self, folder, version):
+        if version is None:
+            return FolderEntry(None, [], {}, TimeIndex({}))
+        filenames = list(self._scanner.scan([folder]))
+        stats = stat_files(filenames)
+        file_times, new_filenames = self._catalog.lookup(stats)
+        moved_file_times, new_filenames, fingerprints = self._catalog.lookup_moved(
+            stats, new_filenames)
+        file_times.update(moved_file_times)
+        if new_filenames:
+            log_info(f'Processing {len(new_filenames)} new files.')
+        new_entries = [(filename, stats[filename], time_string)
+                       for filename, time_string in moved_file_times.items()]
+        for filename, time_string in zip(
+                new_filenames,
+                self._metadata_extractor.extract_times(new_filenames)):
+            if time_string is None:
+                log_error(f'Could not obtain time for {filename}.')
+                continue
+            file_times[filename] = time_string
+            new_entries.append((filename, stats[filename], time_string))
+        self._catalog.update(new_entries, fingerprints)
+        self._catalog.collect_garbage([folder],
+                                      filenames,
+                                      recursive=self._scanner.recursive)
+
+        file_times = {
+            filename: file_times[filename]
+            for filename in filenames if filename in file_times
+        }
+        return FolderEntry(version, filenames, file_times,
+                           TimeIndex(file_times))
+
+
+class CatalogRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                header, payload = self.server.service.handle_request(
+                    json.loads(line))
+            except (ValueError, KeyError, TypeError) as e:
+                header, payload = {'status': 'error', 'message': str(e)}, b''
+            self.wfile.write(json.dumps(header).encode() + b'\n' + payload)
+            self.wfile.flush()
+
+
+class CatalogServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, service):
+        self.service = service
+        super().__init__(socket_path, CatalogRequestHandler)
+
+
+class CatalogClient:
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, timeout=600.0):
+        self._socket_path = str(socket_path)
+        self._timeout = timeout
+
+    @property
+    def socket_path(self):
+        return self._socket_path
+
+    def ping(self):
+        self._request({'operation': 'ping'})
+
+    def invalidate(self, folders=None):
+        self._request({'operation': 'invalidate', 'folders': folders})
+
+    def query(self, folders, times):
+        header, payload = self._request({
+            'operation': 'query',
+            'folders': list(map(str, folders)),
+            'times': [str(time) for time in times.times]
+        })
+        return decode_filenames(payload), header['total']
+
+    def _request(self, request):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(self._timeout)
+            connection.connect(self._socket_path)
+            connection.sendall(json.dumps(request).encode() + b'\n')
+            with connection.makefile('rb') as f:
+                header = json.loads(f.readline())
+                if header.get('status') != 'ok':
+                    raise CatalogServiceError(
+                        header.get('message', 'Invalid response'))
+                payload = f.read(header.get('size', 0))
+        return header, payload
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Serve image listings filtered by time to several frames')
+    parser.add_argument('--socket', default=str(DEFAULT_SOCKET_PATH))
+    parser.add_argument('--cache', default=str(DEFAULT_CACHE_PATH))
+    args = parser.parse_args()
+
+    setup_logging(config.SCRIPT_DIR / 'catalog_log.txt')
+    service = CatalogService(MetadataCatalog(args.cache))
+    with service.serve(args.socket) as server:
+        log_info(f'Serving catalog on {args.socket}.')
+        server.serve_forever()
@@ -1,18 +1,40 @@
+#!/usr/bin/env python3
+
+import os
 import sys
 import six
+import json
+import time
+import fcntl
 import signal
+import socket
+import pathlib
+import threading
+import subprocess
+import socketserver
 import config
+from log import setup_logging, log_info, log_error
 from database import Database
 
 DEFAULT_MODE = 'standby'
 
+LOCK_DIR = config.SCRIPT_DIR / '.lock'
+CONTROL_SOCKET_PATH = pathlib.Path(
+    os.environ.get('DPF_CONTROL_SOCKET', LOCK_DIR / 'control.sock'))
+MODE_LOCK_PATH = LOCK_DIR / 'mode.lock'
+REPORT_TIMEOUT = 5.0
+
+
+class ModeSwitchError(Exception):
+    pass
+
 
 def get_config():
     return config.read_config()
 
 
 def get_database(config):
-    return Database.from_config(config)
+    return Database.from_config(config, persistent=True)
 
 
 def read_settings(mode, config, database):
@@ -23,9 +45,9 @@ def read_settings(mode, config, database):
     settings = list(config[table_name].keys())
 
     with database as open_database:
-        values = open_database.read_values_from_table(table_name, settings)
+        values = open_database.read_row(table_name, settings)
 
-    return dict(zip(settings, values))
+    return {} if values is None else values
 
 
 def update_mode_in_database(mode, config, open_database):
@@ -35,10 +57,70 @@ def update_mode_in_database(mode, config, open_database):
              current=config['modes']['current']['values'][mode]['value']))
 
 
+def request_daemon(request, timeout=None, socket_path=CONTROL_SOCKET_PATH):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.settimeout(timeout)
+        connection.connect(str(socket_path))
+        connection.sendall(json.dumps(request).encode() + b'\n')
+        with connection.makefile('rb') as f:
+            response = json.loads(f.readline() or 'null')
+    if response is None:
+        raise ModeSwitchError('No response from control daemon')
+    if response.get('status') != 'ok':
+        raise ModeSwitchError(response.get('message', 'Invalid response'))
+    return response
+
+
+def daemon_running(socket_path=CONTROL_SOCKET_PATH):
+    try:
+        request_daemon({'operation': 'status'},
+                       timeout=REPORT_TIMEOUT,
+                       socket_path=socket_path)
+    except (OSError, ValueError, ModeSwitchError):
+        return False
+    return True
+
+
+def report_mode(mode, config, database):
+    # When the control daemon runs it owns the mode and keeps the database
+    # row up to date as a mirror, otherwise the row is written directly
+    try:
+        request_daemon({
+            'operation': 'report',
+            'mode': mode
+        },
+                       timeout=REPORT_TIMEOUT)
+    except OSError:
+        with database as open_database:
+            update_mode_in_database(mode, config, open_database)
+    except (ValueError, ModeSwitchError) as e:
+        # The mode has to end up in the database even when the daemon
+        # rejects the report
+        log_error(f'Control daemon did not accept mode {mode}: {e}')
+        with database as open_database:
+            update_mode_in_database(mode, config, open_database)
+
+
+def report_shown(mode):
+    # Only the control daemon keeps track of whether the mode has shown
+    # anything yet, so there is nothing to do without it
+    try:
+        request_daemon({
+            'operation': 'shown',
+            'mode': mode
+        },
+                       timeout=REPORT_TIMEOUT)
+    except OSError:
+        pass
+    except (ValueError, ModeSwitchError) as e:
+        log_error(f'Could not report that mode {mode} is showing: {e}')
+
+
 def handle_shutdown(*args):
     config = get_config()
-    with get_database(config) as open_database:
-        update_mode_in_database(DEFAULT_MODE, config, open_database)
+    # A separate connection, since the signal may arrive while the persistent
+    # connection of the mode is in the middle of a query
+    report_mode(DEFAULT_MODE, config, Database.from_config(config))
     sys.exit(0)
 
 
@@ -50,12 +132,211 @@ def register_shutdown_handler():
 def enter_mode(mode, run_mode):
     config = get_config()
     database = get_database(config)
-    with database as open_database:
-        update_mode_in_database(mode, config, open_database)
+    # The control daemon waits for run_mode to report the mode once it is
+    # actually running, without it the mode counts as entered right away
+    if not daemon_running():
+        with database as open_database:
+            update_mode_in_database(mode, config, open_database)
     try:
         run_mode(mode, config, database)
     except:
         exc_info = sys.exc_info()
-        with database as open_database:
-            update_mode_in_database(DEFAULT_MODE, config, open_database)
+        report_mode(DEFAULT_MODE, config, database)
         six.reraise(*exc_info)
+
+
+class ModeDaemon:
+    def __init__(self,
+                 config,
+                 database,
+                 socket_path=CONTROL_SOCKET_PATH,
+                 lock_path=MODE_LOCK_PATH):
+        self._config = config
+        self._database = database
+        self._socket_path = pathlib.Path(socket_path)
+        self._lock_path = pathlib.Path(lock_path)
+        self._modes = config['modes']['current']['values']
+        self._timeout = config['control']['mode_switch_timeout']
+
+        self._switch_lock = threading.Lock()
+        self._condition = threading.Condition()
+        # Database writes are kept out of the condition, so that reports
+        # are not held up by a slow database
+        self._database_lock = threading.Lock()
+        self._n_reports = 0
+        self._showing = False
+        # Modes keep running when the daemon restarts, so the last mode they
+        # reported is the best guess for what is running now
+        self._mode = self._read_mode()
+
+    @property
+    def mode(self):
+        with self._condition:
+            return self._mode
+
+    @property
+    def showing(self):
+        with self._condition:
+            return self._showing
+
+    def switch(self, mode, skip_if_same=True):
+        if mode not in self._modes:
+            raise ValueError(f'Unknown mode {mode}')
+        with self._switch_lock, open(self._lock_path, 'a') as lock_file:
+            # The lock is held until the file is closed, and also keeps
+            # other processes from switching at the same time
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            current_mode = self.mode
+            if current_mode == mode and (skip_if_same
+                                         or mode == DEFAULT_MODE):
+                return mode
+
+            # The stop command, the start command and the wait for the
+            # report each take up to the timeout, which requestFromControlDaemon
+            # in the web interface allows for
+            start_time = time.monotonic()
+            self._run_mode_command(current_mode, 'stop_command')
+            with self._condition:
+                n_reports = self._n_reports
+            self._run_mode_command(mode, 'start_command')
+            with self._condition:
+                started = self._condition.wait_for(
+                    lambda: self._n_reports > n_reports, self._timeout)
+                if not started:
+                    self._mode = DEFAULT_MODE
+                new_mode = self._mode
+            if not started:
+                self._store_mode()
+                raise ModeSwitchError(
+                    f'Mode {mode} did not start within {self._timeout:g} s')
+            if new_mode != mode:
+                raise ModeSwitchError(f'Mode {mode} exited before it started')
+            log_info(
+                f'Switched from {current_mode} to {mode} in {time.monotonic() - start_time:.2f} s.'
+            )
+            return mode
+
+    def report(self, mode):
+        if mode not in self._modes:
+            raise ValueError(f'Unknown mode {mode}')
+        with self._condition:
+            self._mode = mode
+            self._showing = False
+            self._n_reports += 1
+            self._condition.notify_all()
+        self._store_mode()
+
+    def shown(self, mode):
+        if mode not in self._modes:
+            raise ValueError(f'Unknown mode {mode}')
+        with self._condition:
+            # A late message from a mode that has since been left is ignored
+            if self._mode == mode:
+                self._showing = True
+
+    def handle_request(self, request):
+        operation = request.get('operation')
+        if operation == 'status':
+            return {'status': 'ok', 'mode': self.mode, 'showing': self.showing}
+        elif operation == 'report':
+            self.report(request['mode'])
+            return {'status': 'ok', 'mode': self.mode}
+        elif operation == 'shown':
+            self.shown(request['mode'])
+            return {'status': 'ok', 'mode': self.mode}
+        elif operation == 'switch':
+            mode = self.switch(request['mode'],
+                               request.get('skip_if_same', True))
+            return {'status': 'ok', 'mode': mode}
+        else:
+            raise ValueError(f'Unknown operation {operation}')
+
+    def serve(self):
+        if daemon_running(self._socket_path):
+            raise ModeSwitchError(
+                f'Control daemon already running on {self._socket_path}')
+        self._socket_path.parent.mkdir(parents=True, exist_ok=True)
+        socket_path = str(self._socket_path)
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = ControlServer(socket_path, self)
+        # The web server connects through its group
+        os.chmod(socket_path, 0o660)
+        return server
+
+    def _store_mode(self):
+        # The mode is read under the lock, so that the last write is of the
+        # latest mode when reports arrive at the same time
+        with self._database_lock:
+            mode = self.mode
+            try:
+                with self._database as open_database:
+                    update_mode_in_database(mode, self._config,
+                                            open_database)
+            except Exception as e:
+                log_error(f'Could not store mode {mode} in database: {e}')
+
+    def _read_mode(self):
+        mode_names = {
+            content['value']: name
+            for name, content in self._modes.items()
+        }
+        try:
+            with self._database as open_database:
+                value = open_database.read_values_from_table(
+                    'modes', 'current')
+        except Exception as e:
+            log_error(f'Could not read mode from database: {e}')
+            return DEFAULT_MODE
+        return mode_names.get(value, DEFAULT_MODE)
+
+    def _run_mode_command(self, mode, command_name):
+        command = self._modes[mode][command_name]
+        if command is None:
+            return
+        result = subprocess.run(command,
+                                shell=True,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT,
+                                text=True,
+                                timeout=self._timeout)
+        if result.returncode != 0:
+            raise ModeSwitchError(
+                f'{command_name} of mode {mode} failed with error code {result.returncode}: {result.stdout}'
+            )
+
+
+class ControlRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.mode_daemon.handle_request(json.loads(line))
+            except (ValueError, KeyError, TypeError, OSError,
+                    subprocess.TimeoutExpired, ModeSwitchError) as e:
+                log_error(f'Control request failed: {e}')
+                response = {'status': 'error', 'message': str(e)}
+            self.wfile.write(json.dumps(response).encode() + b'\n')
+            self.wfile.flush()
+
+
+class ControlServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, mode_daemon):
+        self.mode_daemon = mode_daemon
+        super().__init__(socket_path, ControlRequestHandler)
+
+
+def run_daemon():
+    setup_logging(config.SCRIPT_DIR / 'control_log.txt')
+    daemon_config = get_config()
+    daemon = ModeDaemon(daemon_config, get_database(daemon_config))
+    with daemon.serve() as server:
+        log_info(
+            f'Control daemon serving on {CONTROL_SOCKET_PATH} in mode {daemon.mode}.'
+        )
+        server.serve_forever()
+
+
+if __name__ == '__main__':
+    run_daemon()
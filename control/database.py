@@ -1,65 +1,79 @@
-import mysql.connector
+import threading
 
 
 class Database:
     @staticmethod
-    def from_config(config):
+    def from_config(config, persistent=False):
         db_info = config['database']
         account_info = db_info['account']
-        return Database(account_info['host'], account_info['user'],
-                        account_info['password'], db_info['name'])
+        return Database(account_info['host'],
+                        account_info['user'],
+                        account_info['password'],
+                        db_info['name'],
+                        persistent=persistent)
 
-    def __init__(self, host, user, password, name, **extra_config):
+    def __init__(self,
+                 host,
+                 user,
+                 password,
+                 name,
+                 persistent=False,
+                 **extra_config):
         self.host = host
         self.user = user
         self.password = password
         self.name = name
+        self.persistent = persistent
         self.extra_config = extra_config
 
-    def __enter__(self):
-        self.connection = mysql.connector.connect(host=self.host,
-                                                  user=self.user,
-                                                  password=self.password,
-                                                  database=self.name,
-                                                  **self.extra_config)
-        self.connection.autocommit = True
-
-        self.cursor = self.connection.cursor(dictionary=True)
+        self.connection = None
+        self.cursor = None
+        self._prepared_cursors = {}
+        self._lock = threading.RLock()
 
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            if self.connection is None:
+                self._connect()
+        except:
+            self._lock.release()
+            raise
         return self
 
     def update_values_in_table(self,
                                table_name,
                                column_values,
                                condition_key='id'):
-        updates = ''
-        condition = None
-        for name, value in column_values.items():
-            if name == condition_key:
-                condition = '`{}` = {}'.format(name, value)
-            else:
-                if value is None:
-                    value = 'NULL'
-                elif isinstance(value, str):
-                    value = "'{}'".format(value)
-                updates += '`{}` = {}, '.format(name, value)
-
-        if condition is None:
+        if condition_key not in column_values:
             raise ValueError(
                 'No value provided for condition key {}'.format(condition_key))
 
-        if len(column_values) > 1:
-            updates = updates[:-2]
+        names = [name for name in column_values if name != condition_key]
+        updates = ', '.join('`{}` = %s'.format(name) for name in names)
+        statement = 'UPDATE `{}` SET {} WHERE `{}` = %s;'.format(
+            table_name, updates, condition_key)
+        values = [column_values[name] for name in names]
+        self._execute(statement,
+                      values + [column_values[condition_key]],
+                      prepared=True)
 
-        self.cursor.execute('UPDATE `{}` SET {} WHERE {};'.format(
-            table_name, updates, condition))
+    def read_row(self, table_name, columns, condition_key='id', key_value=0):
+        self._execute(
+            'SELECT {} FROM `{}` WHERE `{}` = %s;'.format(
+                ', '.join('`{}`'.format(name) for name in columns),
+                table_name, condition_key), (key_value, ))
+        rows = self.cursor.fetchall()
+        if not rows:
+            return None
+        return {name: rows[0][name] for name in columns}
 
     def read_values_from_table(self, table_name, columns, condition='id = 0'):
         multiple_columns = hasattr(
             columns, '__iter__') and not isinstance(columns, str)
         column_string = ', '.join(columns) if multiple_columns else columns
 
-        self.cursor.execute('SELECT {} FROM `{}` WHERE {};'.format(
+        self._execute('SELECT {} FROM `{}` WHERE {};'.format(
             column_string, table_name, condition))
         result = self.cursor.fetchall()
 
@@ -71,10 +85,58 @@ class Database:
             result = result[0]
         return result
 
+    def read_rows(self, statement, params=None):
+        self._execute(statement, params)
+        return self.cursor.fetchall()
+
     def close(self):
-        self.connection.close()
+        if self.connection is not None:
+            self.connection.close()
         self.connection = None
         self.cursor = None
+        self._prepared_cursors = {}
 
     def __exit__(self, *args):
+        try:
+            if not self.persistent:
+                self.close()
+        finally:
+            self._lock.release()
+
+    def _connect(self):
+        # Imported here since loading the connector takes a noticeable part of
+        # the startup time on the frame
+        import mysql.connector
+
         self.close()
+        self.connection = mysql.connector.connect(host=self.host,
+                                                  user=self.user,
+                                                  password=self.password,
+                                                  database=self.name,
+                                                  **self.extra_config)
+        self.connection.autocommit = True
+
+        self.cursor = self.connection.cursor(dictionary=True)
+
+    def _execute(self, statement, params=None, prepared=False):
+        import mysql.connector
+
+        try:
+            self._get_cursor(statement, prepared).execute(statement, params)
+        except (mysql.connector.errors.OperationalError,
+                mysql.connector.errors.InterfaceError):
+            if not self.persistent:
+                raise
+            # The long-lived connection may have been dropped by the server,
+            # so reconnect and retry once
+            self._connect()
+            self._get_cursor(statement, prepared).execute(statement, params)
+
+    def _get_cursor(self, statement, prepared):
+        if not prepared:
+            return self.cursor
+        cursor = self._prepared_cursors.get(statement)
+        if cursor is None:
+            cursor = self.connection.cursor(prepared=True)
+            self._prepared_cursors[statement] = cursor
+        return cursor
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import bisect
+import argparse
+import itertools
+import collections
+from time_filter import day_string_key, key_date
+
+PERIOD_LENGTHS = {'year': 4, 'month': 7, 'day': 10}
+
+
+class DateHistogram:
+    def __init__(self, day_counts):
+        counts = collections.Counter()
+        for day_string, count in day_counts:
+            try:
+                counts[day_string_key(day_string)] += count
+            except ValueError:
+                continue
+        self._keys = sorted(counts)
+        self._day_counts = [counts[key] for key in self._keys]
+        # Any range of days is counted from two prefix sums, so a filter
+        # costs a couple of bisections per interval however many files match
+        self._cumulative_counts = [0] + list(
+            itertools.accumulate(self._day_counts))
+
+    @property
+    def total(self):
+        return self._cumulative_counts[-1]
+
+    @property
+    def year_range(self):
+        if not self._keys:
+            return None
+        return key_date(self._keys[0]).year, key_date(self._keys[-1]).year
+
+    def count(self, compiled_filter):
+        if not self._keys:
+            return 0
+        n_files = 0
+        for start, end in compiled_filter.intervals_for_years(
+                *self.year_range):
+            first = bisect.bisect_left(self._keys, start)
+            last = bisect.bisect_left(self._keys, end, lo=first)
+            n_files += self._cumulative_counts[
+                last] - self._cumulative_counts[first]
+        return n_files
+
+    def counts_per(self, period):
+        length = PERIOD_LENGTHS[period]
+        counts = collections.Counter()
+        for key, count in zip(self._keys, self._day_counts):
+            counts[key_date(key).isoformat()[:length]] += count
+        return dict(counts)
+
+
+def folder_histogram(catalog, folder, recursive=False):
+    return DateHistogram(catalog.day_counts(folder, recursive=recursive))
+
+
+def count_matches(catalog, folders, times, recursive=False):
+    compiled_filter = times.compile()
+    matches = {}
+    for folder in map(str, folders):
+        histogram = folder_histogram(catalog, folder, recursive=recursive)
+        matches[folder] = (histogram.total if times.is_any() else
+                           histogram.count(compiled_filter), histogram.total)
+    return matches
+
+
+def open_catalog(path):
+    if str(path).endswith('.log'):
+        from record_log import RecordLogCatalog
+        return RecordLogCatalog(path)
+    from catalog import MetadataCatalog
+    return MetadataCatalog(path)
+
+
+if __name__ == '__main__':
+    import digital_photo_frame as dpf
+    from time_periods import parse_time_strings
+
+    parser = argparse.ArgumentParser(
+        description=
+        'Count the cached images that a times setting would include, without scanning'
+    )
+    parser.add_argument('times', help='times setting, like "2005 - 03.2012, 12.2015"')
+    parser.add_argument('folders',
+                        nargs='*',
+                        help='folders to count, all cached ones by default')
+    parser.add_argument('--catalog',
+                        default=str(dpf.SCRIPT_DIR /
+                                    dpf.CATALOG_FORMATS['sqlite']))
+    parser.add_argument('--recursive', action='store_true')
+    parser.add_argument('--per',
+                        choices=sorted(PERIOD_LENGTHS),
+                        help='also list the number of images per period')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.catalog):
+        sys.exit(f'No catalog at {args.catalog}')
+    try:
+        times = parse_time_strings(args.times.split(','))
+    except ValueError as e:
+        sys.exit(str(e))
+    catalog = open_catalog(args.catalog)
+    folders = [os.path.normpath(folder) for folder in args.folders
+               ] if args.folders else catalog.directories()
+    matches = count_matches(catalog, folders, times, recursive=args.recursive)
+    periods = {}
+    if args.per is not None:
+        periods = {
+            folder: folder_histogram(catalog,
+                                     folder,
+                                     recursive=args.recursive).counts_per(
+                                         args.per)
+            for folder in folders
+        }
+    catalog.close()
+
+    n_included = sum(included for included, _ in matches.values())
+    n_files = sum(total for _, total in matches.values())
+    if args.json:
+        print(
+            json.dumps({
+                'times': str(times),
+                'included': n_included,
+                'files': n_files,
+                'folders': {
+                    folder: {
+                        'included': included,
+                        'files': total,
+                        **({
+                            args.per: periods[folder]
+                        } if args.per is not None else {})
+                    }
+                    for folder, (included, total) in matches.items()
+                }
+            }))
+    else:
+        for folder, (included, total) in matches.items():
+            print(f'{included:8d} of {total:8d}  {folder}')
+            for period, count in sorted(periods.get(folder, {}).items()):
+                print(f'{"":>22}{period:<12}{count:8d}')
+        print(f'Including {n_included} of {n_files} files for {times}.')
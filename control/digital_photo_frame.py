@@ -1,34 +1,30 @@
-import sys
 import os
-import logging
 import re
 import pathlib
 import datetime
 import time
 import subprocess
-import json
-from inotify.adapters import Inotify
-from inotify.constants import IN_MODIFY, IN_CLOSE
+import threading
+import hashlib
+import functools
+import itertools
+from metadata import MetadataExtractor
+from catalog import MetadataCatalog, stat_files
+from scanner import ImageScanner
+from time_filter import TimeIndex, day_keys
+from time_periods import (Time, TimePeriod, TimePeriods, ANY_TIME_PERIOD,
+                          TIME_STRING_RE)
+from log import setup_logging, log_info, log_error
+from catalog_service import CatalogClient, CatalogServiceError
+from date_histogram import folder_histogram
+import metrics
+import profiling
+from playlist import PlaylistWriter, write_atomically
+from pipeline import Pipeline, batched
 
 SCRIPT_DIR = pathlib.Path(os.path.dirname(os.path.realpath(__file__)))
 
 
-def setup_logging(filename, level=logging.INFO):
-    logging.basicConfig(level=level,
-                        filename=filename,
-                        format='%(asctime)s: %(message)s')
-
-
-def log_info(message):
-    logging.info('INFO: %s', message)
-
-
-def log_error(message, abort=False):
-    logging.error('ERROR: %s', message)
-    if abort:
-        sys.exit(1)
-
-
 def setup_screen(username):
     os.environ['DISPLAY'] = ':0'
     os.environ['XAUTHORITY'] = f'/home/{username}/.Xauthority'
@@ -36,162 +32,6 @@ def setup_screen(username):
         os.environ['HOME'] = '/home/{username}'
 
 
-class Time:
-    def __init__(self, day, month, year):
-        self.day = day
-        self.month = month
-        self.year = year
-
-    @staticmethod
-    def any():
-        return Time(None, None, None)
-
-    @staticmethod
-    def from_string(time_string):
-        if time_string == 'any':
-            return any()
-        parts = re.split(r'\.|\/', time_string)
-        if len(parts) == 1:
-            return Time(None, None, int(parts[0]))
-        elif len(parts) == 2:
-            return Time(None, int(parts[0]), int(parts[1]))
-        elif len(parts) == 3:
-            return Time(int(parts[0]), int(parts[1]), int(parts[2]))
-        else:
-            log_error(f'Invalid format for time string {time_string}.',
-                      abort=True)
-
-    def includes(self, date):
-        return (self.year is None or date.year == self.year) and (
-            self.month is None or date.month
-            == self.month) and (self.day is None or date.day == self.day)
-
-    def __eq__(self, other):
-        return isinstance(
-            other, self.__class__
-        ) and other.year == self.year and other.month == self.month and other.day == self.day
-
-    def __ne__(self, other):
-        return not isinstance(
-            other, self.__class__
-        ) or other.year != self.year or other.month != self.month or other.day != self.day
-
-    def __le__(self, other):
-        if self.year is None or other.year is None or self.year < other.year:
-            return True
-        elif self.year == other.year:
-            if self.month is None or other.month is None or self.month < other.month:
-                return True
-            elif self.month == other.month:
-                if self.day is None or other.day is None or self.day <= other.day:
-                    return True
-                else:
-                    return False
-            else:
-                return False
-        else:
-            return False
-
-    def __ge__(self, other):
-        if self.year is None or other.year is None or self.year > other.year:
-            return True
-        elif self.year == other.year:
-            if self.month is None or other.month is None or self.month > other.month:
-                return True
-            elif self.month == other.month:
-                if self.day is None or other.day is None or self.day >= other.day:
-                    return True
-                else:
-                    return False
-            else:
-                return False
-        else:
-            return False
-
-    def __repr__(self):
-        return '{}{}{}'.format(
-            '' if self.day is None else f'{self.day:02d}.',
-            '' if self.month is None else f'{self.month:02d}.',
-            'any' if self.year is None else f'{self.year:d}')
-
-
-class TimePeriod:
-    def __init__(self, start_time, end_time):
-        self.start_time = start_time
-        self.end_time = end_time
-
-    @staticmethod
-    def string_is_valid(string):
-        return len(string.split('-')) == 2
-
-    @staticmethod
-    def from_string(time_period_string):
-        start_time_string, end_time_string = tuple(
-            map(str.strip, time_period_string.split('-')))
-        return TimePeriod(Time.from_string(start_time_string),
-                          Time.from_string(end_time_string))
-
-    @staticmethod
-    def from_strings(start_time_string, end_time_string):
-        return TimePeriod(Time.from_string(start_time_string),
-                          Time.from_string(end_time_string))
-
-    def includes(self, date):
-        return self.start_time <= date and self.end_time >= date
-
-    def __eq__(self, other):
-        return isinstance(
-            other, self.__class__
-        ) and other.start_time == self.start_time and other.end_time == self.end_time
-
-    def __ne__(self, other):
-        return not isinstance(
-            other, self.__class__
-        ) or other.start_time != self.start_time or other.end_time != self.end_time
-
-    def __repr__(self):
-        return f'{self.start_time} - {self.end_time}'
-
-
-class TimePeriods:
-    def __init__(self, *time_strings):
-        if 'any' in time_strings:
-            self.times = [Time.any()]
-        else:
-            self.times = list(
-                map(
-                    lambda time_string: TimePeriod.from_string(time_string)
-                    if TimePeriod.string_is_valid(time_string) else Time.
-                    from_string(time_string), time_strings))
-
-    @staticmethod
-    def any():
-        return TimePeriods('any')
-
-    def is_any(self):
-        return self == ANY_TIME_PERIOD
-
-    def includes(self, date):
-        return len(list(filter(lambda time: time.includes(date),
-                               self.times))) > 0
-
-    def __eq__(self, other):
-        return isinstance(other, self.__class__) and len(other.times) == len(
-            self.times) and all(
-                (a == b for a, b in zip(self.times, other.times)))
-
-    def __ne__(self, other):
-        return not isinstance(other, self.__class__) or len(
-            other.times) != len(self.times) or any(
-                (a != b for a, b in zip(self.times, other.times)))
-
-    def __repr__(self):
-        return ", ".join(map(str, self.times))
-
-
-ANY_TIME_PERIOD = TimePeriods.any()
-
-
 class StandardFileLocator:
     def __init__(self, check_validity=True):
         self.check_validity = check_validity
@@ -251,10 +91,6 @@ class Settings:
 
         self._change_flags = {'any': False}
 
-        self._time_text_re = re.compile(
-            r'(any|((?:\d\d?[\.\/])?(?:\d\d?[\.\/])?(?:\d{4})(?:\s*-\s*(?:\d\d?[\.\/])?(?:\d\d?[\.\/])?(?:\d{4}))?))',
-            flags=re.IGNORECASE)
-
     @property
     def file_locator(self):
         return self._file_locator
@@ -345,7 +181,7 @@ class Settings:
         return valid_paths
 
     def _process_times_text(self, time_text, error_message=None):
-        matches = [match[0] for match in self._time_text_re.findall(time_text)]
+        matches = TIME_STRING_RE.findall(time_text)
         if not matches:
             if error_message is not None:
                 log_error(error_message)
@@ -355,6 +191,10 @@ class Settings:
     def get_change_flag(self, flag):
         return self._change_flags.get(flag, False)
 
+    def get_changed_flags(self):
+        return set(flag for flag, changed in self._change_flags.items()
+                   if changed and flag != 'any')
+
     def reset_change_flags(self):
         for flag in self._change_flags:
             self._change_flags[flag] = False
@@ -388,6 +228,9 @@ class SettingsFile(Settings):
     def file_path(self):
         return self._file_path
 
+    def read_version(self):
+        return self.file_path.stat().st_mtime_ns
+
     def read_settings(self):
         if not self.file_path.is_file():
             log_error(f'Config file \'{self.file_path}\' does not exist.',
@@ -446,14 +289,27 @@ class SettingsDatabase(Settings):
         super().__init__(*args, **kwargs)
         self._database = database
         self._table_name = 'display_settings'
+        self._columns = ['folders', 'times', 'delay', 'randomize', 'preload']
+        self._version_table_name = 'settings_versions'
+        self._version_column = 'display'
+
+    def read_version(self):
+        with self._database as database:
+            return database.read_values_from_table(self._version_table_name,
+                                                   self._version_column)
 
     def read_settings(self):
         with self._database as database:
-            self._parse_settings(database)
+            row = database.read_row(self._table_name, self._columns)
+        if row is None:
+            log_error(
+                f'No settings in table {self._table_name} of database {self._database.name}.'
+            )
+            return
+        self._parse_settings(row)
 
-    def _parse_folders(self, database):
-        folders_text = database.read_values_from_table(self._table_name,
-                                                       'folders')
+    def _parse_folders(self, row):
+        folders_text = row['folders']
         if folders_text is None:
             return None
         return self._process_folders_text(
@@ -462,8 +318,8 @@ class SettingsDatabase(Settings):
             f'No valid folders specified in \'folders\' entry in database {self._database.name}.'
         )
 
-    def _parse_times(self, database):
-        times_text = database.read_values_from_table(self._table_name, 'times')
+    def _parse_times(self, row):
+        times_text = row['times']
         if times_text is None:
             return None
         return self._process_times_text(
@@ -471,54 +327,133 @@ class SettingsDatabase(Settings):
             error_message=
             f'No valid \'times\' entry in database {self._database.name}.')
 
-    def _parse_delay(self, database):
-        delay = database.read_values_from_table(self._table_name, 'delay')
+    def _parse_delay(self, row):
+        delay = row['delay']
         if delay is None:
             return self.delay
         else:
             return float(delay)
 
-    def _parse_randomize(self, database):
-        randomize = database.read_values_from_table(self._table_name,
-                                                    'randomize')
+    def _parse_randomize(self, row):
+        randomize = row['randomize']
         if randomize is None:
             return self.randomize
         else:
             return bool(randomize)
 
-    def _parse_preload(self, database):
-        preload = database.read_values_from_table(self._table_name, 'preload')
+    def _parse_preload(self, row):
+        preload = row['preload']
         if preload is None:
             return self.preload
         else:
             return bool(preload)
 
 
+CATALOG_FORMATS = {'sqlite': '.filedata.sqlite', 'log': '.filedata.log'}
+# Number of files extracted between checks for a cancelled scan
+EXTRACTION_BATCH_SIZE = 256
+
+
+class ScanCancelled(Exception):
+    pass
+
+
 class FileManager:
-    def __init__(self, settings, cache_data=True):
+    def __init__(self,
+                 settings,
+                 cache_data=True,
+                 metadata_extractor=None,
+                 scanner=None,
+                 columnar=False,
+                 render_cache=None,
+                 fast_start=False,
+                 catalog_format='sqlite',
+                 catalog_service_path=None,
+                 io_scheduler=None,
+                 stream_batch_size=None,
+                 preview_cache=None,
+                 cancel_event=None):
         self._settings = settings
-        self.settings.read_settings()
+        # Set from another thread to abandon a running scan, after which
+        # the file manager is not used anymore
+        self._cancel_event = threading.Event(
+        ) if cancel_event is None else cancel_event
+        with profiling.phase('settings'):
+            self._read_settings()
         self.settings.reset_change_flags()
 
         self._cache_data = cache_data
+        self._columnar = False
+        if columnar:
+            # NumPy takes a while to import, so it is only loaded when needed
+            from file_table import numpy_available
+            self._columnar = numpy_available()
+            if not self._columnar:
+                log_error(
+                    'NumPy is not available, using dict-based file times.')
+        self._io_scheduler = io_scheduler
+        self._stream_batch_size = stream_batch_size
+        self._metadata_extractor = MetadataExtractor(
+            scheduler=io_scheduler, preview_cache=preview_cache
+        ) if metadata_extractor is None else metadata_extractor
+        self._scanner = ImageScanner() if scanner is None else scanner
+        self._preview_cache = preview_cache
+        self._render_cache = render_cache
+        self._catalog_client = None
+        if catalog_service_path is not None:
+            self._catalog_client = CatalogClient(catalog_service_path)
 
         self._file_list_path = SCRIPT_DIR / '.filelist.txt'
-        self._file_data_path = SCRIPT_DIR / '.filedata.json'
+        self._file_list_tag_path = SCRIPT_DIR / '.filelist.tag'
+        self._playlist_writer = PlaylistWriter(self._file_list_path)
+        self._file_list_tag = None
+        if catalog_format not in CATALOG_FORMATS:
+            raise ValueError(f'Invalid catalog format {catalog_format}')
+        self._catalog_format = catalog_format
+        self._file_data_path = SCRIPT_DIR / CATALOG_FORMATS[catalog_format]
+        self._legacy_file_data_path = SCRIPT_DIR / '.filedata.json'
 
-        self._filenames = []
-        self._read_filenames()
+        self._lock = threading.RLock()
 
-        self._all_file_times = {}
-        self._file_times = {}
-        if not self.settings.times.is_any():
-            if self._cache_data:
-                self._read_cached_file_times()
-            self._update_file_times()
+        with profiling.phase('catalog'):
+            self._catalog = self._open_catalog()
 
+        self._filenames = []
+        self._folder_mtimes = {}
+        self._skipped_folders = set()
+        self._file_times = {}
+        self._time_index = None
         self._filtered_filenames = []
-        self._update_filtered_filenames()
+        # Stats of the listed files for the caches, taken once per scan
+        # rather than on every write of the list
+        self._list_stats = {}
+        self._list_ready = True
+
+        # With fast start, a file list built from the same settings is shown
+        # as is until refresh_if_stale has rebuilt it
+        self._stale = fast_start and self._file_list_matches_settings()
+        if self._stale:
+            log_info('Starting from the previous file list.')
+            profiling.report()
+            return
 
-        self.update_file_list()
+        # When streaming, refresh_if_stale builds the list and writes the
+        # first matching files as soon as it has them
+        if stream_batch_size is not None and self._catalog_client is None:
+            self._stale = True
+            self._list_ready = False
+            return
+
+        with profiling.phase('scan'):
+            self._read_filenames()
+        if not self.settings.times.is_any():
+            with profiling.phase('file_times'):
+                self._update_file_times()
+        with profiling.phase('filter'):
+            self._update_filtered_filenames()
+        with profiling.phase('file_list'):
+            self.update_file_list()
+        profiling.report()
 
     @property
     def settings(self):
@@ -532,113 +467,632 @@ class FileManager:
     def feh_arguments(self):
         return self.settings.feh_arguments + ['-f', str(self.file_list_path)]
 
-    def reread_settings(self):
-        self.settings.read_settings()
+    @property
+    def is_stale(self):
+        return self._stale
 
-        files_changed = False
+    @property
+    def is_list_ready(self):
+        return self._list_ready
 
-        if self.settings.get_change_flag('folders'):
+    def reread_settings(self):
+        with self._lock:
+            with profiling.phase('reread_settings'):
+                self._read_settings()
+
+            changed_flags = self.settings.get_changed_flags()
+            if self._stale:
+                self.settings.reset_change_flags()
+                with profiling.phase('reread_rescan'):
+                    self.rescan()
+                profiling.report()
+                return changed_flags
+
+            files_changed = False
+
+            if self.settings.get_change_flag('folders'):
+                with profiling.phase('reread_scan'):
+                    self._read_filenames()
+                if not self.settings.times.is_any():
+                    with profiling.phase('reread_file_times'):
+                        self._update_file_times()
+                files_changed = True
+
+            if self.settings.get_change_flag('times'):
+                if self._skipped_folders:
+                    # Folders left out for the previous times may have
+                    # files within the new ones
+                    with profiling.phase('reread_scan'):
+                        self._read_filenames()
+                if not self.settings.times.is_any():
+                    with profiling.phase('reread_file_times'):
+                        self._update_file_times()
+                files_changed = True
+
+            self.settings.reset_change_flags()
+
+            if files_changed:
+                with profiling.phase('reread_filter'):
+                    self._update_filtered_filenames()
+                with profiling.phase('reread_file_list'):
+                    self.update_file_list()
+
+            profiling.report()
+            return changed_flags
+
+    def rescan(self):
+        with self._lock:
             self._read_filenames()
             if not self.settings.times.is_any():
                 self._update_file_times()
-            files_changed = True
+            self._update_filtered_filenames()
+            self._stale = False
+            return self.update_file_list()
 
-        if self.settings.get_change_flag('times'):
-            if not self.settings.times.is_any() and len(
-                    self._all_file_times) == 0:
-                if self._cache_data:
-                    self._read_cached_file_times()
-                self._update_file_times()
-            files_changed = True
+    def refresh_if_stale(self, on_first_batch=None):
+        with self._lock:
+            if not self._stale:
+                return False
+            if self._stream_batch_size is None or (self._catalog_client
+                                                   is not None):
+                return self.rescan()
+            return self._rescan_streaming(on_first_batch)
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def apply_file_changes(self, changed_filenames, removed_filenames):
+        with self._lock:
+            if self._stale:
+                # The pending refresh picks up these changes anyway
+                return
+            for filename in itertools.chain(changed_filenames,
+                                            removed_filenames):
+                self._list_stats.pop(filename, None)
+            if self._catalog_client is not None:
+                # The service notices the changes through the folder times
+                self._update_filtered_filenames()
+                self.update_file_list()
+                return
+            changed_filenames = sorted(
+                filter(os.path.isfile, set(changed_filenames)))
+            image_filenames = self._find_image_files(
+                changed_filenames) if changed_filenames else []
+            removed_filenames = set(removed_filenames).union(
+                set(changed_filenames).difference(image_filenames))
+
+            known_filenames = set(self._filenames)
+            self._filenames = [
+                filename for filename in self._filenames
+                if filename not in removed_filenames
+            ] + [
+                filename for filename in image_filenames
+                if filename not in known_filenames
+            ]
 
-        self.settings.reset_change_flags()
+            if not isinstance(self._file_times, dict):
+                self._file_times = dict(self._file_times.items())
+            for filename in removed_filenames:
+                self._file_times.pop(filename, None)
+            self._time_index = None
+            # Removed files stay in the catalog until the changed ones have
+            # been looked up, since they may be the same files moved
+            if not self.settings.times.is_any():
+                self._file_times.update(
+                    self._obtain_file_times(image_filenames))
+            self._catalog.remove(removed_filenames)
 
-        if files_changed:
+            log_info(
+                f'Applying {len(image_filenames)} changed and {len(removed_filenames)} removed files.'
+            )
             self._update_filtered_filenames()
+            self.update_file_list()
 
     def update_file_list(self):
-        with open(self.file_list_path, 'w') as f:
-            f.write('\n'.join(self._filtered_filenames))
-
-    def _read_cached_file_times(self):
-        try:
-            with open(self._file_data_path, 'r') as f:
-                self._all_file_times = json.load(f)
-        except FileNotFoundError:
-            self._all_file_times = {}
-
-    def _write_cached_file_times(self):
-        with open(self._file_data_path, 'w') as f:
-            json.dump(self._all_file_times, f)
+        with self._lock:
+            filenames = self._filtered_filenames
+            if self._preview_cache is not None:
+                filenames = self._map_to_previews(filenames, self._list_stats)
+            if self._render_cache is not None:
+                filenames = self._map_to_rendered_files(
+                    filenames, self._list_stats)
+            with metrics.timer('dpf_file_list_write_seconds',
+                               description='Time spent writing the file list.'):
+                written = self._playlist_writer.write(filenames)
+                self._write_file_list_tag()
+            self._list_ready = True
+            if written:
+                metrics.increment('dpf_file_list_writes_total',
+                                  description='Number of file list writes.')
+            else:
+                metrics.increment(
+                    'dpf_file_list_skipped_writes_total',
+                    description='Number of unchanged file lists not written.'
+                )
+            return written
+
+    def _map_to_previews(self, filenames, stats):
+        mapped_filenames, missing_filenames = self._preview_cache.map_paths(
+            filenames, stats)
+        metrics.set_gauge(
+            'dpf_preview_cache_hit_ratio',
+            self._preview_cache.hit_rate,
+            description=
+            'Fraction of listed RAW and HEIF files found in the preview cache.'
+        )
+        # Previews are normally extracted while scanning, so this only picks
+        # up files cached before or evicted since, which are shown as they
+        # are until then
+        futures = self._preview_cache.extract_in_background(
+            missing_filenames, callback=self.update_file_list)
+        if futures:
+            log_info(f'Extracting embedded previews of {len(futures)} files.')
+        return mapped_filenames
+
+    def _map_to_rendered_files(self, filenames, stats):
+        mapped_filenames, missing_filenames = self._render_cache.map_paths(
+            filenames, stats)
+        log_info(
+            f'Render cache has {len(filenames) - len(missing_filenames)} of {len(filenames)} files (hit rate {self._render_cache.hit_rate:.1%} since start).'
+        )
+        metrics.set_gauge(
+            'dpf_render_cache_hit_ratio',
+            self._render_cache.hit_rate,
+            description='Fraction of listed files found in the render cache.')
+        # Once the missing files have been rendered the list is written again
+        # so that the viewer picks them up on its next reload
+        self._render_cache.render_in_background(
+            missing_filenames, callback=self.update_file_list)
+        return mapped_filenames
+
+    def _open_catalog(self):
+        if not self._cache_data:
+            return MetadataCatalog()
+        if self._catalog_format == 'log':
+            from record_log import RecordLogCatalog
+            catalog = RecordLogCatalog(self._file_data_path)
+        else:
+            catalog = MetadataCatalog(self._file_data_path)
+        if catalog.created and self._legacy_file_data_path.is_file():
+            n_imported = catalog.import_json(self._legacy_file_data_path)
+            log_info(
+                f'Imported {n_imported} cached file times from {self._legacy_file_data_path}.'
+            )
+        return catalog
 
     def _read_filenames(self):
+        self._list_stats = {}
+        if self._catalog_client is not None:
+            return
         self._filenames = self._obtain_filename_list()
 
     def _obtain_filename_list(self):
-        filename_list = subprocess.check_output([
-            SCRIPT_DIR / 'find_image_files.sh',
-            *list(map(str, self.settings.folders))
-        ],
-                                                text=True).split('\n')[:-1]
-        return filename_list
-
-    def _obtain_file_time_list(self, filename_list):
-        file_time_list = subprocess.check_output(
-            [SCRIPT_DIR / 'find_image_times.sh', *filename_list],
-            text=True).split('\n')[:-1]
+        return self._find_image_files(self._list_folders_to_scan())
+
+    def _list_folders_to_scan(self):
+        folders = list(map(str, self.settings.folders))
+        # Taken before scanning, so that files added during the scan make
+        # the folder look changed the next time
+        self._folder_mtimes = {}
+        for folder in folders:
+            try:
+                self._folder_mtimes[folder] = os.stat(folder).st_mtime_ns
+            except OSError:
+                pass
+        self._skipped_folders = self._find_skippable_folders(folders)
+        if self._skipped_folders:
+            log_info(
+                f'Skipping {len(self._skipped_folders)} folders with no images in {self.settings.times}.'
+            )
+        return [
+            folder for folder in folders if folder not in self._skipped_folders
+        ]
+
+    def _find_skippable_folders(self, folders):
+        # A folder whose cached entries were complete at its current
+        # modification time, and of which none fall within the times, has
+        # nothing to show. Subfolders have their own modification times, so
+        # this is only done when scanning one level.
+        if self.settings.times.is_any() or self._scanner.recursive:
+            return set()
+        scanned_mtimes = self._catalog.scanned_mtimes(folders)
+        compiled_filter = self.settings.times.compile()
+        return set(folder for folder in folders
+                   if folder in self._folder_mtimes and scanned_mtimes.get(
+                       folder) == self._folder_mtimes[folder]
+                   and folder_histogram(self._catalog, folder).count(
+                       compiled_filter) == 0
+                   and self._cached_files_unchanged(folder))
+
+    def _cached_files_unchanged(self, folder):
+        # Editing a file in place leaves the modification time of its folder
+        # as it was, so the cached files are still checked against their
+        # stats. This costs a stat per file, but no listing or extraction.
+        _, stale_filenames = self._catalog.lookup(
+            stat_files(self._catalog.filenames(folder)))
+        return not stale_filenames
+
+    def _settings_tag(self):
+        return hashlib.sha1(
+            repr((list(map(str, self.settings.folders)),
+                  repr(self.settings.times))).encode()).hexdigest()
+
+    def _file_list_matches_settings(self):
+        try:
+            return self.file_list_path.is_file(
+            ) and self._file_list_tag_path.read_text() == self._settings_tag()
+        except OSError:
+            return False
 
-        def process_time_string(time_string):
-            splitted = time_string.split()
-            if splitted[1][:2] == '24':
-                time_string = '{} {}'.format(splitted[0],
-                                             '00' + splitted[1][2:])
-            return time_string
+    def _write_file_list_tag(self):
+        tag = self._settings_tag()
+        if self._file_list_tag is None:
+            try:
+                self._file_list_tag = self._file_list_tag_path.read_text()
+            except OSError:
+                pass
+        if tag != self._file_list_tag:
+            write_atomically(self._file_list_tag_path, [tag.encode()])
+            self._file_list_tag = tag
+
+    def _read_settings(self):
+        with metrics.timer('dpf_settings_read_seconds',
+                           description='Time spent reading the settings.'):
+            self.settings.read_settings()
+
+    def _find_image_files(self, paths):
+        with metrics.timer('dpf_scan_seconds',
+                           description='Time spent scanning for images.'):
+            image_files = list(self._scan(paths))
+        metrics.increment('dpf_scanned_images_total',
+                          len(image_files),
+                          description='Number of images found by scans.')
+        return image_files
+
+    def _scan(self, paths):
+        if self._io_scheduler is None:
+            yield from self._until_cancelled(self._scanner.scan(paths))
+            return
+        # Each folder is scanned by the pool of the device it is on, so a
+        # slow disk does not hold up folders on the others. The files of a
+        # folder are given as soon as it and the ones before it are done.
+        for filenames in self._io_scheduler.imap(
+                lambda path: list(
+                    self._until_cancelled(self._scanner.scan([path]))),
+                paths,
+                folders=True,
+                chunksize=1):
+            yield from filenames
 
-        return map(process_time_string, file_time_list)
+    def _obtain_file_time_list(self, filename_list):
+        with metrics.timer(
+                'dpf_metadata_extraction_seconds',
+                description='Time spent extracting capture times.'):
+            file_times = []
+            for filenames in batched(filename_list, EXTRACTION_BATCH_SIZE):
+                self._check_cancelled()
+                file_times.extend(
+                    self._metadata_extractor.extract_times(filenames))
+        metrics.increment(
+            'dpf_metadata_extracted_files_total',
+            len(filename_list),
+            description='Number of files whose capture time was extracted.')
+        return file_times
 
     def _update_file_times(self):
-        self._file_times = {}
-        new_filenames_list = []
-        for filename in self._filenames:
-            if filename in self._all_file_times:
-                self._file_times[filename] = self._all_file_times[filename]
-            else:
-                new_filenames_list.append(filename)
-
-        log_info(f'Processing {len(new_filenames_list)} new files.')
+        if self._catalog_client is not None:
+            return
+        file_times = self._obtain_file_times(self._filenames)
+        self._file_times = {
+            filename: file_times[filename]
+            for filename in self._filenames if filename in file_times
+        }
+        self._time_index = None
+        self._collect_garbage()
+
+    def _collect_garbage(self):
+        scanned_folder_mtimes = {
+            folder: mtime_ns
+            for folder, mtime_ns in self._folder_mtimes.items()
+            if folder not in self._skipped_folders
+        }
+        n_removed = self._catalog.collect_garbage(
+            scanned_folder_mtimes,
+            self._filenames,
+            recursive=self._scanner.recursive,
+            folders=list(map(str, self.settings.folders)))
+        if n_removed > 0:
+            log_info(f'Removed {n_removed} deleted files from cache.')
+        self._catalog.mark_scanned(scanned_folder_mtimes)
+
+    def _obtain_file_times(self, filenames, directory_rows=None, counts=None):
+        with metrics.timer('dpf_cache_load_seconds',
+                           description='Time spent looking up cached times.'):
+            stats = stat_files(filenames)
+            cached_file_times, new_filenames_list = self._catalog.lookup(
+                stats, directory_rows)
+        metrics.increment('dpf_cache_hits_total',
+                          len(cached_file_times),
+                          description='Number of file times found in cache.')
+        metrics.increment(
+            'dpf_cache_misses_total',
+            len(new_filenames_list),
+            description='Number of file times missing from cache.')
+        if stats:
+            metrics.set_gauge(
+                'dpf_cache_hit_ratio',
+                len(cached_file_times) / len(stats),
+                description='Fraction of file times found in the last lookup.')
+
+        moved_file_times, new_filenames_list, fingerprints = self._find_moved_files(
+            stats, new_filenames_list)
+        cached_file_times.update(moved_file_times)
+
+        # A streamed scan adds up the counts and logs them once at the end
+        if counts is None:
+            if moved_file_times:
+                log_info(
+                    f'Reusing cached times for {len(moved_file_times)} moved files.'
+                )
+            if new_filenames_list:
+                log_info(f'Processing {len(new_filenames_list)} new files.')
+        else:
+            counts['moved'] += len(moved_file_times)
+            counts['new'] += len(new_filenames_list)
         new_times_list = self._obtain_file_time_list(new_filenames_list)
+        new_entries = [(filename, stats[filename], time_string)
+                       for filename, time_string in moved_file_times.items()]
         for new_filename, new_time_string in zip(new_filenames_list,
                                                  new_times_list):
-            self._file_times[new_filename] = new_time_string
-            self._all_file_times[new_filename] = self._file_times[new_filename]
+            if new_time_string is None:
+                log_error(f'Could not obtain time for {new_filename}.')
+                continue
+            cached_file_times[new_filename] = new_time_string
+            new_entries.append(
+                (new_filename, stats[new_filename], new_time_string))
+        with metrics.timer('dpf_cache_save_seconds',
+                           description='Time spent storing new file times.'):
+            self._catalog.update(new_entries, fingerprints)
+
+        return cached_file_times
+
+    def _find_moved_files(self, stats, filenames):
+        if not filenames:
+            return {}, filenames, {}
+        with metrics.timer(
+                'dpf_cache_fingerprint_seconds',
+                description='Time spent matching new files by content.'):
+            moved_file_times, new_filenames, fingerprints = self._catalog.lookup_moved(
+                stats, filenames)
+        metrics.increment(
+            'dpf_cache_moved_hits_total',
+            len(moved_file_times),
+            description='Number of file times reused for moved files.')
+        return moved_file_times, new_filenames, fingerprints
+
+    def _rescan_streaming(self, on_first_batch=None):
+        compiled_filter = None if self.settings.times.is_any(
+        ) else self.settings.times.compile()
+        counts = dict(moved=0, new=0)
+        self._list_stats = {}
+        if compiled_filter is None:
+            stages = [lambda batches: ((filenames, {}, filenames)
+                                       for filenames in batches)]
+        else:
+            stages = [
+                functools.partial(self._stream_file_times,
+                                  directory_rows={},
+                                  counts=counts),
+                functools.partial(self._stream_filter, compiled_filter)
+            ]
+        pipeline = Pipeline(
+            batched(self._scan(self._list_folders_to_scan()),
+                    self._stream_batch_size), stages)
+
+        # A list shown from a previous run is complete, so it is only
+        # replaced by the final one. Otherwise the list is written whenever
+        # it has doubled, which keeps the cost of rewriting it linear.
+        write_partial_lists = not self._list_ready
+        next_write_size = self._stream_batch_size
+        rewritten = False
+        filenames = []
+        file_times = {}
+        filtered_filenames = []
+        with metrics.timer('dpf_stream_seconds',
+                           description='Time spent streaming the file list.'):
+            for batch_filenames, batch_file_times, batch_filtered_filenames in pipeline:
+                self._check_cancelled()
+                filenames.extend(batch_filenames)
+                file_times.update(batch_file_times)
+                filtered_filenames.extend(batch_filtered_filenames)
+                if write_partial_lists and len(
+                        filtered_filenames) >= next_write_size:
+                    self._filtered_filenames = list(filtered_filenames)
+                    written = self.update_file_list()
+                    next_write_size = 2 * len(filtered_filenames)
+                    if on_first_batch is None:
+                        rewritten = rewritten or written
+                    else:
+                        log_info(
+                            f'Showing the first {len(filtered_filenames)} files while scanning.'
+                        )
+                        on_first_batch()
+                        on_first_batch = None
+
+        if counts['moved'] > 0:
+            log_info(
+                f'Reused cached times for {counts["moved"]} moved files.')
+        if counts['new'] > 0:
+            log_info(f'Processed {counts["new"]} new files.')
+        metrics.increment('dpf_scanned_images_total',
+                          len(filenames),
+                          description='Number of images found by scans.')
+        self._filenames = filenames
+        if compiled_filter is not None:
+            self._file_times = file_times
+            self._time_index = None
+            self._collect_garbage()
+        self._filtered_filenames = filtered_filenames
+        self._report_filtered_counts()
+        self._stale = False
+        written = self.update_file_list()
+        if on_first_batch is not None:
+            on_first_batch()
+        return written or rewritten
+
+    def _stream_file_times(self, batches, directory_rows=None, counts=None):
+        for filenames in batches:
+            self._check_cancelled()
+            yield filenames, self._obtain_file_times(filenames,
+                                                     directory_rows=directory_rows,
+                                                     counts=counts)
+
+    def _check_cancelled(self):
+        if self._cancel_event.is_set():
+            raise ScanCancelled('The scan was cancelled')
+
+    def _until_cancelled(self, filenames):
+        for filename in filenames:
+            self._check_cancelled()
+            yield filename
 
-        if self._cache_data and len(new_filenames_list) > 0:
-            self._write_cached_file_times()
+    @staticmethod
+    def _stream_filter(compiled_filter, batches):
+        for filenames, file_times in batches:
+            timed_filenames = [
+                filename for filename in filenames if filename in file_times
+            ]
+            keys = day_keys(file_times[filename]
+                            for filename in timed_filenames)
+            yield filenames, file_times, [
+                filename
+                for filename, key in zip(timed_filenames, keys)
+                if compiled_filter.includes_key(key)
+            ]
 
-    def _update_filtered_filenames(self):
-        if self.settings.times.is_any():
-            self._filtered_filenames = self._filenames
+    def _query_catalog_service(self):
+        try:
+            with metrics.timer(
+                    'dpf_catalog_service_query_seconds',
+                    description='Time spent waiting for the catalog service.'
+            ):
+                self._filtered_filenames, n_files = self._catalog_client.query(
+                    self.settings.folders, self.settings.times)
+        except (OSError, CatalogServiceError) as e:
+            log_error(
+                f'Catalog service at {self._catalog_client.socket_path} failed, scanning locally from now on: {e}'
+            )
+            self._catalog_client = None
+            self._read_filenames()
+            if not self.settings.times.is_any():
+                self._update_file_times()
+            return False
+        log_info(
+            f'Including {len(self._filtered_filenames)} of {n_files} files.')
+        metrics.set_gauge('dpf_files',
+                          n_files,
+                          description='Number of images in the folders.')
+        metrics.set_gauge('dpf_included_files',
+                          len(self._filtered_filenames),
+                          description='Number of images passing the filter.')
+        return True
+
+    def _build_time_index(self):
+        if self._columnar:
+            from file_table import FileTable
+            file_table = FileTable(self._file_times)
+            # The table stores the same entries, so the dict can be released
+            self._file_times = file_table
+            return file_table
         else:
-            self._filtered_filenames = [
-                filename for filename, time_string in self._file_times.items()
-                if self.settings.times.includes(
-                    datetime.datetime.fromisoformat(time_string))
-            ]
+            return TimeIndex(self._file_times)
+
+    def _update_filtered_filenames(self):
+        if self._catalog_client is not None and self._query_catalog_service():
+            return
+        with metrics.timer('dpf_filter_seconds',
+                           description='Time spent filtering files by time.'):
+            if self.settings.times.is_any():
+                self._filtered_filenames = self._filenames
+            else:
+                if self._time_index is None:
+                    self._time_index = self._build_time_index()
+                self._filtered_filenames = self._time_index.select(
+                    self.settings.times.compile())
+        self._report_filtered_counts()
+
+    def _report_filtered_counts(self):
         log_info(
             f'Including {len(self._filtered_filenames)} of {len(self._filenames)} files.'
         )
+        metrics.set_gauge('dpf_files', len(self._filenames),
+                          description='Number of images in the folders.')
+        metrics.set_gauge('dpf_included_files',
+                          len(self._filtered_filenames),
+                          description='Number of images passing the filter.')
 
 
-class Displayer:
-    def __init__(self, file_manager):
+def feh_reload_arguments(reload_interval):
+    return [] if reload_interval is None else [
+        '--reload', f'{reload_interval:d}'
+    ]
+
+
+class FehViewer:
+    def __init__(self, file_manager, reload_interval=None):
         self._file_manager = file_manager
+        self._reload_interval = reload_interval
 
         self._process = None
 
+    @property
+    def feh_arguments(self):
+        return self._file_manager.feh_arguments + feh_reload_arguments(
+            self._reload_interval)
+
+    @property
+    def has_shown_image(self):
+        # feh gives no sign of its first image, so a running process is the
+        # closest available
+        return self._process is not None and self._process.poll() is None
+
+    def start(self):
+        self.stop()
+        metrics.increment('dpf_viewer_starts_total',
+                          description='Number of times the viewer started.',
+                          viewer='feh')
+        self._process = subprocess.Popen(['feh', *self.feh_arguments])
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.wait()
+            self._process = None
+
+    def restart(self):
+        self.start()
+
+    def poll(self):
+        return None if self._process is None else self._process.poll()
+
+
+class Displayer:
+    def __init__(self, file_manager, reload_interval=None, viewer=None):
+        self._file_manager = file_manager
+        self._viewer = FehViewer(
+            file_manager,
+            reload_interval=reload_interval) if viewer is None else viewer
+
+        self._running = False
+
     @property
     def file_manager(self):
         return self._file_manager
 
+    @property
+    def viewer(self):
+        return self._viewer
+
     def __enter__(self):
         self._start()
         return self
@@ -646,39 +1100,58 @@ class Displayer:
     def __exit__(self, *args):
         self._stop()
 
+    def is_running(self):
+        if not self._running:
+            return False
+        returncode = self.viewer.poll()
+        if returncode is None:
+            return True
+        self._running = False
+        if returncode == 0:
+            return False
+        else:
+            raise RuntimeError(f'Viewer exited with error code {returncode}')
+
     def wait(self):
-        if self._process is None:
-            return
-        while self._process.poll() is None:
+        while self.is_running():
             time.sleep(0.1)
-        if self._process.returncode == 0:
-            return
-        else:
-            raise RuntimeError(
-                f'feh exited with error code {self._process.returncode}')
+
+    def restart(self):
+        self.viewer.restart()
+        self._running = True
 
     def _start(self):
-        self._stop()
-        self._process = subprocess.Popen(
-            ['feh', *self.file_manager.feh_arguments])
+        self.viewer.start()
+        self._running = True
 
     def _stop(self):
-        if self._process is not None:
-            self._process.terminate()
-            self._process = None
+        self.viewer.stop()
+        self._running = False
 
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Show the configured images with feh')
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help=
+        f'profile the file manager phases into {SCRIPT_DIR / "profiles"} (also enabled by {profiling.ENVIRONMENT_VARIABLE}=1)'
+    )
+    args = parser.parse_args()
+    if profiling.requested(args.profile):
+        profiling.enable(SCRIPT_DIR / 'profiles')
     setup_logging(SCRIPT_DIR / 'log.txt')
     setup_screen('admin')
     settings = SettingsFile(SCRIPT_DIR / 'frame_config.txt',
                             NextcloudFileLocator(check_validity=True))
     file_manager = FileManager(settings)
-    with Displayer(file_manager) as displayer:
-        displayer.wait()
-
-    # notifier = Inotify(block_duration_s=1)
-    # notifier.add_watch(str(settings.file_path), mask=(IN_MODIFY | IN_CLOSE))
-
-    # for event in notifier.event_gen(yield_nones=False):
-    #     file_manager.reread_settings()
+    from watcher import LibraryWatcher
+    watcher = LibraryWatcher(file_manager)
+    watcher.start()
+    try:
+        with Displayer(file_manager) as displayer:
+            displayer.wait()
+    finally:
+        watcher.stop()
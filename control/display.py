@@ -1,10 +1,15 @@
 #!/usr/bin/env python3
 
 import os
+import argparse
 import subprocess
 import time
+import asyncio
 import control
 import digital_photo_frame as dpf
+import metrics
+import profiling
+from supervisor import DisplaySupervisor
 
 MODE = 'display'
 
@@ -19,10 +24,145 @@ def display_with_context(mode, config, database):
     dpf.setup_screen('admin')
     settings = dpf.SettingsDatabase(
         database, dpf.NextcloudFileLocator(check_validity=True))
-    file_manager = dpf.FileManager(settings)
-    with dpf.Displayer(file_manager) as displayer:
-        displayer.wait()
+    mode_config = config['modes']['current']['values'][mode]
+    live_reload = mode_config.get('live_reload')
+    render_cache = create_render_cache(mode_config.get('render_cache'))
+    preview_cache = create_preview_cache(mode_config.get('preview_cache'))
+    create_viewer = viewer_factory(mode_config.get('viewer', 'feh'))
+    metrics_kwargs = setup_metrics(mode_config.get('metrics'))
+    fast_start = mode_config.get('fast_start', False)
+    # The log format has no fingerprints or day counts, so it cannot reuse
+    # the times of moved files or skip unchanged folders
+    catalog_format = mode_config.get('catalog_format') or 'sqlite'
+    catalog_service_path = mode_config.get('catalog_service')
+    file_source_kwargs = setup_file_source(
+        mode_config.get('nextcloud_catalog'), config)
+    io_scheduler = create_io_scheduler(mode_config.get('io_scheduling'))
+    stream_batch_size = mode_config.get('stream_batch_size')
+    # Tells whoever switched to this mode that it is running, and later
+    # that the first image is up
+    on_started = lambda: control.report_mode(mode, config, database)
+    on_ready = lambda: control.report_shown(mode)
+    supervisor_kwargs = dict(create_viewer=create_viewer,
+                             on_started=on_started,
+                             on_ready=on_ready,
+                             render_cache=render_cache,
+                             preview_cache=preview_cache,
+                             fast_start=fast_start,
+                             catalog_format=catalog_format,
+                             catalog_service_path=catalog_service_path,
+                             io_scheduler=io_scheduler,
+                             stream_batch_size=stream_batch_size,
+                             **file_source_kwargs,
+                             **metrics_kwargs)
+    if live_reload is not None:
+        supervisor_kwargs.update(
+            reload_interval=live_reload['file_list_reload_interval'],
+            settings_poll_interval=live_reload['settings_poll_interval'])
+    supervisor = DisplaySupervisor(settings, **supervisor_kwargs)
+    asyncio.run(supervisor.run())
+    if supervisor.received_signal is not None:
+        control.handle_shutdown()
+
+
+def create_render_cache(render_cache_config):
+    if render_cache_config is None:
+        return None
+    from render_cache import RenderCache, pillow_available
+    if not pillow_available():
+        dpf.log_error('Pillow is not available, rendering disabled.')
+        return None
+    return RenderCache(dpf.SCRIPT_DIR / '.render_cache',
+                       screen_size=render_cache_config['screen_size'],
+                       max_bytes=render_cache_config['max_megabytes'] << 20)
+
+
+def create_preview_cache(preview_cache_config):
+    if preview_cache_config is None:
+        return None
+    from preview_cache import PreviewCache
+    return PreviewCache(dpf.SCRIPT_DIR / '.preview_cache',
+                        max_bytes=preview_cache_config['max_megabytes'] << 20)
+
+
+def create_io_scheduler(io_scheduling_config):
+    if io_scheduling_config is None:
+        return None
+    from io_scheduling import DeviceScheduler
+    return DeviceScheduler(
+        workers_per_device=io_scheduling_config['workers_per_device'],
+        device_workers=io_scheduling_config.get('device_workers'),
+        idle_priority=io_scheduling_config['idle_priority'])
+
+
+def viewer_factory(viewer_name):
+    if viewer_name == 'feh':
+        return None
+    if viewer_name != 'slideshow':
+        dpf.log_error(f'Unknown viewer {viewer_name}, using feh.')
+        return None
+    from render_cache import pillow_available
+    from slideshow import SlideshowViewer, TkScreen, tkinter_available
+    if not pillow_available() or not tkinter_available():
+        dpf.log_error(
+            'Pillow and tkinter are required for the slideshow, using feh.')
+        return None
+    return lambda file_manager: SlideshowViewer(file_manager, TkScreen())
+
+
+def setup_file_source(nextcloud_config, config):
+    if nextcloud_config is None:
+        return {}
+    from database import Database
+    from nextcloud import NextcloudFileSource, NextcloudWatcher
+    # The frame account needs SELECT access to the Nextcloud tables unless
+    # another account is given
+    account_info = nextcloud_config.get(
+        'account') or config['database']['account']
+    database = Database(account_info['host'],
+                        account_info['user'],
+                        account_info['password'],
+                        nextcloud_config['database'],
+                        persistent=True)
+    file_source = NextcloudFileSource(
+        database,
+        base_path=nextcloud_config.get('base_path', '/mnt/hdd1'),
+        table_prefix=nextcloud_config.get('table_prefix', 'oc_'))
+    try:
+        file_source.check_access()
+    except Exception as e:
+        dpf.log_error(
+            f'Could not read the Nextcloud file cache, scanning the disk and watching it with inotify instead: {e}'
+        )
+        database.close()
+        return {}
+    poll_interval = nextcloud_config['poll_interval']
+    return dict(scanner=file_source,
+                create_watcher=lambda file_manager: NextcloudWatcher(
+                    file_manager, file_source, poll_interval=poll_interval))
+
+
+def setup_metrics(metrics_config):
+    if metrics_config is None:
+        return {}
+    if metrics_config.get('port') is not None:
+        try:
+            metrics.registry.serve(metrics_config['port'])
+        except OSError as e:
+            dpf.log_error(f'Could not serve metrics: {e}')
+    return dict(metrics_path=dpf.SCRIPT_DIR / 'metrics.prom',
+                metrics_interval=metrics_config['write_interval'])
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the display mode')
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help=
+        f'profile the file manager phases into {dpf.SCRIPT_DIR / "profiles"} (also enabled by {profiling.ENVIRONMENT_VARIABLE}=1)'
+    )
+    args = parser.parse_args()
+    if profiling.requested(args.profile):
+        profiling.enable(dpf.SCRIPT_DIR / 'profiles')
     display()
@@ -0,0 +1,272 @@
+import os
+import hashlib
+import itertools
+import threading
+import concurrent.futures
+
+
+class BoundedFileCache:
+    # Keeps files derived from source files in a directory, named by a hash
+    # of the source path, size and modification time so that changed sources
+    # miss, and removes the least recently used ones above the size limit.
+    # The files of the current list are pinned and never removed, since the
+    # viewer may open them at any time. Subclasses create the files in
+    # _create and may extend the key or handle only some sources.
+    extension = '.jpg'
+    errors = (OSError, ValueError)
+    # Assumed size of an entry until there are entries to average over
+    typical_entry_bytes = 1 << 20
+
+    def __init__(self, cache_dir, max_bytes, max_workers=1):
+        self._cache_dir = str(cache_dir)
+        self._max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers)
+        self._pending = set()
+        # Failures are kept by cache path, so a source is tried again once
+        # it has been changed
+        self._failed = set()
+
+        self._use_counter = itertools.count()
+        self._last_use = {}
+        self._sizes = {}
+        self._total_bytes = 0
+        self._pinned = set()
+        self._pinned_bytes = 0
+        self._hits = 0
+        self._misses = 0
+
+        os.makedirs(self._cache_dir, exist_ok=True)
+        self._load_entries()
+
+    @property
+    def cache_dir(self):
+        return self._cache_dir
+
+    @property
+    def total_bytes(self):
+        return self._total_bytes
+
+    @property
+    def pinned_bytes(self):
+        return self._pinned_bytes
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    @property
+    def hit_rate(self):
+        lookups = self._hits + self._misses
+        return self._hits / lookups if lookups > 0 else 0.0
+
+    def cache_path(self, source_path, stat_result):
+        key = hashlib.sha1(
+            f'{source_path}\0{stat_result.st_size}\0{stat_result.st_mtime_ns}{self._key_suffix()}'
+            .encode('utf-8', 'surrogateescape')).hexdigest()
+        return os.path.join(self._cache_dir, key + self.extension)
+
+    def contains(self, cache_path):
+        with self._lock:
+            return cache_path in self._sizes
+
+    def lookup(self, source_path):
+        cache_path, hit = self._lookup(source_path)
+        return cache_path if hit else None
+
+    def map_paths(self, source_paths, stats=None):
+        # The given paths are taken to be the current list, whose entries
+        # are pinned until the next call. Sources that failed are left out
+        # of the missing ones, and failures of unlisted sources forgotten.
+        # Caches mapping the same list can share stats, a dictionary filled
+        # with the stats they take, so every file is stat'ed once.
+        mapped_paths = []
+        missing_paths = []
+        pinned = set()
+        missing_cache_paths = set()
+        for source_path in source_paths:
+            if not self._handles(source_path):
+                mapped_paths.append(source_path)
+                continue
+            cache_path, hit = self._lookup(source_path, stats)
+            if hit:
+                mapped_paths.append(cache_path)
+                pinned.add(cache_path)
+                continue
+            mapped_paths.append(source_path)
+            if cache_path is not None:
+                missing_cache_paths.add(cache_path)
+                if cache_path not in self._failed:
+                    missing_paths.append(source_path)
+        self._pin(pinned)
+        with self._lock:
+            self._failed.intersection_update(missing_cache_paths)
+        return mapped_paths, missing_paths
+
+    def process(self, source_path):
+        return self._process(source_path)[0]
+
+    def process_in_background(self, source_paths, callback=None):
+        with self._lock:
+            source_paths = [
+                source_path for source_path in source_paths
+                if source_path not in self._pending
+            ]
+            # Pinned entries cannot make room, so only as many files are
+            # queued as are expected to fit next to them
+            source_paths = source_paths[:self._n_fitting()]
+            self._pending.update(source_paths)
+        if not source_paths:
+            return None
+        futures = [
+            self._executor.submit(self._process, source_path)
+            for source_path in source_paths
+        ]
+        if callback is None:
+            return futures
+
+        def notify_when_done():
+            concurrent.futures.wait(futures)
+            # After a pass that added nothing, the callback would only find
+            # the same files missing again
+            if any(not future.cancelled() and future.exception() is None
+                   and future.result()[1] for future in futures):
+                callback()
+
+        threading.Thread(target=notify_when_done, daemon=True).start()
+        return futures
+
+    def reset_statistics(self):
+        with self._lock:
+            self._hits = 0
+            self._misses = 0
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _key_suffix(self):
+        return ''
+
+    def _handles(self, source_path):
+        return True
+
+    def _create(self, source_path, cache_path):
+        raise NotImplementedError
+
+    def _lookup(self, source_path, stats=None):
+        # Returns the cache path, or None when the source is gone, and
+        # whether it is cached
+        try:
+            if stats is None:
+                stat_result = os.stat(source_path)
+            else:
+                stat_result = stats.get(source_path)
+                if stat_result is None:
+                    stat_result = stats[source_path] = os.stat(source_path)
+            cache_path = self.cache_path(source_path, stat_result)
+        except OSError:
+            return None, False
+        with self._lock:
+            if cache_path in self._sizes:
+                self._hits += 1
+                self._last_use[cache_path] = next(self._use_counter)
+                return cache_path, True
+            self._misses += 1
+        return cache_path, False
+
+    def _process(self, source_path):
+        # Returns the cache path and whether an entry was added
+        cache_path = None
+        try:
+            cache_path = self.cache_path(source_path, os.stat(source_path))
+            with self._lock:
+                if cache_path in self._failed:
+                    return None, False
+            if self.contains(cache_path):
+                return cache_path, False
+            self._create(source_path, cache_path)
+            if not self._add_entry(cache_path, os.path.getsize(cache_path)):
+                return None, False
+            return cache_path, True
+        except self.errors:
+            self._mark_failed(cache_path)
+            return None, False
+        finally:
+            with self._lock:
+                self._pending.discard(source_path)
+
+    def _mark_failed(self, cache_path):
+        if cache_path is not None:
+            with self._lock:
+                self._failed.add(cache_path)
+
+    def _pin(self, cache_paths):
+        with self._lock:
+            self._pinned = cache_paths
+            self._pinned_bytes = sum(
+                self._sizes.get(cache_path, 0) for cache_path in cache_paths)
+
+    def _n_fitting(self):
+        entry_bytes = self._total_bytes / len(
+            self._sizes) if self._sizes else self.typical_entry_bytes
+        free_bytes = self._max_bytes - self._pinned_bytes - len(
+            self._pending) * entry_bytes
+        return max(int(free_bytes // max(entry_bytes, 1)), 0)
+
+    def _load_entries(self):
+        entries = []
+        with os.scandir(self._cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(self.extension) and entry.is_file():
+                    stat_result = entry.stat()
+                    entries.append((stat_result.st_mtime_ns, entry.path,
+                                    stat_result.st_size))
+        for _, path, size in sorted(entries):
+            self._last_use[path] = next(self._use_counter)
+            self._sizes[path] = size
+            self._total_bytes += size
+        self._evict()
+
+    def _add_entry(self, cache_path, size):
+        # New entries belong to listed files, so they are pinned as well. One
+        # that does not fit next to the pinned entries is dropped instead.
+        with self._lock:
+            old_size = self._sizes.get(cache_path, 0)
+            if cache_path in self._pinned:
+                self._pinned_bytes += size - old_size
+            elif self._pinned_bytes + size > self._max_bytes:
+                if cache_path not in self._sizes:
+                    try:
+                        os.remove(cache_path)
+                    except OSError:
+                        pass
+                return False
+            else:
+                self._pinned.add(cache_path)
+                self._pinned_bytes += size
+            self._last_use[cache_path] = next(self._use_counter)
+            self._total_bytes += size - old_size
+            self._sizes[cache_path] = size
+            self._evict()
+            return True
+
+    def _evict(self):
+        if self._total_bytes <= self._max_bytes:
+            return
+        for cache_path in sorted(self._last_use, key=self._last_use.get):
+            if self._total_bytes <= self._max_bytes:
+                break
+            if cache_path in self._pinned:
+                continue
+            try:
+                os.remove(cache_path)
+            except OSError:
+                pass
+            self._total_bytes -= self._sizes.pop(cache_path)
+            del self._last_use[cache_path]
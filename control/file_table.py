@@ -0,0 +1,115 @@
+import os
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+FILENAME_ENCODING = 'utf-8'
+FILENAME_ERRORS = 'surrogateescape'
+
+
+def numpy_available():
+    return np is not None
+
+
+class FileTable:
+    def __init__(self, file_times):
+        if np is None:
+            raise ImportError('NumPy is required for the columnar file table')
+
+        directory_indices = {}
+        self._directories = []
+        directory_column = []
+        basenames = []
+        offsets = [0]
+        for filename in file_times:
+            directory, basename = os.path.split(filename)
+            directory_index = directory_indices.get(directory)
+            if directory_index is None:
+                directory_index = directory_indices[directory] = len(
+                    self._directories)
+                self._directories.append(directory)
+            directory_column.append(directory_index)
+            encoded_basename = basename.encode(FILENAME_ENCODING,
+                                               FILENAME_ERRORS)
+            basenames.append(encoded_basename)
+            offsets.append(offsets[-1] + len(encoded_basename))
+
+        self._directory_indices = np.array(directory_column, dtype=np.int32)
+        self._basename_heap = b''.join(basenames)
+        self._basename_offsets = np.array(offsets, dtype=np.int64)
+        self._timestamps = np.array(list(file_times.values()),
+                                    dtype='datetime64[s]')
+
+    def __len__(self):
+        return len(self._directory_indices)
+
+    def __iter__(self):
+        return (self.filename(i) for i in range(len(self)))
+
+    @property
+    def nbytes(self):
+        return self._directory_indices.nbytes + len(
+            self._basename_heap
+        ) + self._basename_offsets.nbytes + self._timestamps.nbytes + sum(
+            map(len, self._directories))
+
+    @property
+    def year_range(self):
+        if len(self) == 0:
+            return None
+        years = self._timestamps[[
+            self._timestamps.argmin(),
+            self._timestamps.argmax()
+        ]].astype('datetime64[Y]').astype(np.int64) + 1970
+        return int(years[0]), int(years[1])
+
+    def filename(self, i):
+        basename = self._basename_heap[self._basename_offsets[i]:self.
+                                       _basename_offsets[i + 1]].decode(
+                                           FILENAME_ENCODING, FILENAME_ERRORS)
+        return os.path.join(self._directories[self._directory_indices[i]],
+                            basename)
+
+    def filenames(self, indices):
+        return [self.filename(i) for i in indices]
+
+    def time_strings(self, indices=None):
+        timestamps = self._timestamps if indices is None else self._timestamps[
+            indices]
+        return [
+            time_string.replace('T', ' ')
+            for time_string in np.datetime_as_string(timestamps, unit='s')
+        ]
+
+    def items(self):
+        return zip(self, self.time_strings())
+
+    def mask(self, compiled_filter):
+        if len(self) == 0:
+            return np.zeros(0, dtype=bool)
+        intervals = compiled_filter.intervals_for_years(*self.year_range)
+        if not intervals:
+            return np.zeros(len(self), dtype=bool)
+        # Intervals are sorted and disjoint, so a key lies inside one exactly
+        # when it falls after an odd number of the flattened boundaries
+        boundaries = np.array(intervals, dtype=np.int64).ravel()
+        keys = self._timestamps.view(np.int64)
+        return np.searchsorted(boundaries, keys, side='right') % 2 == 1
+
+    def chronological_order(self, indices=None):
+        if indices is None:
+            return np.argsort(self._timestamps, kind='stable')
+        indices = np.asarray(indices)
+        return indices[np.argsort(self._timestamps[indices], kind='stable')]
+
+    def select_indices(self, compiled_filter, chronological=False):
+        indices = np.flatnonzero(self.mask(compiled_filter))
+        if chronological:
+            indices = self.chronological_order(indices)
+        return indices
+
+    def select(self, compiled_filter, chronological=False):
+        return self.filenames(
+            self.select_indices(compiled_filter, chronological=chronological))
@@ -0,0 +1,180 @@
+import os
+import ctypes
+import platform
+import threading
+import contextlib
+import collections
+import concurrent.futures
+
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+
+SYS_IOPRIO_SET = {
+    'x86_64': 251,
+    'i386': 289,
+    'i686': 289,
+    'armv6l': 314,
+    'armv7l': 314,
+    'armv8l': 314,
+    'aarch64': 30,
+    'riscv64': 30
+}
+
+_libc = None
+
+
+def set_idle_io_priority():
+    # I/O priorities belong to threads, so this only affects the calling
+    # thread. They are honoured by the BFQ scheduler and ignored by others.
+    global _libc
+    number = SYS_IOPRIO_SET.get(platform.machine())
+    if number is None:
+        return False
+    try:
+        if _libc is None:
+            _libc = ctypes.CDLL(None, use_errno=True)
+        return _libc.syscall(number, IOPRIO_WHO_PROCESS, 0,
+                             IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT) == 0
+    except (OSError, AttributeError):
+        return False
+
+
+class PauseGate:
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._n_pauses = 0
+
+    @property
+    def is_paused(self):
+        with self._condition:
+            return self._n_pauses > 0
+
+    def pause(self):
+        with self._condition:
+            self._n_pauses += 1
+
+    def resume(self):
+        with self._condition:
+            self._n_pauses -= 1
+            if self._n_pauses == 0:
+                self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def paused(self):
+        self.pause()
+        try:
+            yield
+        finally:
+            self.resume()
+
+    def wait(self, timeout=None):
+        with self._condition:
+            return self._condition.wait_for(lambda: self._n_pauses == 0,
+                                            timeout)
+
+
+# Paused by the viewer while it loads a slide, and waited on by background
+# scanning and extraction between files
+gate = PauseGate()
+
+
+class DeviceScheduler:
+    def __init__(self,
+                 workers_per_device=1,
+                 device_workers=None,
+                 idle_priority=True,
+                 chunksize=64,
+                 pause_gate=None):
+        self._workers_per_device = workers_per_device
+        self._idle_priority = idle_priority
+        self._chunksize = chunksize
+        self._gate = gate if pause_gate is None else pause_gate
+
+        # Concurrency can be set per device by naming any path on it
+        self._device_workers = {}
+        for path, n_workers in (device_workers or {}).items():
+            try:
+                self._device_workers[os.stat(path).st_dev] = n_workers
+            except OSError:
+                pass
+
+        self._lock = threading.Lock()
+        self._executors = {}
+        self._directory_devices = {}
+
+    @property
+    def devices(self):
+        with self._lock:
+            return list(self._executors)
+
+    def device_of(self, path, is_folder=False):
+        # Files share the device of their folder, so one stat per folder
+        # suffices, while a folder may itself be a mount point
+        if is_folder:
+            try:
+                return os.stat(path).st_dev
+            except OSError:
+                return None
+        directory = os.path.dirname(path)
+        device = self._directory_devices.get(directory, False)
+        if device is False:
+            try:
+                device = os.stat(directory).st_dev
+            except OSError:
+                device = None
+            self._directory_devices[directory] = device
+        return device
+
+    def map(self, function, paths, folders=False):
+        return list(self.imap(function, paths, folders=folders))
+
+    def imap(self, function, paths, folders=False, chunksize=None):
+        # Results are given in the order of the paths as soon as they are
+        # done, while the pools of all devices keep working ahead
+        paths = list(paths)
+        chunksize = self._chunksize if chunksize is None else chunksize
+        groups = collections.defaultdict(list)
+        for index, path in enumerate(paths):
+            groups[self.device_of(path, is_folder=folders)].append(index)
+
+        chunk_results = [None] * len(paths)
+        for device, indices in groups.items():
+            executor = self._get_executor(device)
+            for start in range(0, len(indices), chunksize):
+                chunk = indices[start:start + chunksize]
+                future = executor.submit(self._run_chunk, function,
+                                         [paths[index] for index in chunk])
+                for position, index in enumerate(chunk):
+                    chunk_results[index] = (future, position)
+
+        for future, position in chunk_results:
+            yield future.result()[position]
+
+    def close(self, wait=True):
+        # Without waiting, chunks that have not started are dropped
+        with self._lock:
+            executors = list(self._executors.values())
+            self._executors = {}
+        for executor in executors:
+            executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    def _run_chunk(self, function, paths):
+        results = []
+        for path in paths:
+            self._gate.wait()
+            results.append(function(path))
+        return results
+
+    def _get_executor(self, device):
+        with self._lock:
+            executor = self._executors.get(device)
+            if executor is None:
+                executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self._device_workers.get(
+                        device, self._workers_per_device),
+                    thread_name_prefix=f'device_{device}',
+                    initializer=set_idle_io_priority
+                    if self._idle_priority else None)
+                self._executors[device] = executor
+            return executor
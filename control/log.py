@@ -0,0 +1,18 @@
+import sys
+import logging
+
+
+def setup_logging(filename, level=logging.INFO):
+    logging.basicConfig(level=level,
+                        filename=filename,
+                        format='%(asctime)s: %(message)s')
+
+
+def log_info(message):
+    logging.info('INFO: %s', message)
+
+
+def log_error(message, abort=False):
+    logging.error('ERROR: %s', message)
+    if abort:
+        sys.exit(1)
@@ -0,0 +1,570 @@
+import os
+import io
+import re
+import struct
+import datetime
+import collections
+import concurrent.futures
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+TIME_LENGTH = 19
+
+JPEG_SOI = b'\xff\xd8'
+JPEG_APP1 = 0xe1
+JPEG_SOS = 0xda
+JPEG_EOI = 0xd9
+EXIF_HEADER = b'Exif\x00\x00'
+
+TIFF_LITTLE_ENDIAN = b'II*\x00'
+TIFF_BIG_ENDIAN = b'MM\x00*'
+
+TAG_COMPRESSION = 0x0103
+TAG_STRIP_OFFSETS = 0x0111
+TAG_ORIENTATION = 0x0112
+TAG_STRIP_BYTE_COUNTS = 0x0117
+TAG_SUB_IFDS = 0x014a
+TAG_JPEG_OFFSET = 0x0201
+TAG_JPEG_LENGTH = 0x0202
+TAG_EXIF_IFD_POINTER = 0x8769
+TAG_DATE_TIME_ORIGINAL = 0x9003
+
+JPEG_COMPRESSIONS = (6, 7)
+# Baseline, extended and progressive frames. RAW files also store sensor
+# data as JPEG, but always as lossless frames, which are left out.
+JPEG_PREVIEW_FRAMES = (0xc0, 0xc1, 0xc2)
+JPEG_FRAMES = tuple(marker for marker in range(0xc0, 0xd0)
+                    if marker not in (0xc4, 0xc8, 0xcc))
+
+TIFF_TYPE_SIZES = {
+    1: 1,
+    2: 1,
+    3: 2,
+    4: 4,
+    5: 8,
+    6: 1,
+    7: 1,
+    8: 2,
+    9: 4,
+    10: 8,
+    11: 4,
+    12: 8,
+    13: 4
+}
+
+HEIF_BRANDS = (b'heic', b'heix', b'heim', b'heis', b'hevc', b'hevx', b'mif1',
+               b'msf1', b'avif', b'avis')
+
+MAX_IFD_ENTRIES = 1024
+MAX_META_BOX_SIZE = 1 << 20
+MAX_PREVIEW_IFDS = 32
+MAX_PREVIEW_BYTES = 64 << 20
+
+EXIF_TIME_RE = re.compile(
+    rb'^(\d{4}):(\d{2}):(\d{2})[ T](\d{2}):(\d{2}):(\d{2})')
+
+# Extents are absolute (offset, length) pairs that together hold the JPEG
+PreviewLocation = collections.namedtuple(
+    'PreviewLocation', ['extents', 'width', 'height', 'orientation'])
+
+
+class TiffIFD:
+    def __init__(self, byte_order, entries, next_offset):
+        self.byte_order = byte_order
+        self.entries = entries
+        self.next_offset = next_offset
+
+    def __contains__(self, tag):
+        return tag in self.entries
+
+    def raw_value(self, f, base, tag):
+        value_type, count, value_field = self.entries[tag]
+        size = TIFF_TYPE_SIZES.get(value_type, 1) * count
+        if size <= 4:
+            return value_field[:size]
+        offset, = struct.unpack(self.byte_order + 'I', value_field)
+        f.seek(base + offset)
+        return f.read(size)
+
+    def integers(self, f, base, tag):
+        value_type, count, _ = self.entries[tag]
+        format_char = {3: 'H', 4: 'I', 8: 'h', 9: 'i', 13: 'I'}.get(value_type)
+        if format_char is None:
+            return []
+        data = self.raw_value(f, base, tag)
+        if len(data) < count * struct.calcsize(format_char):
+            return []
+        return list(
+            struct.unpack(f'{self.byte_order}{count}{format_char}', data))
+
+    def integer(self, f, base, tag):
+        values = self.integers(f, base, tag)
+        return values[0] if values else None
+
+
+def read_tiff_byte_order(f, base=0):
+    f.seek(base)
+    header = f.read(8)
+    if len(header) < 8:
+        return None, None
+    if header[:4] == TIFF_LITTLE_ENDIAN:
+        byte_order = '<'
+    elif header[:4] == TIFF_BIG_ENDIAN:
+        byte_order = '>'
+    else:
+        return None, None
+    first_ifd_offset, = struct.unpack(byte_order + 'I', header[4:])
+    return byte_order, first_ifd_offset
+
+
+def read_tiff_ifd(f, base, byte_order, offset):
+    f.seek(base + offset)
+    count_data = f.read(2)
+    if len(count_data) < 2:
+        return None
+    count, = struct.unpack(byte_order + 'H', count_data)
+    if count > MAX_IFD_ENTRIES:
+        return None
+    data = f.read(12 * count + 4)
+    if len(data) < 12 * count:
+        return None
+    entries = {}
+    for i in range(count):
+        tag, value_type, value_count = struct.unpack(
+            byte_order + 'HHI', data[12 * i:12 * i + 8])
+        entries[tag] = (value_type, value_count, data[12 * i + 8:12 * i + 12])
+    next_data = data[12 * count:12 * count + 4]
+    next_offset = struct.unpack(byte_order +
+                                'I', next_data)[0] if len(next_data) == 4 else 0
+    return TiffIFD(byte_order, entries, next_offset)
+
+
+def parse_exif_time(raw_value):
+    match = EXIF_TIME_RE.match(raw_value)
+    if not match:
+        return None
+    year, month, day, hour, minute, second = map(int, match.groups())
+    if hour == 24:
+        hour = 0
+    try:
+        return datetime.datetime(year, month, day, hour, minute,
+                                 second).strftime(TIME_FORMAT)
+    except ValueError:
+        return None
+
+
+def normalize_time_string(time_string):
+    # Times cached by earlier versions may have fractions of seconds or a UTC
+    # offset, which are dropped since capture times are local wall times
+    try:
+        time_string = datetime.datetime.fromisoformat(time_string).strftime(
+            TIME_FORMAT)
+    except (TypeError, ValueError):
+        return None
+    return time_string if len(time_string) == TIME_LENGTH else None
+
+
+def read_tiff_capture_time(f, base=0):
+    byte_order, ifd0_offset = read_tiff_byte_order(f, base)
+    if byte_order is None:
+        return None
+    ifd0 = read_tiff_ifd(f, base, byte_order, ifd0_offset)
+    if ifd0 is None:
+        return None
+    return read_ifd_capture_time(f, base, byte_order, ifd0)
+
+
+def read_ifd_capture_time(f, base, byte_order, ifd0):
+    if TAG_EXIF_IFD_POINTER not in ifd0:
+        return None
+    exif_offset = ifd0.integer(f, base, TAG_EXIF_IFD_POINTER)
+    if exif_offset is None:
+        return None
+    exif_ifd = read_tiff_ifd(f, base, byte_order, exif_offset)
+    if exif_ifd is None or TAG_DATE_TIME_ORIGINAL not in exif_ifd:
+        return None
+    return parse_exif_time(
+        exif_ifd.raw_value(f, base, TAG_DATE_TIME_ORIGINAL))
+
+
+def iterate_jpeg_segments(f, offset=0):
+    # Yields the marker and payload length of each segment before the image
+    # data, with the file positioned at the start of the payload
+    f.seek(offset)
+    if f.read(2) != JPEG_SOI:
+        return
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xff:
+            return
+        while marker[1] == 0xff:
+            marker = marker[1:] + f.read(1)
+            if len(marker) < 2:
+                return
+        if marker[1] in (JPEG_SOS, JPEG_EOI):
+            return
+        length_data = f.read(2)
+        if len(length_data) < 2:
+            return
+        length, = struct.unpack('>H', length_data)
+        if length < 2:
+            return
+        payload_offset = f.tell()
+        yield marker[1], length - 2
+        f.seek(payload_offset + length - 2)
+
+
+def find_jpeg_exif_segment(f):
+    for marker, length in iterate_jpeg_segments(f):
+        if marker == JPEG_APP1 and length > 6:
+            segment = f.read(length)
+            if segment.startswith(EXIF_HEADER):
+                return segment[len(EXIF_HEADER):]
+    return None
+
+
+def read_jpeg_dimensions(f, offset):
+    for marker, length in iterate_jpeg_segments(f, offset):
+        if marker in JPEG_PREVIEW_FRAMES and length >= 5:
+            _, height, width = struct.unpack('>BHH', f.read(5))
+            return width, height
+        if marker in JPEG_FRAMES:
+            return None
+    return None
+
+
+def read_jpeg_capture_time(f):
+    tiff_data = find_jpeg_exif_segment(f)
+    if tiff_data is None:
+        return None
+    return read_tiff_capture_time(io.BytesIO(tiff_data))
+
+
+def iterate_boxes(data, start=0, end=None):
+    end = len(data) if end is None else end
+    position = start
+    while position + 8 <= end:
+        size, box_type = struct.unpack('>I4s', data[position:position + 8])
+        header_size = 8
+        if size == 1:
+            if position + 16 > end:
+                return
+            size, = struct.unpack('>Q', data[position + 8:position + 16])
+            header_size = 16
+        elif size == 0:
+            size = end - position
+        if size < header_size or position + size > end:
+            return
+        yield box_type, position + header_size, position + size
+        position += size
+
+
+def read_heif_meta_box(f):
+    f.seek(0)
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        size, box_type = struct.unpack('>I4s', header)
+        header_size = 8
+        if size == 1:
+            size, = struct.unpack('>Q', f.read(8))
+            header_size = 16
+        elif size == 0:
+            size = None
+        if box_type == b'meta':
+            payload_size = MAX_META_BOX_SIZE if size is None else size - header_size
+            if payload_size > MAX_META_BOX_SIZE:
+                return None
+            return f.read(payload_size)
+        if size is None or size < header_size:
+            return None
+        f.seek(size - header_size, io.SEEK_CUR)
+
+
+def parse_heif_item_types(data, start, end):
+    version = data[start]
+    position = start + 4
+    if version == 0:
+        position += 2
+    else:
+        position += 4
+    item_types = {}
+    for box_type, box_start, _ in iterate_boxes(data, position, end):
+        if box_type != b'infe':
+            continue
+        infe_version = data[box_start]
+        if infe_version < 2:
+            continue
+        position = box_start + 4
+        if infe_version == 2:
+            item_id, = struct.unpack('>H', data[position:position + 2])
+            position += 2
+        else:
+            item_id, = struct.unpack('>I', data[position:position + 4])
+            position += 4
+        item_types[item_id] = data[position + 2:position + 6]
+    return item_types
+
+
+def parse_heif_item_locations(data, start, end):
+    def read_uint(position, size):
+        if size == 0:
+            return 0, position
+        value = int.from_bytes(data[position:position + size], 'big')
+        return value, position + size
+
+    version = data[start]
+    position = start + 4
+    offset_size = data[position] >> 4
+    length_size = data[position] & 0xf
+    base_offset_size = data[position + 1] >> 4
+    index_size = data[position + 1] & 0xf if version in (1, 2) else 0
+    position += 2
+    if version < 2:
+        item_count, position = read_uint(position, 2)
+    else:
+        item_count, position = read_uint(position, 4)
+
+    locations = {}
+    for _ in range(item_count):
+        if position >= end:
+            break
+        item_id, position = read_uint(position, 2 if version < 2 else 4)
+        construction_method = 0
+        if version in (1, 2):
+            construction_method, position = read_uint(position, 2)
+            construction_method &= 0xf
+        _, position = read_uint(position, 2)
+        base_offset, position = read_uint(position, base_offset_size)
+        extent_count, position = read_uint(position, 2)
+        extents = []
+        for _ in range(extent_count):
+            _, position = read_uint(position, index_size)
+            extent_offset, position = read_uint(position, offset_size)
+            extent_length, position = read_uint(position, length_size)
+            extents.append((base_offset + extent_offset, extent_length))
+        if construction_method == 0:
+            locations[item_id] = extents
+    return locations
+
+
+def read_heif_items(f):
+    meta = read_heif_meta_box(f)
+    if meta is None or len(meta) < 4:
+        return {}
+    item_types = {}
+    locations = {}
+    for box_type, box_start, box_end in iterate_boxes(meta, 4):
+        if box_type == b'iinf':
+            item_types = parse_heif_item_types(meta, box_start, box_end)
+        elif box_type == b'iloc':
+            locations = parse_heif_item_locations(meta, box_start, box_end)
+    items = collections.defaultdict(list)
+    for item_id, item_type in item_types.items():
+        if item_id in locations:
+            items[item_type].append(locations[item_id])
+    return items
+
+
+def find_heif_items(f, wanted_type):
+    return read_heif_items(f).get(wanted_type, [])
+
+
+def read_heif_capture_time(f, exif_items=None):
+    if exif_items is None:
+        exif_items = find_heif_items(f, b'Exif')
+    for extents in exif_items:
+        if not extents:
+            continue
+        offset, _ = extents[0]
+        f.seek(offset)
+        header_offset_data = f.read(4)
+        if len(header_offset_data) < 4:
+            continue
+        tiff_header_offset, = struct.unpack('>I', header_offset_data)
+        time_string = read_tiff_capture_time(f, offset + 4 + tiff_header_offset)
+        if time_string is None:
+            time_string = read_tiff_capture_time(
+                f, offset + 4 + tiff_header_offset + len(EXIF_HEADER))
+        if time_string is not None:
+            return time_string
+    return None
+
+
+def find_tiff_previews(f, base, ifd):
+    candidates = []
+    if TAG_JPEG_OFFSET in ifd and TAG_JPEG_LENGTH in ifd:
+        candidates.append(([ifd.integer(f, base, TAG_JPEG_OFFSET)],
+                           [ifd.integer(f, base, TAG_JPEG_LENGTH)]))
+    has_strips = TAG_STRIP_OFFSETS in ifd and TAG_STRIP_BYTE_COUNTS in ifd
+    if has_strips and TAG_COMPRESSION in ifd and ifd.integer(
+            f, base, TAG_COMPRESSION) in JPEG_COMPRESSIONS:
+        candidates.append((ifd.integers(f, base, TAG_STRIP_OFFSETS),
+                           ifd.integers(f, base, TAG_STRIP_BYTE_COUNTS)))
+    previews = []
+    for offsets, lengths in candidates:
+        # Every strip of a JPEG-compressed image is a JPEG stream of its
+        # own, so only single strips can be used as they are
+        if len(offsets) != 1 or len(lengths) != 1 or None in (
+                offsets[0], lengths[0]) or lengths[0] > MAX_PREVIEW_BYTES:
+            continue
+        dimensions = read_jpeg_dimensions(f, base + offsets[0])
+        if dimensions is not None:
+            previews.append(
+                PreviewLocation([(base + offsets[0], lengths[0])],
+                                *dimensions, None))
+    return previews
+
+
+def largest_preview(previews):
+    return max(previews,
+               key=lambda preview: preview.width * preview.height,
+               default=None)
+
+
+def read_tiff_metadata(f, base=0):
+    # RAW formats based on TIFF keep their previews in IFD0, in the IFDs
+    # chained after it or in SubIFDs, either as a JPEG thumbnail or as a
+    # JPEG-compressed strip. The capture time and orientation are found
+    # through IFD0 along the way.
+    byte_order, ifd0_offset = read_tiff_byte_order(f, base)
+    if byte_order is None:
+        return None, None
+    time_string = None
+    orientation = None
+    previews = []
+    pending_offsets = collections.deque([ifd0_offset])
+    visited_offsets = set()
+    while pending_offsets and len(visited_offsets) < MAX_PREVIEW_IFDS:
+        offset = pending_offsets.popleft()
+        if offset == 0 or offset in visited_offsets:
+            continue
+        visited_offsets.add(offset)
+        ifd = read_tiff_ifd(f, base, byte_order, offset)
+        if ifd is None:
+            continue
+        if offset == ifd0_offset:
+            time_string = read_ifd_capture_time(f, base, byte_order, ifd)
+            if TAG_ORIENTATION in ifd:
+                orientation = ifd.integer(f, base, TAG_ORIENTATION)
+        previews.extend(find_tiff_previews(f, base, ifd))
+        pending_offsets.append(ifd.next_offset)
+        if TAG_SUB_IFDS in ifd:
+            pending_offsets.extend(ifd.integers(f, base, TAG_SUB_IFDS))
+    preview = largest_preview(previews)
+    if preview is not None:
+        preview = preview._replace(orientation=orientation)
+    return time_string, preview
+
+
+def read_heif_metadata(f):
+    # HEIF files may carry JPEG items next to the HEVC coded image, which
+    # can be shown without decoding any HEVC
+    items = read_heif_items(f)
+    previews = []
+    for extents in items.get(b'jpeg', []):
+        if not extents or sum(length for _, length in
+                              extents) > MAX_PREVIEW_BYTES:
+            continue
+        dimensions = read_jpeg_dimensions(f, extents[0][0])
+        if dimensions is not None:
+            previews.append(PreviewLocation(extents, *dimensions, None))
+    return read_heif_capture_time(f, items.get(b'Exif',
+                                               [])), largest_preview(previews)
+
+
+def read_preview_data(f, preview):
+    chunks = []
+    for offset, length in preview.extents:
+        f.seek(offset)
+        chunk = f.read(length)
+        if len(chunk) < length:
+            raise ValueError('Preview extends past the end of the file')
+        chunks.append(chunk)
+    data = b''.join(chunks)
+    if not data.startswith(JPEG_SOI):
+        raise ValueError('Preview is not a JPEG')
+    return data
+
+
+def is_heif_header(header):
+    return len(header) >= 12 and header[4:8] == b'ftyp' and header[
+        8:12] in HEIF_BRANDS
+
+
+def read_exif_capture_time(f):
+    header = f.read(12)
+    if header.startswith(JPEG_SOI):
+        return read_jpeg_capture_time(f)
+    elif header[:4] in (TIFF_LITTLE_ENDIAN, TIFF_BIG_ENDIAN):
+        return read_tiff_capture_time(f)
+    elif is_heif_header(header):
+        return read_heif_capture_time(f)
+    return None
+
+
+def read_exif_metadata(f):
+    header = f.read(12)
+    if header[:4] in (TIFF_LITTLE_ENDIAN, TIFF_BIG_ENDIAN):
+        return read_tiff_metadata(f)
+    elif is_heif_header(header):
+        return read_heif_metadata(f)
+    f.seek(0)
+    return read_exif_capture_time(f), None
+
+
+def format_modification_time(stat_result):
+    return datetime.datetime.fromtimestamp(
+        stat_result.st_mtime).strftime(TIME_FORMAT)
+
+
+def read_capture_time(filename):
+    try:
+        with open(filename, 'rb') as f:
+            time_string = read_exif_capture_time(f)
+    except (OSError, struct.error, IndexError):
+        time_string = None
+    if time_string is not None:
+        return time_string
+    try:
+        return format_modification_time(os.stat(filename))
+    except OSError:
+        return None
+
+
+class MetadataExtractor:
+    def __init__(self,
+                 max_workers=None,
+                 use_processes=False,
+                 chunksize=64,
+                 scheduler=None,
+                 preview_cache=None):
+        self._max_workers = max_workers
+        self._use_processes = use_processes
+        self._chunksize = chunksize
+        self._scheduler = scheduler
+        self._preview_cache = preview_cache
+
+    @property
+    def max_workers(self):
+        return self._max_workers
+
+    @property
+    def use_processes(self):
+        # Previews are written by the extracting workers, which has to
+        # happen in this process for the cache to know about them
+        return self._use_processes and self._preview_cache is None
+
+    def extract_times(self, filenames):
+        filenames = list(filenames)
+        read_time = read_capture_time if self._preview_cache is None else self._preview_cache.read_capture_time
+        if self._scheduler is not None:
+            return self._scheduler.map(read_time, filenames)
+        if self.max_workers == 1 or len(filenames) <= 1:
+            return list(map(read_time, filenames))
+
+        executor_class = concurrent.futures.ProcessPoolExecutor if self.use_processes else concurrent.futures.ThreadPoolExecutor
+        with executor_class(max_workers=self.max_workers) as executor:
+            return list(
+                executor.map(read_time, filenames,
+                             chunksize=self._chunksize))
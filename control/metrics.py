@@ -0,0 +1,162 @@
+import os
+import time
+import threading
+import contextlib
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def read_rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label_value(value)}"'
+                          for name, value in labels) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._types = {}
+        self._descriptions = {}
+        self._values = {}
+        self._start_time = time.time()
+
+    def increment(self, name, value=1, description=None, **labels):
+        key = self._register(name, 'counter', description, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set_gauge(self, name, value, description=None, **labels):
+        key = self._register(name, 'gauge', description, labels)
+        with self._lock:
+            self._values[key] = value
+
+    def observe(self, name, duration, description=None, **labels):
+        key = self._register(name, 'summary', description, labels)
+        with self._lock:
+            count, total = self._values.get(key, (0, 0.0))
+            self._values[key] = (count + 1, total + duration)
+
+    @contextlib.contextmanager
+    def timer(self, name, description=None, **labels):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name,
+                         time.perf_counter() - start_time,
+                         description=description,
+                         **labels)
+
+    def value(self, name, **labels):
+        with self._lock:
+            return self._values.get((name, tuple(sorted(labels.items()))))
+
+    def render(self):
+        rss_bytes = read_rss_bytes()
+        if rss_bytes is not None:
+            self.set_gauge('dpf_process_resident_memory_bytes',
+                           rss_bytes,
+                           description='Resident set size of the process.')
+        self.set_gauge('dpf_process_uptime_seconds',
+                       time.time() - self._start_time,
+                       description='Time since the metrics were set up.')
+
+        with self._lock:
+            values = sorted(self._values.items())
+            lines = []
+            current_name = None
+            for (name, labels), value in values:
+                if name != current_name:
+                    current_name = name
+                    if name in self._descriptions:
+                        lines.append(f'# HELP {name} {self._descriptions[name]}')
+                    lines.append(f'# TYPE {name} {self._types[name]}')
+                label_text = format_labels(labels)
+                if self._types[name] == 'summary':
+                    count, total = value
+                    lines.append(f'{name}_count{label_text} {count}')
+                    lines.append(
+                        f'{name}_sum{label_text} {format_value(total)}')
+                else:
+                    lines.append(f'{name}{label_text} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        # Written to a temporary file first so that a collector reading the
+        # file never sees it half-written
+        path = str(path)
+        temporary_path = f'{path}.tmp'
+        with open(temporary_path, 'w') as f:
+            f.write(self.render())
+        os.replace(temporary_path, path)
+
+    def serve(self, port, host='127.0.0.1'):
+        import http.server
+
+        registry = self
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def _register(self, name, metric_type, description, labels):
+        registered_type = self._types.setdefault(name, metric_type)
+        if registered_type != metric_type:
+            raise ValueError(
+                f'Metric {name} is a {registered_type}, not a {metric_type}')
+        if description is not None:
+            self._descriptions.setdefault(name, description)
+        return (name, tuple(sorted(labels.items())))
+
+
+registry = MetricsRegistry()
+
+
+def increment(name, value=1, description=None, **labels):
+    registry.increment(name, value=value, description=description, **labels)
+
+
+def set_gauge(name, value, description=None, **labels):
+    registry.set_gauge(name, value, description=description, **labels)
+
+
+def observe(name, duration, description=None, **labels):
+    registry.observe(name, duration, description=description, **labels)
+
+
+def timer(name, description=None, **labels):
+    return registry.timer(name, description=description, **labels)
@@ -0,0 +1,250 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from log import log_info, log_error
+from scanner import ImageScanner
+from catalog import escape_like
+
+DIRECTORY_MIMETYPE = 'httpd/unix-directory'
+IMAGE_MIMEPART = 'image'
+
+
+def hash_path(internal_path):
+    return hashlib.md5(internal_path.encode('utf-8',
+                                            'surrogateescape')).hexdigest()
+
+
+class SQLiteDatabase:
+    # Stands in for Database when Nextcloud keeps its tables in SQLite. The
+    # statements are written for the MySQL connector, so the placeholders
+    # are translated before executing them.
+    def __init__(self, path):
+        self._path = str(path)
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(self._path,
+                                           check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+
+    @property
+    def name(self):
+        return self._path
+
+    def __enter__(self):
+        self._lock.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self._lock.release()
+
+    def read_rows(self, statement, params=()):
+        return self._connection.execute(statement.replace('%s', '?'),
+                                        params).fetchall()
+
+    def close(self):
+        self._connection.close()
+
+
+class NextcloudFileSource:
+    def __init__(self,
+                 database,
+                 base_path='/mnt/hdd1',
+                 table_prefix='oc_',
+                 storage_id_format='home::{user}',
+                 recursive=False,
+                 max_depth=None):
+        self._database = database
+        self._base_path = os.path.normpath(str(base_path))
+        self._storage_id_format = storage_id_format
+        self._recursive = recursive
+        self._max_depth = max_depth if recursive else 1
+        # Paths outside the Nextcloud data folder and files not yet in the
+        # file cache are still found by looking at the disk
+        self._fallback_scanner = ImageScanner(recursive=recursive,
+                                              max_depth=max_depth)
+        self._listings = {}
+
+        self._access_statement = f'SELECT 1 FROM {table_prefix}filecache LIMIT 1'
+        self._entry_statement = f'''
+            SELECT c.fileid, c.etag, c.mtime, c.size, m.mimetype, p.mimetype AS mimepart
+            FROM {table_prefix}filecache c
+            JOIN {table_prefix}storages s ON s.numeric_id = c.storage
+            JOIN {table_prefix}mimetypes m ON m.id = c.mimetype
+            JOIN {table_prefix}mimetypes p ON p.id = c.mimepart
+            WHERE s.id = %s AND c.path_hash = %s'''
+        self._children_statement = f'''
+            SELECT c.name FROM {table_prefix}filecache c
+            JOIN {table_prefix}mimetypes p ON p.id = c.mimepart
+            WHERE c.parent = %s AND p.mimetype = %s AND c.size > 0'''
+        self._descendants_statement = f'''
+            SELECT c.path FROM {table_prefix}filecache c
+            JOIN {table_prefix}storages s ON s.numeric_id = c.storage
+            JOIN {table_prefix}mimetypes p ON p.id = c.mimepart
+            WHERE s.id = %s AND c.path LIKE %s ESCAPE '!' AND p.mimetype = %s AND c.size > 0'''
+
+    @property
+    def recursive(self):
+        return self._recursive
+
+    @property
+    def max_depth(self):
+        return self._max_depth
+
+    def check_access(self):
+        # Raises when the account cannot read the file cache
+        with self._database as database:
+            database.read_rows(self._access_statement)
+
+    def locate(self, path):
+        relative_path = os.path.relpath(os.path.normpath(str(path)),
+                                        self._base_path)
+        parts = relative_path.split(os.sep)
+        if relative_path.startswith(
+                os.pardir) or len(parts) < 2 or parts[1] != 'files':
+            return None
+        return parts[0], '/'.join(parts[1:])
+
+    def scan(self, paths):
+        for path in paths:
+            path = str(path)
+            try:
+                filenames = self._find_in_file_cache(path)
+            except Exception as e:
+                log_error(
+                    f'Could not read {path} from the Nextcloud file cache, scanning the disk instead: {e}'
+                )
+                filenames = None
+            if filenames is None:
+                yield from self._fallback_scanner.scan([path])
+            else:
+                yield from filenames
+
+    def folder_versions(self, paths):
+        versions = {}
+        for path in map(str, paths):
+            location = self.locate(path)
+            entry = None if location is None else self._read_entry(*location)
+            # Nextcloud propagates a new etag to every parent folder when a
+            # file changes, so the folder row alone tells whether its
+            # contents changed
+            versions[path] = None if entry is None else (entry['etag'],
+                                                         entry['mtime'])
+        return versions
+
+    def clear_cache(self):
+        self._listings = {}
+        self._fallback_scanner.clear_cache()
+
+    def _find_in_file_cache(self, path):
+        location = self.locate(path)
+        entry = None if location is None else self._read_entry(*location)
+        if entry is None:
+            return None
+        if entry['mimetype'] == DIRECTORY_MIMETYPE:
+            return self._list_folder(path, location, entry)
+        if entry['mimepart'] == IMAGE_MIMEPART and entry['size'] > 0:
+            return [path]
+        return []
+
+    def _read_entry(self, user, internal_path):
+        with self._database as database:
+            rows = database.read_rows(
+                self._entry_statement,
+                (self._storage_id_format.format(user=user),
+                 hash_path(internal_path)))
+        return rows[0] if rows else None
+
+    def _list_folder(self, path, location, entry):
+        version = (entry['etag'], entry['mtime'])
+        listing = self._listings.get(path)
+        if listing is None or listing[0] != version:
+            listing = (version, self._query_folder(path, location, entry))
+            self._listings[path] = listing
+        return listing[1]
+
+    def _query_folder(self, path, location, entry):
+        user, internal_path = location
+        with self._database as database:
+            if not self._recursive:
+                rows = database.read_rows(self._children_statement,
+                                          (entry['fileid'], IMAGE_MIMEPART))
+                return [os.path.join(path, row['name']) for row in rows]
+
+            rows = database.read_rows(
+                self._descendants_statement,
+                (self._storage_id_format.format(user=user),
+                 escape_like(internal_path) + '/%', IMAGE_MIMEPART))
+        prefix = internal_path + '/'
+        filenames = []
+        for row in rows:
+            # LIKE ignores case with the usual collations
+            if not row['path'].startswith(prefix):
+                continue
+            relative_path = row['path'][len(prefix):]
+            if self._max_depth is None or relative_path.count(
+                    '/') < self._max_depth:
+                filenames.append(os.path.join(path, relative_path))
+        return filenames
+
+
+class NextcloudWatcher:
+    def __init__(self, file_manager, file_source, poll_interval=30.0):
+        self._file_manager = file_manager
+        self._file_source = file_source
+        self._poll_interval = poll_interval
+
+        self._versions = None
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._fallback_watcher = None
+
+    @property
+    def file_manager(self):
+        return self._file_manager
+
+    @property
+    def has_pending_changes(self):
+        return False
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._fallback_watcher is not None:
+            self._fallback_watcher.stop()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run(self):
+        while not self._stop_event.wait(self._poll_interval):
+            folders = list(self.file_manager.settings.folders or [])
+            try:
+                versions = self._file_source.folder_versions(folders)
+            except Exception as e:
+                log_error(
+                    f'Could not read the Nextcloud file cache, watching the folders with inotify instead: {e}'
+                )
+                self._run_fallback()
+                return
+            # A change of folders is handled when the settings are reread
+            if self._versions is not None and versions.keys(
+            ) == self._versions.keys() and versions != self._versions:
+                start_time = time.perf_counter()
+                self.file_manager.rescan()
+                log_info(
+                    f'Rescanned after Nextcloud file cache changes in {time.perf_counter() - start_time:.2f} s.'
+                )
+            self._versions = versions
+
+    def _run_fallback(self):
+        # Files uploaded through Nextcloud end up on the disk as well, so
+        # inotify still notices them without the file cache
+        from watcher import LibraryWatcher
+        self._fallback_watcher = LibraryWatcher(self.file_manager)
+        if not self._stop_event.is_set():
+            self._fallback_watcher.run()
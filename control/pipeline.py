@@ -0,0 +1,96 @@
+import queue
+import threading
+
+POLL_INTERVAL = 0.1
+
+_END = object()
+
+
+class _Failure:
+    def __init__(self, exception):
+        self.exception = exception
+
+
+def batched(iterable, batch_size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Pipeline:
+    # Runs each stage in its own thread, connected by bounded queues so that
+    # a fast stage cannot run far ahead of a slow one. A stage is a function
+    # taking an iterator over the items of the previous stage and yielding
+    # its own, and the items of the last stage are yielded in order while
+    # the earlier stages keep working.
+    def __init__(self, source, stages, queue_size=4):
+        self._source = source
+        self._stages = list(stages)
+        self._queue_size = queue_size
+        self._stop_event = threading.Event()
+
+    def __iter__(self):
+        queues = [
+            queue.Queue(maxsize=self._queue_size)
+            for _ in range(len(self._stages) + 1)
+        ]
+        threads = [
+            threading.Thread(target=self._feed,
+                             args=(iter(self._source), queues[0]),
+                             daemon=True)
+        ] + [
+            threading.Thread(target=self._feed,
+                             args=(stage(self._drain(queues[i])),
+                                   queues[i + 1]),
+                             daemon=True)
+            for i, stage in enumerate(self._stages)
+        ]
+        self._stop_event.clear()
+        for thread in threads:
+            thread.start()
+        try:
+            yield from self._drain(queues[-1])
+        finally:
+            # Also reached when the consumer stops early, in which case the
+            # stages give up at their next queue operation
+            self._stop_event.set()
+            for thread in threads:
+                thread.join()
+
+    def _feed(self, items, output_queue):
+        try:
+            for item in items:
+                if not self._put(output_queue, item):
+                    return
+        except Exception as e:
+            self._put(output_queue, _Failure(e))
+            return
+        self._put(output_queue, _END)
+
+    def _put(self, output_queue, item):
+        while not self._stop_event.is_set():
+            try:
+                output_queue.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _drain(self, input_queue):
+        while True:
+            try:
+                item = input_queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if self._stop_event.is_set():
+                    return
+                continue
+            if item is _END:
+                return
+            if isinstance(item, _Failure):
+                raise item.exception
+            yield item
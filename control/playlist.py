@@ -0,0 +1,88 @@
+import os
+import hashlib
+
+FILENAME_ENCODING = 'utf-8'
+FILENAME_ERRORS = 'surrogateescape'
+LINES_PER_CHUNK = 1024
+READ_CHUNK_SIZE = 1 << 16
+
+
+def playlist_chunks(filenames):
+    # Encodes the list the same way as a newline-joined string, but in small
+    # pieces so that the whole list never has to exist as one string
+    batch = []
+    separator = b''
+    for filename in filenames:
+        batch.append(filename)
+        if len(batch) == LINES_PER_CHUNK:
+            yield separator + '\n'.join(batch).encode(FILENAME_ENCODING,
+                                                      FILENAME_ERRORS)
+            separator = b'\n'
+            batch = []
+    if batch:
+        yield separator + '\n'.join(batch).encode(FILENAME_ENCODING,
+                                                  FILENAME_ERRORS)
+
+
+def chunks_digest(chunks):
+    digest = hashlib.blake2b()
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_digest(path):
+    try:
+        with open(path, 'rb') as f:
+            return chunks_digest(iter(lambda: f.read(READ_CHUNK_SIZE), b''))
+    except OSError:
+        return None
+
+
+def write_atomically(path, chunks):
+    path = str(path)
+    temporary_path = f'{path}.tmp'
+    try:
+        with open(temporary_path, 'wb') as f:
+            f.writelines(chunks)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, path)
+    except:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    # Makes the rename itself survive a power cut
+    directory_fd = os.open(os.path.dirname(path) or '.', os.O_RDONLY)
+    try:
+        os.fsync(directory_fd)
+    finally:
+        os.close(directory_fd)
+
+
+class PlaylistWriter:
+    def __init__(self, path, skip_unchanged=True):
+        self._path = path
+        self._skip_unchanged = skip_unchanged
+        self._digest = None
+
+    @property
+    def path(self):
+        return self._path
+
+    def write(self, filenames):
+        if not self._skip_unchanged:
+            write_atomically(self._path, playlist_chunks(filenames))
+            self._digest = None
+            return True
+
+        # Hashing the list is much cheaper than writing it to the SD card,
+        # so the list is hashed first and only written when it differs
+        digest = chunks_digest(playlist_chunks(filenames))
+        if self._digest is None:
+            self._digest = file_digest(self._path)
+        if digest == self._digest:
+            return False
+        write_atomically(self._path, playlist_chunks(filenames))
+        self._digest = digest
+        return True
@@ -0,0 +1,124 @@
+import os
+import struct
+import metadata
+from file_cache import BoundedFileCache
+from playlist import write_atomically
+
+try:
+    import pillow_heif
+except ImportError:
+    pillow_heif = None
+
+HEIF_EXTENSIONS = ('.heic', '.heif')
+PREVIEW_EXTENSIONS = ('.cr2', '.nef', '.arw', '.dng') + HEIF_EXTENSIONS
+PARSE_ERRORS = (OSError, ValueError, struct.error, IndexError)
+
+
+def has_preview_extension(path):
+    return os.path.splitext(path)[1].lower() in PREVIEW_EXTENSIONS
+
+
+def heif_decoding_available():
+    return pillow_heif is not None
+
+
+def can_decode(path):
+    return heif_decoding_available() and os.path.splitext(
+        path)[1].lower() in HEIF_EXTENSIONS
+
+
+def build_orientation_segment(orientation):
+    # RAW previews leave the orientation to the tags of the RAW file, so it
+    # is carried over for the viewer in a minimal Exif segment of its own
+    tiff = struct.pack('<2sHIHHHIHHI', metadata.TIFF_LITTLE_ENDIAN[:2], 42, 8,
+                       1, metadata.TAG_ORIENTATION, 3, 1, orientation, 0, 0)
+    payload = metadata.EXIF_HEADER + tiff
+    return b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload
+
+
+def decode_heif(source_path, cache_path, quality=90):
+    # The rotation and mirroring of the image are applied by libheif, so the
+    # preview is written without the Exif orientation
+    image = pillow_heif.open_heif(source_path).to_pillow().convert('RGB')
+    temporary_path = f'{cache_path}.tmp'
+    try:
+        image.save(temporary_path, 'JPEG', quality=quality)
+    except:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    os.replace(temporary_path, cache_path)
+
+
+def write_preview(f, preview, cache_path):
+    data = metadata.read_preview_data(f, preview)
+    if preview.orientation in (None, 1):
+        chunks = [data]
+    else:
+        chunks = [
+            data[:2],
+            build_orientation_segment(preview.orientation), data[2:]
+        ]
+    write_atomically(cache_path, chunks)
+
+
+class PreviewCache(BoundedFileCache):
+    # Holds the full-size JPEG previews embedded in RAW and HEIF files, so
+    # that they can be shown without decoding sensor data or HEVC. Phone
+    # HEIC files embed HEVC thumbnails only, so with pillow-heif installed
+    # their image is decoded once in the background instead.
+    errors = PARSE_ERRORS + ((RuntimeError, )
+                             if pillow_heif is not None else ())
+    typical_entry_bytes = 4 << 20
+
+    def __init__(self, cache_dir, max_bytes=1 << 30, max_workers=1):
+        super().__init__(cache_dir, max_bytes, max_workers=max_workers)
+
+    def read_capture_time(self, filename):
+        # The capture time and the preview are found in the same pass over
+        # the tags, so scanning a new RAW file also caches its preview
+        if not has_preview_extension(filename):
+            return metadata.read_capture_time(filename)
+        try:
+            stat_result = os.stat(filename)
+        except OSError:
+            return None
+        time_string = None
+        cache_path = self.cache_path(filename, stat_result)
+        try:
+            with open(filename, 'rb') as f:
+                time_string, preview = metadata.read_exif_metadata(f)
+                if preview is None:
+                    # Keeps the file from being queued for extraction when
+                    # it is listed, as long as it is unchanged. A file that
+                    # can be decoded is left to the background extraction,
+                    # since decoding it would hold up the scan.
+                    if not can_decode(filename):
+                        self._mark_failed(cache_path)
+                elif not self.contains(cache_path):
+                    write_preview(f, preview, cache_path)
+                    self._add_entry(cache_path, os.path.getsize(cache_path))
+        except PARSE_ERRORS:
+            self._mark_failed(cache_path)
+        if time_string is not None:
+            return time_string
+        return metadata.format_modification_time(stat_result)
+
+    def extract_in_background(self, source_paths, callback=None):
+        return self.process_in_background(source_paths, callback=callback)
+
+    def _key_suffix(self):
+        return '\0preview'
+
+    def _handles(self, source_path):
+        return has_preview_extension(source_path)
+
+    def _create(self, source_path, cache_path):
+        with open(source_path, 'rb') as f:
+            _, preview = metadata.read_exif_metadata(f)
+            if preview is not None:
+                write_preview(f, preview, cache_path)
+                return
+        if not can_decode(source_path):
+            raise ValueError(f'No embedded preview in {source_path}')
+        decode_heif(source_path, cache_path)
@@ -0,0 +1,161 @@
+import os
+import io
+import sys
+import time
+import pathlib
+import datetime
+import contextlib
+import collections
+
+ENVIRONMENT_VARIABLE = 'DPF_PROFILE'
+MEGABYTE = float(1 << 20)
+
+PhaseResult = collections.namedtuple(
+    'PhaseResult', ['name', 'duration', 'peak_bytes', 'allocated_bytes'])
+
+# Shared so that a disabled phase costs a single global lookup
+NULL_PHASE = contextlib.nullcontext()
+
+_profiler = None
+
+
+def requested(flag=False):
+    return flag or os.environ.get(ENVIRONMENT_VARIABLE, '') not in ('', '0')
+
+
+def enable(directory, **kwargs):
+    global _profiler
+    _profiler = Profiler(directory, **kwargs)
+    return _profiler
+
+
+def enabled():
+    return _profiler is not None
+
+
+def phase(name):
+    return NULL_PHASE if _profiler is None else _profiler.phase(name)
+
+
+def report():
+    if _profiler is not None:
+        return _profiler.report()
+
+
+class Profiler:
+    def __init__(self, directory, n_top=10, n_frames=1):
+        # Imported here so that nothing is loaded unless profiling is enabled
+        import tracemalloc
+
+        self._directory = pathlib.Path(
+            directory) / datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._n_top = n_top
+        self._n_phases = 0
+        self._active = False
+        self._results = []
+        self._profiles = []
+        self._start_snapshot = None
+        self._end_snapshot = None
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(n_frames)
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        # A phase started inside another one is counted as part of the
+        # enclosing phase, since only one profiler can be active at a time
+        if self._active:
+            yield
+            return
+        import cProfile
+        import tracemalloc
+
+        self._active = True
+        self._n_phases += 1
+        prefix = f'{self._n_phases:03d}_{name}'
+        if self._start_snapshot is None:
+            self._start_snapshot = tracemalloc.take_snapshot()
+        start_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        profile = cProfile.Profile()
+        start_time = time.perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            duration = time.perf_counter() - start_time
+            end_memory, peak_memory = tracemalloc.get_traced_memory()
+            # Grouping the traces is slow, so the snapshots are only compared
+            # once per report, while each one is kept on disk for later study
+            self._end_snapshot = tracemalloc.take_snapshot()
+            self._active = False
+
+            profile.dump_stats(self._directory / f'{prefix}.prof')
+            self._end_snapshot.dump(
+                str(self._directory / f'{prefix}.tracemalloc'))
+            self._profiles.append(profile)
+            self._results.append(
+                PhaseResult(name, duration, peak_memory - start_memory,
+                            end_memory - start_memory))
+
+    def report(self, stream=None):
+        if not self._results:
+            return None
+        summary = self._format_summary()
+        with open(self._directory / 'summary.txt', 'a') as f:
+            f.write(summary + '\n')
+        print(summary, file=sys.stdout if stream is None else stream)
+        self._results = []
+        self._profiles = []
+        self._start_snapshot = None
+        return summary
+
+    def _format_summary(self):
+        import pstats
+
+        lines = [f'Profile written to {self._directory}', '']
+        lines.append(
+            f'{"phase":<24}{"time (s)":>10}{"peak (MiB)":>12}{"kept (MiB)":>12}'
+        )
+        for result in self._results:
+            lines.append(
+                f'{result.name:<24}{result.duration:10.3f}{result.peak_bytes/MEGABYTE:12.1f}{result.allocated_bytes/MEGABYTE:12.1f}'
+            )
+
+        stats = pstats.Stats(self._profiles[0], stream=io.StringIO())
+        for profile in self._profiles[1:]:
+            stats.add(profile)
+        # Own time shows where the time actually goes, including waits on
+        # MySQL, exiftool and the disk
+        entries = sorted(stats.stats.items(),
+                         key=lambda item: item[1][2],
+                         reverse=True)[:self._n_top]
+        lines += ['', f'{"own (s)":>9}{"total (s)":>11}{"calls":>9}  function']
+        for (filename, line_number,
+             function_name), (_, n_calls, own_time, total_time,
+                              _) in entries:
+            location = function_name if filename == '~' else f'{os.path.basename(filename)}:{line_number}({function_name})'
+            lines.append(
+                f'{own_time:9.3f}{total_time:11.3f}{n_calls:9d}  {location}')
+
+        import cProfile
+        import tracemalloc
+        ignored_filenames = (cProfile.__file__, tracemalloc.__file__,
+                             __file__)
+        allocations = [
+            allocation for allocation in self._end_snapshot.compare_to(
+                self._start_snapshot, 'lineno')
+            if allocation.traceback[0].filename not in ignored_filenames
+        ][:self._n_top]
+        lines += ['', f'{"kept (MiB)":>10}  allocated at']
+        for allocation in allocations:
+            frame = allocation.traceback[0]
+            lines.append(
+                f'{allocation.size_diff/MEGABYTE:10.2f}  {os.path.basename(frame.filename)}:{frame.lineno}'
+            )
+        return '\n'.join(lines)
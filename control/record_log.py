@@ -0,0 +1,326 @@
+import os
+import json
+import mmap
+import zlib
+import struct
+import threading
+import collections
+from catalog import in_folders, stat_files
+from metadata import TIME_LENGTH, normalize_time_string
+
+MAGIC = b'DPFLOG1\n'
+RECORD_HEADER = struct.Struct(f'<BQHqqQ{TIME_LENGTH}s')
+PUT = 1
+DELETE = 2
+EMPTY_TIME = b'\0' * TIME_LENGTH
+
+FILENAME_ENCODING = 'utf-8'
+FILENAME_ERRORS = 'surrogateescape'
+
+
+def encode_path(path):
+    return path.encode(FILENAME_ENCODING, FILENAME_ERRORS)
+
+
+def hash_path(encoded_path):
+    # Only used to find the record, whose stored path is always compared, so
+    # two cheap checksums are preferred over a cryptographic hash
+    return zlib.crc32(encoded_path) | zlib.adler32(encoded_path) << 32
+
+
+def pack_record(kind, encoded_path, size=0, mtime_ns=0, inode=0, time=None):
+    # The time field has a fixed width, which struct would silently pad or
+    # truncate a time of another length to
+    encoded_time = EMPTY_TIME if time is None else time.encode('ascii')
+    if len(encoded_time) != TIME_LENGTH:
+        raise ValueError(f'Invalid time string {time!r}')
+    return RECORD_HEADER.pack(kind, hash_path(encoded_path),
+                              len(encoded_path), size, mtime_ns, inode,
+                              encoded_time) + encoded_path
+
+
+class RecordLogCatalog:
+    def __init__(self,
+                 path,
+                 min_compaction_size=1 << 20,
+                 max_dead_fraction=0.5):
+        self._path = str(path)
+        self._min_compaction_size = min_compaction_size
+        self._max_dead_fraction = max_dead_fraction
+        self._lock = threading.RLock()
+
+        self._created = not os.path.exists(self._path)
+        self._fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+        if self._created or os.fstat(self._fd).st_size == 0:
+            os.write(self._fd, MAGIC)
+
+        # The index is only built when the catalog is first used, so that
+        # opening it costs nothing when no file times are needed
+        self._index = None
+        self._view = None
+        self._view_size = 0
+        self._file_size = os.fstat(self._fd).st_size
+        self._n_records = 0
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def created(self):
+        return self._created
+
+    @property
+    def file_size(self):
+        return self._file_size
+
+    def __len__(self):
+        with self._lock:
+            return len(self._get_index())
+
+    def lookup(self, stats, directory_rows=None):
+        # The index already makes every lookup a single read, so there are
+        # no directory rows to reuse
+        times = {}
+        stale_filenames = []
+        with self._lock:
+            index = self._get_index()
+            view = self._get_view()
+            unpack_from = RECORD_HEADER.unpack_from
+            header_size = RECORD_HEADER.size
+            for filename, stat_result in stats.items():
+                encoded_path = encode_path(filename)
+                offset = index.get(hash_path(encoded_path))
+                if offset is not None:
+                    _, _, path_length, size, mtime_ns, inode, time = unpack_from(
+                        view, offset)
+                    path_offset = offset + header_size
+                    if size == stat_result.st_size and mtime_ns == stat_result.st_mtime_ns and inode == stat_result.st_ino and view[
+                            path_offset:path_offset +
+                            path_length] == encoded_path:
+                        times[filename] = time.decode('ascii')
+                        continue
+                stale_filenames.append(filename)
+        return times, stale_filenames
+
+    def lookup_moved(self, stats, filenames):
+        # Records have no room for content fingerprints, so moved files are
+        # extracted again like new ones
+        return {}, list(filenames), {}
+
+    def update(self, entries, fingerprints=None):
+        records = [(encode_path(filename),
+                    (stat_result.st_size, stat_result.st_mtime_ns,
+                     stat_result.st_ino, time_string))
+                   for filename, stat_result, time_string in entries]
+        if not records:
+            return
+        with self._lock:
+            self._append([
+                pack_record(PUT, encoded_path, *values)
+                for encoded_path, values in records
+            ], [encoded_path for encoded_path, _ in records])
+
+    def remove(self, filenames):
+        with self._lock:
+            index = self._get_index()
+            view = self._get_view()
+            encoded_paths = []
+            for encoded_path in map(encode_path, filenames):
+                offset = index.get(hash_path(encoded_path))
+                # A colliding hash belongs to the record of another file,
+                # which must not be deleted in its place
+                if offset is not None and self._read_path(
+                        view, offset) == encoded_path:
+                    encoded_paths.append(encoded_path)
+            if encoded_paths:
+                self._append([
+                    pack_record(DELETE, encoded_path)
+                    for encoded_path in encoded_paths
+                ], encoded_paths)
+
+    def collect_garbage(self,
+                        directories,
+                        existing_filenames,
+                        recursive=False,
+                        folders=None):
+        directories = list(set(map(os.path.normpath, directories)))
+        if folders is not None:
+            folders = list(map(os.path.normpath, folders))
+        existing_filenames = set(existing_filenames)
+        with self._lock:
+            removed_filenames = [
+                filename for filename in self._iterate_paths()
+                if filename not in existing_filenames and in_folders(
+                    os.path.dirname(filename), directories, recursive)
+                or folders is not None and not in_folders(
+                    os.path.dirname(filename), folders, recursive)
+            ]
+        if removed_filenames:
+            self.remove(removed_filenames)
+        return len(removed_filenames)
+
+    def day_counts(self, directory, recursive=False):
+        # Counted from the records on every call, since the log keeps no
+        # aggregates
+        directory = os.path.normpath(str(directory))
+        prefix = os.path.join(directory, '')
+        counts = collections.Counter()
+        with self._lock:
+            for filename, time in self._iterate_times():
+                file_directory = os.path.dirname(filename)
+                if file_directory == directory or (
+                        recursive and file_directory.startswith(prefix)):
+                    counts[time[:10]] += 1
+        return list(counts.items())
+
+    def directories(self):
+        with self._lock:
+            return sorted(set(map(os.path.dirname, self._iterate_paths())))
+
+    def filenames(self, directory):
+        directory = str(directory)
+        with self._lock:
+            return [
+                filename for filename in self._iterate_paths()
+                if os.path.dirname(filename) == directory
+            ]
+
+    def scanned_mtimes(self, directories):
+        # Without stored day counts a directory can never stand in for a scan
+        return {}
+
+    def mark_scanned(self, directory_mtimes):
+        pass
+
+    def import_json(self, json_path):
+        try:
+            with open(json_path, 'r') as f:
+                file_times = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        entries = []
+        for filename, stat_result in stat_files(file_times).items():
+            time_string = normalize_time_string(file_times[filename])
+            if time_string is not None:
+                entries.append((filename, stat_result, time_string))
+        self.update(entries)
+        return len(entries)
+
+    def compact(self):
+        with self._lock:
+            index = self._get_index()
+            temporary_path = f'{self._path}.tmp'
+            with open(temporary_path, 'wb') as f:
+                f.write(MAGIC)
+                for offset in sorted(index.values()):
+                    f.write(self._read_raw_record(offset))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary_path, self._path)
+            self._close_view()
+            os.close(self._fd)
+            self._fd = os.open(self._path, os.O_RDWR)
+            self._file_size = os.fstat(self._fd).st_size
+            self._index = None
+
+    def close(self):
+        with self._lock:
+            self._close_view()
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def _get_index(self):
+        if self._index is None:
+            self._build_index()
+        return self._index
+
+    def _build_index(self):
+        self._index = {}
+        self._n_records = 0
+        view = self._get_view()
+        if view[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{self._path} is not a record log')
+        offset = len(MAGIC)
+        end = self._file_size
+        while offset + RECORD_HEADER.size <= end:
+            kind, path_hash, path_length = struct.unpack_from('<BQH', view,
+                                                              offset)
+            record_end = offset + RECORD_HEADER.size + path_length
+            if record_end > end or kind not in (PUT, DELETE):
+                break
+            if kind == PUT:
+                self._index[path_hash] = offset
+            else:
+                self._index.pop(path_hash, None)
+            self._n_records += 1
+            offset = record_end
+
+        if offset < end:
+            # Drops a record that was only partly written before a crash
+            self._close_view()
+            os.ftruncate(self._fd, offset)
+            self._file_size = offset
+
+    def _append(self, records, encoded_paths):
+        index = self._get_index()
+        data = b''.join(records)
+        offset = self._file_size
+        os.pwrite(self._fd, data, offset)
+        self._file_size += len(data)
+        for record, encoded_path in zip(records, encoded_paths):
+            path_hash = hash_path(encoded_path)
+            if record[0] == PUT:
+                index[path_hash] = offset
+            else:
+                index.pop(path_hash, None)
+            offset += len(record)
+        self._n_records += len(records)
+
+        if self._file_size > self._min_compaction_size and len(
+                index) < (1 - self._max_dead_fraction) * self._n_records:
+            self.compact()
+
+    def _read_raw_record(self, offset):
+        view = self._get_view()
+        path_length = struct.unpack_from('<H', view, offset + 9)[0]
+        return view[offset:offset + RECORD_HEADER.size + path_length]
+
+    def _iterate_paths(self):
+        index = self._get_index()
+        view = self._get_view()
+        for offset in index.values():
+            yield self._read_path(view, offset).decode(FILENAME_ENCODING,
+                                                       FILENAME_ERRORS)
+
+    @staticmethod
+    def _read_path(view, offset):
+        path_length = struct.unpack_from('<H', view, offset + 9)[0]
+        path_offset = offset + RECORD_HEADER.size
+        return view[path_offset:path_offset + path_length]
+
+    def _iterate_times(self):
+        index = self._get_index()
+        view = self._get_view()
+        for offset in index.values():
+            _, _, path_length, _, _, _, time = RECORD_HEADER.unpack_from(
+                view, offset)
+            path_offset = offset + RECORD_HEADER.size
+            yield view[path_offset:path_offset + path_length].decode(
+                FILENAME_ENCODING, FILENAME_ERRORS), time.decode('ascii')
+
+    def _get_view(self):
+        if self._view is None or self._view_size < self._file_size:
+            self._close_view()
+            self._view = mmap.mmap(self._fd,
+                                   self._file_size,
+                                   access=mmap.ACCESS_READ)
+            self._view_size = self._file_size
+        return self._view
+
+    def _close_view(self):
+        if self._view is not None:
+            self._view.close()
+        self._view = None
+        self._view_size = 0
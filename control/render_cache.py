@@ -0,0 +1,75 @@
+import os
+from file_cache import BoundedFileCache
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+CACHE_EXTENSION = '.jpg'
+TAG_ORIENTATION = 0x0112
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def pillow_available():
+    return Image is not None
+
+
+def load_screen_image(source_path, screen_size):
+    with Image.open(source_path) as image:
+        orientation = image.getexif().get(TAG_ORIENTATION, 1)
+        width, height = screen_size
+        if orientation in TRANSPOSED_ORIENTATIONS:
+            width, height = height, width
+        # Lets the JPEG decoder skip most of the work by decoding directly
+        # at a reduced scale that is still at least as large as the screen
+        image.draft('RGB', (width, height))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(screen_size, Image.LANCZOS)
+        return image.convert('RGB')
+
+
+def render_image(source_path, target_path, screen_size, quality=90):
+    image = load_screen_image(source_path, screen_size)
+    temporary_path = f'{target_path}.tmp'
+    try:
+        image.save(temporary_path, 'JPEG', quality=quality)
+    except:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    os.replace(temporary_path, target_path)
+
+
+class RenderCache(BoundedFileCache):
+    extension = CACHE_EXTENSION
+    errors = (OSError, ValueError) + ((Image.DecompressionBombError, )
+                                      if Image is not None else ())
+
+    def __init__(self,
+                 cache_dir,
+                 screen_size=(1920, 1080),
+                 max_bytes=2 << 30,
+                 max_workers=1,
+                 quality=90):
+        if Image is None:
+            raise ImportError('Pillow is required for the render cache')
+
+        self._screen_size = tuple(screen_size)
+        self._quality = quality
+        super().__init__(cache_dir, max_bytes, max_workers=max_workers)
+
+    def render(self, source_path):
+        return self.process(source_path)
+
+    def render_in_background(self, source_paths, callback=None):
+        return self.process_in_background(source_paths, callback=callback)
+
+    def _key_suffix(self):
+        return f'\0{self._screen_size}'
+
+    def _create(self, source_path, cache_path):
+        render_image(source_path,
+                     cache_path,
+                     self._screen_size,
+                     quality=self._quality)
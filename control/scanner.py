@@ -0,0 +1,107 @@
+import os
+from metadata import HEIF_BRANDS
+
+SNIFF_SIZE = 32
+TEXT_SNIFF_SIZE = 1024
+
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff'),
+    (b'\x00\x00\x01\x00', 'image/vnd.microsoft.icon'),
+    (b'8BPS', 'image/vnd.adobe.photoshop'),
+    (b'\x00\x00\x00\x0cjP  \r\n\x87\n', 'image/jp2'),
+    (b'\x00\x00\x00\x0cJXL \r\n\x87\n', 'image/jxl'),
+    (b'\xff\x0a', 'image/jxl'),
+    (b'gimp xcf', 'image/x-xcf'),
+)
+
+
+def sniff_image_type(header):
+    for signature, mime_type in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return mime_type
+    if header[:2] == b'BM' and header[6:10] == b'\x00\x00\x00\x00':
+        return 'image/bmp'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp'
+    if header[4:8] == b'ftyp' and header[8:12] in HEIF_BRANDS:
+        return 'image/avif' if header[8:12] in (b'avif',
+                                                b'avis') else 'image/heic'
+    if len(header) >= 3 and header[0:1] == b'P' and header[
+            1:2] in b'1234567' and header[2:3] in b' \t\r\n':
+        return 'image/x-portable-anymap'
+    if header.lstrip().startswith(b'<') and b'<svg' in header:
+        return 'image/svg+xml'
+    return None
+
+
+def read_image_type(path):
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(SNIFF_SIZE)
+            if header.lstrip().startswith(b'<'):
+                header += f.read(TEXT_SNIFF_SIZE - SNIFF_SIZE)
+    except OSError:
+        return None
+    return sniff_image_type(header)
+
+
+class ImageScanner:
+    def __init__(self, recursive=False, max_depth=None):
+        self._recursive = recursive
+        self._max_depth = max_depth if recursive else 1
+        self._type_cache = {}
+
+    @property
+    def recursive(self):
+        return self._recursive
+
+    @property
+    def max_depth(self):
+        return self._max_depth
+
+    def scan(self, paths):
+        for path in paths:
+            path = str(path)
+            try:
+                if os.path.isdir(path) and not os.path.islink(path):
+                    yield from self._scan_folder(path, 1)
+                elif os.path.isfile(path) and not os.path.islink(path):
+                    if self.is_image(path, os.stat(path)):
+                        yield path
+            except OSError:
+                continue
+
+    def is_image(self, path, stat_result):
+        key = (stat_result.st_dev, stat_result.st_ino, stat_result.st_mtime_ns)
+        is_image = self._type_cache.get(key)
+        if is_image is None:
+            is_image = stat_result.st_size > 0 and read_image_type(
+                path) is not None
+            self._type_cache[key] = is_image
+        return is_image
+
+    def clear_cache(self):
+        self._type_cache = {}
+
+    def _scan_folder(self, folder, depth):
+        try:
+            entries = os.scandir(folder)
+        except OSError:
+            return
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_file(follow_symlinks=False):
+                        if self.is_image(entry.path,
+                                         entry.stat(follow_symlinks=False)):
+                            yield entry.path
+                    elif entry.is_dir(follow_symlinks=False) and (
+                            self.max_depth is None or depth < self.max_depth):
+                        yield from self._scan_folder(entry.path, depth + 1)
+                except OSError:
+                    continue
@@ -0,0 +1,364 @@
+import os
+import time
+import random
+import threading
+import collections
+from log import log_info, log_error
+import metrics
+import io_scheduling
+from playlist import FILENAME_ENCODING, FILENAME_ERRORS
+from render_cache import load_screen_image, pillow_available
+
+try:
+    import tkinter
+    from PIL import ImageTk
+except ImportError:
+    tkinter = None
+
+DecodedImage = collections.namedtuple(
+    'DecodedImage', ['position', 'filename', 'image', 'decode_time'])
+
+
+def tkinter_available():
+    return tkinter is not None
+
+
+class NullScreen:
+    def __init__(self, size=(1920, 1080)):
+        self._size = tuple(size)
+        self._shown_filenames = []
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def shown_filenames(self):
+        return self._shown_filenames
+
+    def open(self):
+        self._shown_filenames = []
+
+    def show(self, decoded_image):
+        self._shown_filenames.append(decoded_image.filename)
+
+    def wait(self, duration, stop_event):
+        return stop_event.wait(duration)
+
+    def close(self):
+        pass
+
+
+class TkScreen:
+    def __init__(self):
+        if tkinter is None:
+            raise ImportError('tkinter is required for the slideshow screen')
+        self._root = None
+        self._label = None
+        self._photo = None
+        self._size = None
+
+    @property
+    def size(self):
+        return self._size
+
+    def open(self):
+        # Must be called from the thread that shows the images, since Tk is
+        # bound to the thread that created it
+        self._root = tkinter.Tk()
+        self._root.attributes('-fullscreen', True)
+        self._root.configure(background='black', cursor='none')
+        self._label = tkinter.Label(self._root,
+                                    background='black',
+                                    borderwidth=0)
+        self._label.pack(expand=True, fill='both')
+        self._root.update()
+        self._size = (self._root.winfo_screenwidth(),
+                      self._root.winfo_screenheight())
+
+    def show(self, decoded_image):
+        self._photo = ImageTk.PhotoImage(decoded_image.image)
+        self._label.configure(image=self._photo)
+        self._root.update()
+
+    def wait(self, duration, stop_event):
+        end_time = time.monotonic() + duration
+        while not stop_event.is_set():
+            self._root.update()
+            remaining_time = end_time - time.monotonic()
+            if remaining_time <= 0:
+                return False
+            stop_event.wait(min(remaining_time, 0.05))
+        return True
+
+    def close(self):
+        if self._root is not None:
+            self._root.destroy()
+        self._root = None
+        self._label = None
+        self._photo = None
+
+
+class SlideshowViewer:
+    def __init__(self,
+                 file_manager,
+                 screen=None,
+                 buffer_size=4,
+                 min_lookahead=1,
+                 prefetch_margin=1.5):
+        if not pillow_available():
+            raise ImportError('Pillow is required for the slideshow viewer')
+
+        self._file_manager = file_manager
+        self._screen = NullScreen() if screen is None else screen
+        self._buffer_size = max(buffer_size, 1)
+        self._min_lookahead = min(max(min_lookahead, 1), self._buffer_size)
+        self._prefetch_margin = prefetch_margin
+
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+        self._shown_event = threading.Event()
+        self._thread = None
+        self._decoder_thread = None
+        self._returncode = None
+        self._on_shown = None
+        self._on_exit = None
+        self._reset()
+
+    @property
+    def screen(self):
+        return self._screen
+
+    @property
+    def has_shown_image(self):
+        return self._shown_event.is_set()
+
+    @property
+    def decode_times(self):
+        return list(self._decode_times)
+
+    @property
+    def stall_times(self):
+        return list(self._stall_times)
+
+    def watch(self, on_shown=None, on_exit=None):
+        # Called from the slideshow thread when the first image of a run is
+        # up, and when a run ends without being stopped
+        self._on_shown = on_shown
+        self._on_exit = on_exit
+
+    def start(self):
+        self.stop()
+        self._reset()
+        self._delay = self._file_manager.settings.delay
+        metrics.increment('dpf_viewer_starts_total',
+                          description='Number of times the viewer started.',
+                          viewer='slideshow')
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop_requested = True
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+        self._thread.join()
+        self._thread = None
+        self._log_statistics()
+
+    def restart(self):
+        self.start()
+
+    def poll(self):
+        if self._thread is not None and self._thread.is_alive():
+            return None
+        return self._returncode
+
+    def _reset(self):
+        self._stop_requested = False
+        self._stop_event.clear()
+        self._shown_event.clear()
+        self._returncode = None
+        self._delay = None
+        self._screen_size = None
+
+        self._scheduled = {}
+        self._n_scheduled = 0
+        self._position = 0
+        self._next_decode_position = 0
+        self._buffer = collections.deque()
+        self._slide_start_time = None
+        self._bytes_per_second = None
+
+        self._decode_times = []
+        self._stall_times = []
+
+    def _run(self):
+        try:
+            self._screen.open()
+            self._screen_size = self._screen.size
+            self._decoder_thread = threading.Thread(target=self._decode_ahead,
+                                                    daemon=True)
+            self._decoder_thread.start()
+            while not self._stop_event.is_set():
+                decoded_image = self._next_image()
+                if decoded_image is None:
+                    break
+                if decoded_image.image is None:
+                    continue
+                self._screen.show(decoded_image)
+                if not self._shown_event.is_set():
+                    self._shown_event.set()
+                    if self._on_shown is not None:
+                        self._on_shown()
+                with self._condition:
+                    self._slide_start_time = time.monotonic()
+                    self._condition.notify_all()
+                if self._screen.wait(self._delay, self._stop_event):
+                    break
+            if self._returncode is None:
+                self._returncode = 0
+        except Exception as e:
+            log_error(f'Slideshow failed: {e}')
+            self._returncode = 1
+        finally:
+            self._stop_event.set()
+            with self._condition:
+                self._condition.notify_all()
+            if self._decoder_thread is not None:
+                self._decoder_thread.join()
+                self._decoder_thread = None
+            self._screen.close()
+            if self._on_exit is not None and not self._stop_requested:
+                self._on_exit(self._returncode)
+
+    def _next_image(self):
+        with self._condition:
+            wait_start_time = time.perf_counter()
+            while not self._buffer and not self._stop_event.is_set():
+                self._condition.wait(self._delay)
+            if self._stop_event.is_set():
+                return None
+            decoded_image = self._buffer.popleft()
+            stall_time = time.perf_counter() - wait_start_time
+            self._stall_times.append(stall_time)
+            metrics.observe('dpf_slideshow_stall_seconds',
+                            stall_time,
+                            description='Time slides waited for decoding.')
+            self._scheduled.pop(decoded_image.position, None)
+            self._position = decoded_image.position + 1
+            self._condition.notify_all()
+            return decoded_image
+
+    def _decode_ahead(self):
+        # The list is read and the files are stat'ed outside the condition,
+        # so that the slideshow thread is not held up by a slow disk
+        size_position, file_size = None, None
+        try:
+            while not self._stop_event.is_set():
+                with self._condition:
+                    position = self._next_decode_position
+                    filename = self._scheduled.get(position)
+                if filename is None:
+                    filenames = self._read_playlist()
+                    with self._condition:
+                        if not filenames:
+                            self._condition.wait(self._delay)
+                        self._schedule(filenames)
+                    continue
+                if size_position != position:
+                    size_position, file_size = position, self._file_size(
+                        filename)
+                with self._condition:
+                    waiting_time = self._time_until_decode(
+                        position, file_size)
+                    if waiting_time > 0:
+                        self._condition.wait(waiting_time)
+                        continue
+                    self._next_decode_position += 1
+
+                decoded_image = self._decode(position, filename, file_size)
+                with self._condition:
+                    self._buffer.append(decoded_image)
+                    self._condition.notify_all()
+        except Exception as e:
+            log_error(f'Slideshow decoding failed: {e}')
+            self._returncode = 1
+        finally:
+            self._stop_event.set()
+            with self._condition:
+                self._condition.notify_all()
+
+    def _time_until_decode(self, position, file_size):
+        if len(self._buffer) >= self._buffer_size:
+            return self._delay
+        n_ahead = position - self._position
+        if n_ahead < self._min_lookahead or file_size is None or self._bytes_per_second is None or self._slide_start_time is None:
+            return 0
+        # Beyond the minimum lookahead an image is decoded only when its
+        # expected decode time would otherwise run past the moment it is
+        # shown, so large files are prefetched earlier than small ones
+        show_time = self._slide_start_time + (n_ahead + 1) * self._delay
+        expected_decode_time = self._prefetch_margin * file_size / self._bytes_per_second
+        return show_time - expected_decode_time - time.monotonic()
+
+    def _decode(self, position, filename, file_size):
+        start_time = time.perf_counter()
+        try:
+            # Background scanning and extraction wait while a slide loads
+            with io_scheduling.gate.paused():
+                image = load_screen_image(filename, self._screen_size)
+        except Exception as e:
+            log_error(f'Could not decode {filename}: {e}')
+            return DecodedImage(position, filename, None, None)
+        decode_time = time.perf_counter() - start_time
+        metrics.observe('dpf_slideshow_decode_seconds',
+                        decode_time,
+                        description='Time spent decoding slides.')
+
+        with self._condition:
+            self._decode_times.append(decode_time)
+            if file_size is not None:
+                bytes_per_second = file_size / max(decode_time, 1e-6)
+                self._bytes_per_second = bytes_per_second if self._bytes_per_second is None else 0.8 * self._bytes_per_second + 0.2 * bytes_per_second
+        return DecodedImage(position, filename, image, decode_time)
+
+    def _schedule(self, filenames):
+        for filename in filenames:
+            self._scheduled[self._n_scheduled] = filename
+            self._n_scheduled += 1
+
+    @staticmethod
+    def _file_size(filename):
+        try:
+            return os.path.getsize(filename)
+        except OSError:
+            return None
+
+    def _read_playlist(self):
+        # Reading the list at the start of every pass picks up changes the
+        # same way as the reload option of feh
+        try:
+            with open(self._file_manager.file_list_path,
+                      encoding=FILENAME_ENCODING,
+                      errors=FILENAME_ERRORS) as f:
+                filenames = [line for line in f.read().split('\n') if line]
+        except (OSError, ValueError) as e:
+            log_error(f'Could not read file list: {e}')
+            return []
+        if self._file_manager.settings.randomize:
+            random.shuffle(filenames)
+        return filenames
+
+    def _log_statistics(self):
+        if not self._decode_times:
+            return
+        decode_times = sorted(self._decode_times)
+        n_stalls = sum(
+            1 for stall_time in self._stall_times[1:] if stall_time > 1e-3)
+        log_info(
+            f'Slideshow decoded {len(decode_times)} images in {1e3*sum(decode_times)/len(decode_times):.1f} ms on average '
+            f'({1e3*decode_times[int(0.95*(len(decode_times) - 1))]:.1f} ms 95th percentile, {1e3*decode_times[-1]:.1f} ms max), '
+            f'{n_stalls} slides waited for decoding.')
@@ -7,8 +7,7 @@ MODE = 'standby'
 
 def set_standby():
     config = control.get_config()
-    with control.get_database(config) as database:
-        control.update_mode_in_database(MODE, config, database)
+    control.report_mode(MODE, config, control.get_database(config))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,369 @@
+import signal
+import asyncio
+import functools
+import threading
+import digital_photo_frame as dpf
+from log import log_info, log_error
+import metrics
+
+VIEWER_FLAGS = ('delay', 'randomize', 'preload')
+SHUTDOWN_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+
+class DisplaySupervisor:
+    def __init__(self,
+                 settings,
+                 reload_interval=None,
+                 settings_poll_interval=None,
+                 watch_library=True,
+                 min_restart_delay=1.0,
+                 max_restart_delay=60.0,
+                 stable_run_time=60.0,
+                 create_viewer=None,
+                 create_watcher=None,
+                 on_started=None,
+                 on_ready=None,
+                 metrics_path=None,
+                 metrics_interval=15.0,
+                 **file_manager_kwargs):
+        self._settings = settings
+        self._reload_interval = reload_interval
+        self._settings_poll_interval = settings_poll_interval
+        self._watch_library = watch_library
+        self._min_restart_delay = min_restart_delay
+        self._max_restart_delay = max_restart_delay
+        self._stable_run_time = stable_run_time
+        self._create_viewer = create_viewer
+        self._create_watcher = create_watcher
+        self._on_started = on_started
+        self._on_ready = on_ready
+        self._metrics_path = metrics_path
+        self._metrics_interval = metrics_interval
+        self._file_manager_kwargs = file_manager_kwargs
+
+        self._file_manager = None
+        self._watcher = None
+        self._process = None
+        self._viewer = None
+        self._restart_requested = False
+        self._ready = False
+        self._stop_event = None
+        self._cancel_event = threading.Event()
+        self._received_signal = None
+        self._error = None
+
+    @property
+    def file_manager(self):
+        return self._file_manager
+
+    @property
+    def received_signal(self):
+        return self._received_signal
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        previous_handlers = {
+            signum: signal.getsignal(signum)
+            for signum in SHUTDOWN_SIGNALS
+        }
+        for signum in SHUTDOWN_SIGNALS:
+            loop.add_signal_handler(signum, self._handle_signal, signum)
+
+        tasks = []
+        try:
+            # Building the file list and starting the viewer can take a
+            # while on a cold start, so being up is reported first
+            if self._on_started is not None:
+                await self.run_in_executor(self._on_started)
+            self._file_manager = await self._unless_stopped(
+                self.run_in_thread(dpf.FileManager,
+                                   self._settings,
+                                   cancel_event=self._cancel_event,
+                                   **self._file_manager_kwargs))
+            if self._file_manager is None:
+                return
+
+            list_ready = asyncio.Event()
+            refresh_task = None
+            if self._file_manager.is_stale:
+                refresh_task = asyncio.create_task(
+                    self._refresh_file_list(list_ready))
+                refresh_task.add_done_callback(self._handle_task_done)
+                tasks.append(refresh_task)
+            if not self._file_manager.is_list_ready:
+                # A streamed list is first written when it has its first
+                # batch of files, so the viewer waits for that
+                await self._unless_stopped(list_ready.wait())
+            if not self._stop_event.is_set():
+                tasks.append(self._start_viewer())
+
+            if self._settings_poll_interval is not None:
+                tasks.append(asyncio.create_task(self._watch_settings()))
+            if self._metrics_path is not None:
+                tasks.append(asyncio.create_task(self._export_metrics()))
+            if self._watch_library:
+                if self._create_watcher is None:
+                    from watcher import LibraryWatcher
+                    self._watcher = LibraryWatcher(self._file_manager)
+                else:
+                    self._watcher = self._create_watcher(self._file_manager)
+                tasks.append(
+                    asyncio.create_task(self.run_in_thread(
+                        self._watcher.run)))
+            for task in tasks:
+                if task is not refresh_task:
+                    task.add_done_callback(self._handle_task_done)
+
+            await self._stop_event.wait()
+        finally:
+            self._cancel_event.set()
+            self._cancel_background_work()
+            if self._watcher is not None:
+                self._watcher.stop()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._stop_viewer()
+            if self._metrics_path is not None:
+                self._write_metrics()
+            for signum in SHUTDOWN_SIGNALS:
+                loop.remove_signal_handler(signum)
+                signal.signal(signum, previous_handlers[signum])
+
+        if self._error is not None:
+            raise self._error
+
+    def stop(self):
+        self._cancel_event.set()
+        self._stop_event.set()
+
+    def restart_viewer(self):
+        self._restart_requested = True
+        if self._viewer is not None:
+            self._viewer.restart()
+        if self._process is not None and self._process.returncode is None:
+            self._process.terminate()
+
+    async def run_in_executor(self, function, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(function, *args, **kwargs))
+
+    async def run_in_thread(self, function, *args, **kwargs):
+        # For scans, which can take minutes. Unlike the threads of the
+        # executor, a daemon thread is not waited for when shutting down.
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def resolve(result, exception):
+            if future.done():
+                return
+            if exception is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exception)
+
+        def run():
+            result, exception = None, None
+            try:
+                result = function(*args, **kwargs)
+            except Exception as e:
+                exception = e
+            try:
+                loop.call_soon_threadsafe(resolve, result, exception)
+            except RuntimeError:
+                # The loop was closed when the work was abandoned
+                pass
+
+        threading.Thread(target=run, daemon=True).start()
+        return await future
+
+    async def _unless_stopped(self, awaitable):
+        # Gives None as soon as the supervisor is stopped, without waiting
+        # for the awaitable to finish
+        task = asyncio.ensure_future(awaitable)
+        stop_waiter = asyncio.create_task(self._stop_event.wait())
+        await asyncio.wait([task, stop_waiter],
+                           return_when=asyncio.FIRST_COMPLETED)
+        stop_waiter.cancel()
+        if not self._stop_event.is_set():
+            return task.result()
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled():
+            # Retrieved so that a cancelled scan is not reported as an
+            # unhandled error
+            task.exception()
+        return None
+
+    def _cancel_background_work(self):
+        # Work that was queued for the abandoned scans is dropped rather
+        # than finished before exiting
+        io_scheduler = self._file_manager_kwargs.get('io_scheduler')
+        if io_scheduler is not None:
+            io_scheduler.close(wait=False)
+        for cache_name in ('render_cache', 'preview_cache'):
+            cache = self._file_manager_kwargs.get(cache_name)
+            if cache is not None:
+                cache.close()
+
+    def _handle_task_done(self, task):
+        if task.cancelled():
+            return
+        exception = task.exception()
+        # Scans are cancelled when stopping, which is no error
+        if exception is not None and not isinstance(exception,
+                                                    dpf.ScanCancelled):
+            self._error = exception
+            self.stop()
+
+    def _handle_signal(self, signum):
+        self._received_signal = signum
+        self.stop()
+
+    def _feh_arguments(self):
+        return self.file_manager.feh_arguments + dpf.feh_reload_arguments(
+            self._reload_interval)
+
+    async def _supervise_viewer(self):
+        loop = asyncio.get_running_loop()
+        restart_delay = self._min_restart_delay
+        while True:
+            self._restart_requested = False
+            start_time = loop.time()
+            metrics.increment(
+                'dpf_viewer_starts_total',
+                description='Number of times the viewer started.',
+                viewer='feh')
+            with metrics.timer('dpf_viewer_start_seconds',
+                               description='Time spent launching the viewer.',
+                               viewer='feh'):
+                self._process = await asyncio.create_subprocess_exec(
+                    'feh', *self._feh_arguments())
+            await self._report_ready()
+            returncode = await self._process.wait()
+
+            if self._restart_requested:
+                continue
+            if returncode == 0:
+                log_info('feh exited normally.')
+                self.stop()
+                return
+
+            if loop.time() - start_time > self._stable_run_time:
+                restart_delay = self._min_restart_delay
+            log_error(
+                f'feh exited with error code {returncode}, restarting in {restart_delay:g} s.'
+            )
+            await asyncio.sleep(restart_delay)
+            restart_delay = min(2 * restart_delay, self._max_restart_delay)
+
+    async def _supervise_in_process_viewer(self):
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        self._viewer.watch(
+            on_shown=lambda: loop.call_soon_threadsafe(
+                events.put_nowait, ('shown', None)),
+            on_exit=lambda returncode: loop.call_soon_threadsafe(
+                events.put_nowait, ('exit', returncode)))
+        restart_delay = self._min_restart_delay
+        self._viewer.start()
+        start_time = loop.time()
+        while True:
+            event, returncode = await events.get()
+            if event == 'shown':
+                await self._report_ready()
+                continue
+            if returncode == 0:
+                log_info('Viewer exited normally.')
+                self.stop()
+                return
+
+            if loop.time() - start_time > self._stable_run_time:
+                restart_delay = self._min_restart_delay
+            log_error(
+                f'Viewer exited with error code {returncode}, restarting in {restart_delay:g} s.'
+            )
+            await asyncio.sleep(restart_delay)
+            restart_delay = min(2 * restart_delay, self._max_restart_delay)
+            self._viewer.start()
+            start_time = loop.time()
+
+    def _start_viewer(self):
+        if self._create_viewer is None:
+            return asyncio.create_task(self._supervise_viewer())
+        self._viewer = self._create_viewer(self._file_manager)
+        return asyncio.create_task(self._supervise_in_process_viewer())
+
+    async def _report_ready(self):
+        if self._ready:
+            return
+        self._ready = True
+        if self._on_ready is not None:
+            await self.run_in_executor(self._on_ready)
+
+    async def _stop_viewer(self):
+        if self._viewer is not None:
+            await self.run_in_executor(self._viewer.stop)
+        if self._process is not None and self._process.returncode is None:
+            self._process.terminate()
+            await self._process.wait()
+        self._process = None
+
+    async def _refresh_file_list(self, list_ready):
+        loop = asyncio.get_running_loop()
+        try:
+            with metrics.timer(
+                    'dpf_file_list_refresh_seconds',
+                    description='Time spent refreshing a stale list.'):
+                changed = await self.run_in_thread(
+                    self.file_manager.refresh_if_stale,
+                    lambda: loop.call_soon_threadsafe(list_ready.set))
+        finally:
+            list_ready.set()
+        log_info(
+            f'Refreshed the file list, {"changed" if changed else "unchanged"}.'
+        )
+        # Without a reload interval the viewer would keep showing the stale
+        # list until it is restarted
+        if changed and self._reload_interval is None:
+            self.restart_viewer()
+
+    async def _export_metrics(self):
+        while True:
+            await self.run_in_executor(self._write_metrics)
+            await asyncio.sleep(self._metrics_interval)
+
+    def _write_metrics(self):
+        try:
+            metrics.registry.write(self._metrics_path)
+        except OSError as e:
+            log_error(f'Could not write metrics: {e}')
+
+    async def _watch_settings(self):
+        try:
+            version = await self.run_in_executor(self._settings.read_version)
+        except Exception as e:
+            log_error(
+                f'Could not read settings version, live reload disabled: {e}')
+            return
+
+        while True:
+            await asyncio.sleep(self._settings_poll_interval)
+            try:
+                new_version = await self.run_in_executor(
+                    self._settings.read_version)
+            except Exception as e:
+                log_error(f'Could not read settings version: {e}')
+                continue
+            if new_version == version:
+                continue
+            version = new_version
+
+            changed_flags = await self.run_in_thread(
+                self.file_manager.reread_settings)
+            log_info(
+                f'Reloaded settings, changed: {", ".join(sorted(changed_flags)) or "none"}.'
+            )
+            if changed_flags.intersection(VIEWER_FLAGS):
+                self.restart_viewer()
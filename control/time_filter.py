@@ -0,0 +1,214 @@
+import bisect
+import datetime
+
+SECONDS_PER_DAY = 86400
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+MIN_KEY = -(1 << 62)
+MAX_KEY = 1 << 62
+
+MIN_YEAR = datetime.MINYEAR
+MAX_YEAR = datetime.MAXYEAR
+
+
+def ordinal_key(ordinal):
+    return (ordinal - EPOCH_ORDINAL) * SECONDS_PER_DAY
+
+
+def datetime_key(date):
+    return ordinal_key(date.toordinal()) + date.hour * 3600 + date.minute * 60 + date.second
+
+
+def day_string_key(day_string):
+    return ordinal_key(
+        datetime.date(int(day_string[0:4]), int(day_string[5:7]),
+                      int(day_string[8:10])).toordinal())
+
+
+def time_string_key(time_string):
+    return day_string_key(time_string) + int(time_string[11:13]) * 3600 + int(
+        time_string[14:16]) * 60 + int(time_string[17:19])
+
+
+def day_keys(time_strings):
+    # All filter boundaries fall on midnight, so the index only needs the key
+    # of the day each file belongs to, which is shared by many files
+    keys_by_day = {}
+    keys = []
+    for time_string in time_strings:
+        day_string = time_string[:10]
+        key = keys_by_day.get(day_string)
+        if key is None:
+            key = keys_by_day[day_string] = day_string_key(day_string)
+        keys.append(key)
+    return keys
+
+
+def key_date(key):
+    return datetime.date.fromordinal(key // SECONDS_PER_DAY + EPOCH_ORDINAL)
+
+
+def first_key_from(year, month=1, day=1):
+    # Key of the first day that is not lexicographically before (year, month,
+    # day), which handles out-of-range months and days like 31.02
+    if month < 1:
+        month, day = 1, 1
+    elif month > 12:
+        year, month, day = year + 1, 1, 1
+    if day < 1:
+        day = 1
+    elif day > days_in_month(year, month):
+        year, month, day = (year + 1, 1, 1) if month == 12 else (year,
+                                                                  month + 1, 1)
+    year = min(max(year, MIN_YEAR), MAX_YEAR + 1)
+    if year > MAX_YEAR:
+        return MAX_KEY
+    return ordinal_key(datetime.date(year, month, day).toordinal())
+
+
+def days_in_month(year, month):
+    if month == 12:
+        return 31
+    return (datetime.date(year, month + 1, 1) - datetime.date(year, month, 1)).days
+
+
+def start_key(time):
+    if time.year is None:
+        return MIN_KEY
+    elif time.month is None:
+        return first_key_from(time.year)
+    elif time.day is None:
+        return first_key_from(time.year, time.month)
+    else:
+        return first_key_from(time.year, time.month, time.day)
+
+
+def end_key(time):
+    if time.year is None:
+        return MAX_KEY
+    elif time.month is None:
+        return first_key_from(time.year + 1)
+    elif time.day is None:
+        return first_key_from(time.year, time.month + 1)
+    else:
+        return first_key_from(time.year, time.month, time.day + 1)
+
+
+def merge_intervals(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if start >= end:
+            continue
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class CompiledTimeFilter:
+    def __init__(self, intervals, matchers):
+        self._intervals = merge_intervals(intervals)
+        self._interval_starts = [start for start, _ in self._intervals]
+        self._matchers = list(dict.fromkeys(matchers))
+
+    @staticmethod
+    def from_times(times):
+        intervals = []
+        matchers = []
+        for time in times:
+            if hasattr(time, 'start_time'):
+                intervals.append(
+                    (start_key(time.start_time), end_key(time.end_time)))
+            elif time.year is not None and (time.month is not None
+                                            or time.day is None):
+                if time.month is not None and not 1 <= time.month <= 12:
+                    continue
+                intervals.append((start_key(time), end_key(time)))
+            elif time.year is None and time.month is None and time.day is None:
+                intervals.append((MIN_KEY, MAX_KEY))
+            else:
+                matchers.append((time.year, time.month, time.day))
+        return CompiledTimeFilter(intervals, matchers)
+
+    @property
+    def intervals(self):
+        return self._intervals
+
+    @property
+    def matchers(self):
+        return self._matchers
+
+    def includes_key(self, key):
+        i = bisect.bisect_right(self._interval_starts, key) - 1
+        if i >= 0 and key < self._intervals[i][1]:
+            return True
+        if self._matchers:
+            date = key_date(key)
+            return any(
+                self._matcher_includes(matcher, date)
+                for matcher in self._matchers)
+        return False
+
+    def includes(self, date):
+        return self.includes_key(datetime_key(date))
+
+    def intervals_for_years(self, min_year, max_year):
+        if not self._matchers:
+            return self._intervals
+        intervals = list(self._intervals)
+        for year, month, day in self._matchers:
+            years = [year] if year is not None else range(min_year, max_year + 1)
+            months = [month] if month is not None else range(1, 13)
+            for matched_year in years:
+                for matched_month in months:
+                    if not 1 <= matched_month <= 12:
+                        continue
+                    if day is None:
+                        intervals.append(
+                            (first_key_from(matched_year, matched_month),
+                             first_key_from(matched_year, matched_month + 1)))
+                    elif 1 <= day <= days_in_month(matched_year,
+                                                   matched_month):
+                        start = first_key_from(matched_year, matched_month,
+                                               day)
+                        intervals.append((start, start + SECONDS_PER_DAY))
+        return merge_intervals(intervals)
+
+    @staticmethod
+    def _matcher_includes(matcher, date):
+        year, month, day = matcher
+        return (year is None or date.year == year) and (
+            month is None or date.month == month) and (day is None
+                                                       or date.day == day)
+
+
+class TimeIndex:
+    def __init__(self, file_times):
+        self._filenames = list(file_times)
+        keys = day_keys(file_times.values())
+        self._sorted_positions = sorted(range(len(keys)), key=keys.__getitem__)
+        self._sorted_keys = [keys[i] for i in self._sorted_positions]
+
+    def __len__(self):
+        return len(self._filenames)
+
+    @property
+    def year_range(self):
+        if not self._sorted_keys:
+            return None
+        return key_date(self._sorted_keys[0]).year, key_date(
+            self._sorted_keys[-1]).year
+
+    def select(self, compiled_filter):
+        if not self._sorted_keys:
+            return []
+        intervals = compiled_filter.intervals_for_years(*self.year_range)
+        positions = []
+        for start, end in intervals:
+            first = bisect.bisect_left(self._sorted_keys, start)
+            last = bisect.bisect_left(self._sorted_keys, end, lo=first)
+            positions.extend(self._sorted_positions[first:last])
+        positions.sort()
+        return [self._filenames[i] for i in positions]
@@ -0,0 +1,175 @@
+import re
+from time_filter import CompiledTimeFilter
+from log import log_error
+
+TIME_STRING_RE = re.compile(
+    r'any|(?:\d\d?[\./])?(?:\d\d?[\./])?\d{4}(?:\s*-\s*(?:\d\d?[\./])?(?:\d\d?[\./])?\d{4})?',
+    flags=re.IGNORECASE)
+
+
+class Time:
+    def __init__(self, day, month, year):
+        self.day = day
+        self.month = month
+        self.year = year
+
+    @staticmethod
+    def any():
+        return Time(None, None, None)
+
+    @staticmethod
+    def from_string(time_string):
+        if time_string == 'any':
+            return Time.any()
+        parts = re.split(r'\.|\/', time_string)
+        if len(parts) == 1:
+            return Time(None, None, int(parts[0]))
+        elif len(parts) == 2:
+            return Time(None, int(parts[0]), int(parts[1]))
+        elif len(parts) == 3:
+            return Time(int(parts[0]), int(parts[1]), int(parts[2]))
+        else:
+            log_error(f'Invalid format for time string {time_string}.',
+                      abort=True)
+
+    def includes(self, date):
+        return (self.year is None or date.year == self.year) and (
+            self.month is None or date.month
+            == self.month) and (self.day is None or date.day == self.day)
+
+    def __eq__(self, other):
+        return isinstance(
+            other, self.__class__
+        ) and other.year == self.year and other.month == self.month and other.day == self.day
+
+    def __ne__(self, other):
+        return not isinstance(
+            other, self.__class__
+        ) or other.year != self.year or other.month != self.month or other.day != self.day
+
+    def __le__(self, other):
+        if self.year is None or other.year is None or self.year < other.year:
+            return True
+        elif self.year == other.year:
+            if self.month is None or other.month is None or self.month < other.month:
+                return True
+            elif self.month == other.month:
+                if self.day is None or other.day is None or self.day <= other.day:
+                    return True
+                else:
+                    return False
+            else:
+                return False
+        else:
+            return False
+
+    def __ge__(self, other):
+        if self.year is None or other.year is None or self.year > other.year:
+            return True
+        elif self.year == other.year:
+            if self.month is None or other.month is None or self.month > other.month:
+                return True
+            elif self.month == other.month:
+                if self.day is None or other.day is None or self.day >= other.day:
+                    return True
+                else:
+                    return False
+            else:
+                return False
+        else:
+            return False
+
+    def __repr__(self):
+        return '{}{}{}'.format(
+            '' if self.day is None else f'{self.day:02d}.',
+            '' if self.month is None else f'{self.month:02d}.',
+            'any' if self.year is None else f'{self.year:d}')
+
+
+class TimePeriod:
+    def __init__(self, start_time, end_time):
+        self.start_time = start_time
+        self.end_time = end_time
+
+    @staticmethod
+    def string_is_valid(string):
+        return len(string.split('-')) == 2
+
+    @staticmethod
+    def from_string(time_period_string):
+        start_time_string, end_time_string = tuple(
+            map(str.strip, time_period_string.split('-')))
+        return TimePeriod(Time.from_string(start_time_string),
+                          Time.from_string(end_time_string))
+
+    @staticmethod
+    def from_strings(start_time_string, end_time_string):
+        return TimePeriod(Time.from_string(start_time_string),
+                          Time.from_string(end_time_string))
+
+    def includes(self, date):
+        return self.start_time <= date and self.end_time >= date
+
+    def __eq__(self, other):
+        return isinstance(
+            other, self.__class__
+        ) and other.start_time == self.start_time and other.end_time == self.end_time
+
+    def __ne__(self, other):
+        return not isinstance(
+            other, self.__class__
+        ) or other.start_time != self.start_time or other.end_time != self.end_time
+
+    def __repr__(self):
+        return f'{self.start_time} - {self.end_time}'
+
+
+class TimePeriods:
+    def __init__(self, *time_strings):
+        if 'any' in time_strings:
+            self.times = [Time.any()]
+        else:
+            self.times = list(
+                map(
+                    lambda time_string: TimePeriod.from_string(time_string)
+                    if TimePeriod.string_is_valid(time_string) else Time.
+                    from_string(time_string), time_strings))
+        self._compiled_filter = None
+
+    @staticmethod
+    def any():
+        return TimePeriods('any')
+
+    def is_any(self):
+        return self == ANY_TIME_PERIOD
+
+    def compile(self):
+        if self._compiled_filter is None:
+            self._compiled_filter = CompiledTimeFilter.from_times(self.times)
+        return self._compiled_filter
+
+    def includes(self, date):
+        return self.compile().includes(date)
+
+    def __eq__(self, other):
+        return isinstance(other, self.__class__) and len(other.times) == len(
+            self.times) and all(
+                (a == b for a, b in zip(self.times, other.times)))
+
+    def __ne__(self, other):
+        return not isinstance(other, self.__class__) or len(
+            other.times) != len(self.times) or any(
+                (a != b for a, b in zip(self.times, other.times)))
+
+    def __repr__(self):
+        return ", ".join(map(str, self.times))
+
+
+ANY_TIME_PERIOD = TimePeriods.any()
+
+
+def parse_time_strings(time_strings):
+    for time_string in time_strings:
+        if not TIME_STRING_RE.fullmatch(time_string.strip()):
+            raise ValueError(f'Invalid time string {time_string}')
+    return TimePeriods(*map(str.strip, time_strings))
@@ -0,0 +1,139 @@
+import os
+import time
+import threading
+from inotify.adapters import Inotify
+from inotify.calls import InotifyError
+from inotify.constants import IN_CREATE, IN_MODIFY, IN_CLOSE_WRITE, IN_DELETE, IN_MOVED_FROM, IN_MOVED_TO, IN_DELETE_SELF, IN_MOVE_SELF
+from log import log_info, log_error
+
+WATCH_MASK = IN_CREATE | IN_MODIFY | IN_CLOSE_WRITE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+
+CHANGE_EVENTS = ('IN_CREATE', 'IN_MODIFY', 'IN_CLOSE_WRITE', 'IN_MOVED_TO')
+REMOVAL_EVENTS = ('IN_DELETE', 'IN_MOVED_FROM')
+FOLDER_EVENTS = ('IN_DELETE_SELF', 'IN_MOVE_SELF')
+
+
+class LibraryWatcher:
+    def __init__(self,
+                 file_manager,
+                 debounce_time=2.0,
+                 max_delay=30.0,
+                 on_update=None):
+        self._file_manager = file_manager
+        self._debounce_time = debounce_time
+        self._max_delay = max_delay
+        self._on_update = on_update
+
+        self._notifier = None
+        self._watched_folders = []
+
+        self._changed_paths = set()
+        self._removed_paths = set()
+        self._rescan_required = False
+        self._first_event_time = None
+        self._last_event_time = None
+
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def file_manager(self):
+        return self._file_manager
+
+    @property
+    def has_pending_changes(self):
+        return self._first_event_time is not None
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run(self):
+        self._notifier = Inotify(block_duration_s=min(self._debounce_time,
+                                                      1.0))
+        self._update_watches()
+        for event in self._notifier.event_gen(yield_nones=True):
+            if self._stop_event.is_set():
+                break
+            if event is not None:
+                self._register_event(*event)
+            self._update_watches()
+            if self._should_flush():
+                self._flush()
+        self._remove_watches()
+
+    def _update_watches(self):
+        folders = list(map(str, self.file_manager.settings.folders or []))
+        if folders == self._watched_folders:
+            return
+        self._remove_watches()
+        for folder in folders:
+            try:
+                self._notifier.add_watch(folder, mask=WATCH_MASK)
+            except InotifyError as e:
+                log_error(f'Could not watch folder {folder}: {e}')
+        self._watched_folders = folders
+        log_info(f'Watching {len(folders)} folders for changes.')
+
+    def _remove_watches(self):
+        for folder in self._watched_folders:
+            try:
+                self._notifier.remove_watch(folder)
+            except InotifyError:
+                pass
+        self._watched_folders = []
+
+    def _register_event(self, header, type_names, path, filename):
+        if any(type_name in FOLDER_EVENTS for type_name in type_names):
+            self._rescan_required = True
+        elif filename and 'IN_ISDIR' not in type_names:
+            full_path = os.path.join(path, filename)
+            if any(type_name in REMOVAL_EVENTS for type_name in type_names):
+                self._changed_paths.discard(full_path)
+                self._removed_paths.add(full_path)
+            elif any(type_name in CHANGE_EVENTS for type_name in type_names):
+                self._removed_paths.discard(full_path)
+                self._changed_paths.add(full_path)
+            else:
+                return
+        else:
+            return
+
+        now = time.monotonic()
+        if self._first_event_time is None:
+            self._first_event_time = now
+        self._last_event_time = now
+
+    def _should_flush(self):
+        if not self.has_pending_changes:
+            return False
+        now = time.monotonic()
+        return now - self._last_event_time >= self._debounce_time or now - self._first_event_time >= self._max_delay
+
+    def _flush(self):
+        changed_paths = self._changed_paths
+        removed_paths = self._removed_paths
+        rescan_required = self._rescan_required
+
+        self._changed_paths = set()
+        self._removed_paths = set()
+        self._rescan_required = False
+        self._first_event_time = None
+        self._last_event_time = None
+
+        if rescan_required:
+            self._remove_watches()
+            self.file_manager.rescan()
+            self._update_watches()
+        else:
+            self.file_manager.apply_file_changes(changed_paths, removed_paths)
+
+        if self._on_update is not None:
+            self._on_update()
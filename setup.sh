@@ -21,6 +21,7 @@ DPF_SITE_DIR=/var/www/digital_photo_frame
 DPF_LINKED_SITE_DIR=$DPF_DIR/site/public
 DPF_MODE_LOCK_DIR=$DPF_DIR/control/.lock
 DPF_MODE_LOCK_FILE=$DPF_MODE_LOCK_DIR/free
+DPF_CONTROL_SOCKET=$DPF_MODE_LOCK_DIR/control.sock
 
 INSTALL_PACKAGES=true
 if [[ "$INSTALL_PACKAGES" = true ]]; then
@@ -49,6 +50,7 @@ if [[ "$SETUP_ENV" = true ]]; then
     echo "export DPF_DIR=$DPF_DIR" >> $DPF_ENV_EXPORTS_PATH
     echo "export DPF_SERVER_LOG_PATH=$DPF_SERVER_LOG_PATH" >> $DPF_ENV_EXPORTS_PATH
     echo "export DPF_MODE_LOCK_FILE=$DPF_MODE_LOCK_FILE" >> $DPF_ENV_EXPORTS_PATH
+    echo "export DPF_CONTROL_SOCKET=$DPF_CONTROL_SOCKET" >> $DPF_ENV_EXPORTS_PATH
     echo "export PYTHONPATH=$(sudo -u admin python3 -m site --user-site)" >> $DPF_ENV_EXPORTS_PATH
 
     # Copy environment variables (without 'export') into environment file for services and PHP
@@ -116,6 +118,32 @@ WantedBy=multi-user.target" > $LINKED_UNIT_DIR/$STARTUP_SERVICE_FILENAME
 
     sudo systemctl enable $STARTUP_SERVICE_FILENAME
 
+    CONTROL_SERVICE_FILENAME=dpf_control.service
+    echo "[Unit]
+Description=Digital photo frame control daemon
+After=mysqld.service
+Before=$STARTUP_SERVICE_FILENAME
+
+[Service]
+Type=simple
+User=$DPF_SERVER_USER
+Group=$DPF_WEB_GROUP
+EnvironmentFile=$DPF_ENV_PATH
+ExecStart=$DPF_DIR/control/control.py
+Restart=on-failure
+StandardError=append:$DPF_SERVER_LOG_PATH
+
+[Install]
+WantedBy=multi-user.target" > $LINKED_UNIT_DIR/$CONTROL_SERVICE_FILENAME
+
+    sudo ln -sfn {$LINKED_UNIT_DIR,$UNIT_DIR}/$CONTROL_SERVICE_FILENAME
+
+    sudo systemctl enable $CONTROL_SERVICE_FILENAME
+
+    # The daemon starts and stops the mode services through the sudo rule
+    # for the web group below
+    sudo usermod -a -G $DPF_WEB_GROUP $DPF_SERVER_USER
+
     CMD_ALIAS='Cmnd_Alias DPF_MODES ='
 
     for SERVICE in standby display
@@ -137,6 +165,25 @@ StandardError=append:$DPF_SERVER_LOG_PATH" > $LINKED_UNIT_DIR/$SERVICE_FILENAME
         CMD_ALIAS+=" $SYSTEMCTL stop $SERVICE_ROOT_NAME, $SYSTEMCTL start $SERVICE_ROOT_NAME, $SYSTEMCTL restart $SERVICE_ROOT_NAME,"
     done
 
+    # Shared catalog for frames using the same library, only enabled manually
+    # on the frame that should own it
+    CATALOG_SERVICE_FILENAME=dpf_catalog.service
+    echo "[Unit]
+Description=Digital photo frame catalog service
+
+[Service]
+Type=simple
+User=$DPF_SERVER_USER
+Group=$DPF_WEB_GROUP
+EnvironmentFile=$DPF_ENV_PATH
+ExecStart=$DPF_DIR/control/catalog_service.py
+StandardError=append:$DPF_SERVER_LOG_PATH
+
+[Install]
+WantedBy=multi-user.target" > $LINKED_UNIT_DIR/$CATALOG_SERVICE_FILENAME
+
+    sudo ln -sfn {$LINKED_UNIT_DIR,$UNIT_DIR}/$CATALOG_SERVICE_FILENAME
+
     # Allow users in web group to manage the mode services without providing a password
     echo -e "${CMD_ALIAS%,}\n%$DPF_WEB_GROUP ALL = NOPASSWD: DPF_MODES" | (sudo su -c "EDITOR=\"tee\" visudo -f /etc/sudoers.d/$DPF_WEB_GROUP")
 fi
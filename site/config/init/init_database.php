@@ -44,12 +44,15 @@ echo "Storing password hash in database $db_name\n";
 createPasswordTableIfMissing($database, strlen($hashed_password));
 storeHashedPassword($database, $hashed_password);
 
-foreach (array('modes', 'display_settings') as $table_name) {
+foreach (array('modes', 'settings_versions', 'display_settings') as $table_name) {
   echo "Creating table $table_name in database $db_name\n";
   createTableIfMissing($database, $table_name, readTableColumnsFromConfig($table_name));
   echo "Writing initial values to table $table_name in database $db_name\n";
   insertValuesIntoTable($database, $table_name, readTableInitialValuesFromConfig($table_name));
 }
 
+echo "Creating settings version trigger in database $db_name\n";
+createCounterTriggerIfMissing($database, 'display_settings', 'settings_versions', 'display', $database_info['key']['value']);
+
 echo "Closing connection to database $db_name\n";
 closeConnection($database);
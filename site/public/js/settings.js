@@ -1,5 +1,5 @@
 $(function () {
-    if (SETTINGS_EDITED && INITIAL_MODE == SITE_MODE) {
+    if (SETTINGS_EDITED && INITIAL_MODE == SITE_MODE && !LIVE_RELOAD) {
         requestModeRestart();
     }
 });
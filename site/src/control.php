@@ -119,7 +119,45 @@ function waitForFileUpdate($file_path, $interval, $timeout) {
   return ACTION_OK;
 }
 
+function requestFromControlDaemon($request) {
+  $socket_path = getenv('DPF_CONTROL_SOCKET');
+  if (!$socket_path || !file_exists($socket_path)) {
+    return null;
+  }
+  $socket = @stream_socket_client("unix://$socket_path", $error_code, $error_message, MODE_SWITCH_TIMEOUT / 1e6);
+  if ($socket === false) {
+    dpf_warning("Could not connect to control daemon: $error_message");
+    return null;
+  }
+  // The daemon answers once the new mode is running. It runs the stop and
+  // start commands and waits for the new mode to report, each for up to the
+  // timeout, see ModeDaemon.switch.
+  stream_set_timeout($socket, intval(3 * MODE_SWITCH_TIMEOUT / 1e6) + 1);
+  fwrite($socket, json_encode($request) . "\n");
+  $line = fgets($socket);
+  fclose($socket);
+  if ($line === false) {
+    dpf_error('No response from control daemon');
+  }
+  return parseJSON($line);
+}
+
+function switchModeWithDaemon($new_mode, $skip_if_same) {
+  $response = requestFromControlDaemon(array('operation' => 'switch', 'mode' => MODE_NAMES[$new_mode], 'skip_if_same' => $skip_if_same));
+  if (is_null($response)) {
+    return null;
+  }
+  if ($response['status'] != 'ok') {
+    dpf_error('Request for mode switch failed: ' . $response['message']);
+  }
+  return ACTION_OK;
+}
+
 function switchMode($database, $new_mode, $skip_if_same = true) {
+  $result = switchModeWithDaemon($new_mode, $skip_if_same);
+  if (!is_null($result)) {
+    return $result;
+  }
   $current_mode = readCurrentMode($database);
   if ($current_mode == $new_mode && ($skip_if_same || $current_mode == MODE_VALUES['standby'])) {
     return ACTION_OK;
@@ -79,6 +79,14 @@ function createTableIfMissing($database, $table_name, $columns) {
   }
 }
 
+function createCounterTriggerIfMissing($database, $table_name, $counter_table_name, $counter_column, $key_value) {
+  $trigger_name = "{$table_name}_{$counter_table_name}";
+  $create_trigger = "CREATE TRIGGER IF NOT EXISTS `$trigger_name` AFTER UPDATE ON `$table_name` FOR EACH ROW UPDATE `$counter_table_name` SET `$counter_column` = `$counter_column` + 1 WHERE id = $key_value;";
+  if (!$database->query($create_trigger)) {
+    dpf_error("Could not create trigger $trigger_name: " . $database->error);
+  }
+}
+
 function insertValuesIntoTable($database, $table_name, $column_values) {
   $names = '';
   $values = '';